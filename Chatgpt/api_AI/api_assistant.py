@@ -1,98 +1,208 @@
-from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import JSONResponse
-from docx import Document
-import pandas as pd
-import PyPDF2
-import openai
-import fitz  # PyMuPDF
-import easyocr
+import time
+
+# Début du chargement de l'API : la durée des imports figure dans le rapport de démarrage (/stats)
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from contextlib import asynccontextmanager
+import json
+import os
 from pathlib import Path
-import tempfile
-import tiktoken
+import sys
+from urllib.parse import quote
 import uvicorn
 
-app = FastAPI()
-
-# Variable globale pour la base de connaissances
-knowledge_base = ""
-
-# Fonction pour charger une base de connaissances depuis différents fichiers
-def load_knowledge_base_from_directory(directory_path):
-    content = []
-    directory = Path(directory_path)
-    for file_path in directory.iterdir():
-        if file_path.suffix == ".docx":
-            content.append(load_text_from_word(file_path))
-        elif file_path.suffix == ".pdf":
-            content.append(load_text_from_pdf(file_path))
-        elif file_path.suffix == ".xlsx":
-            content.append(load_text_from_excel(file_path))
-    return "\n".join(content)
-
-# Charger le contenu d'un fichier Word
-def load_text_from_word(file_path):
-    try:
-        doc = Document(file_path)
-        return "\n".join([paragraph.text.strip() for paragraph in doc.paragraphs if paragraph.text.strip()])
-    except Exception as e:
-        return f"Erreur lors de la lecture du fichier Word : {e}"
+# Rendre le paquet commun importable depuis ce dossier
+sys.path.append(str(Path(__file__).resolve().parent.parent))
 
-# Charger le contenu d'un fichier PDF
-def load_text_from_pdf(file_path):
-    try:
-        pdf_reader = PyPDF2.PdfReader(file_path)
-        return "\n".join([page.extract_text() for page in pdf_reader.pages if page.extract_text()])
-    except Exception as e:
-        return f"Erreur lors de la lecture du fichier PDF : {e}"
+from commun.answer_cache import AnswerCache
+from commun.catalogue import DocumentCatalogue, etag_matches
+from commun.config import INDEX_STORE, INDEX_STORE_DIRECTORY, UPLOAD_MAX_BYTES
+from commun.document_cache import get_document_cache
+from commun.extraction_jobs import (
+    DONE, FAILED, DocumentNotFoundError, DocumentNotReadyError, ExtractionFailedError, ExtractionQueue, QueueFullError,
+)
+from commun.index_store import save_index
+from commun.knowledge_base import KnowledgeBase
+from commun.llm_client import CircuitOpenError, get_llm_client, is_retryable
+from commun.metrics import MetricsRegistry, RequestTrace, get_logger, new_request_id, request_id_var
+from commun.prompt import PrefixTracker, build_prompt
+from commun.sessions import create_session_store
+from commun.tokens import count_text_tokens, measure_token_counting, token_count_stats
+from commun.uploads import UploadTooLargeError, save_upload
+from commun.warmup import start_warm_up, warmup_report
+
+# Durée des imports de l'API, sans les dépendances lourdes chargées au premier besoin (commun.lazy_imports)
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+
+# Journal de l'API : chaque ligne porte l'identifiant de la requête (en-tête X-Request-ID)
+logger = get_logger()
+
+# Métriques exportées sur /metrics
+metrics = MetricsRegistry()
+REQUESTS = metrics.counter("assistant_requests_total", "Requêtes HTTP traitées, par endpoint et code de réponse")
+STAGE_SECONDS = metrics.histogram("assistant_stage_seconds", "Durée des étapes du traitement, en secondes")
+TOKENS = metrics.counter("assistant_tokens_total",
+                         "Tokens envoyés au modèle (in), dont début de prompt identique à l'appel précédent "
+                         "de la session (shared_prefix), et reçus du modèle (out)")
+ANSWER_CACHE_RESULTS = metrics.counter("assistant_answer_cache_total", "Consultations du cache des réponses, par résultat")
+ERRORS = metrics.counter("assistant_errors_total", "Erreurs, par étape et par type")
+
+# Base de connaissances et son index de recherche, rechargeables à chaud
+knowledge_base = KnowledgeBase(Path("./contexte"))
+
+# Historique des conversations, par identifiant de session (champ id des requêtes)
+session_store = create_session_store()
+
+# Réponses déjà données aux questions posées sans historique ni PDF, par version de la base
+answer_cache = AnswerCache()
+
+# Documents à télécharger (devis...) du dossier ASSISTANT_CATALOGUE_DIRECTORY, gardés en mémoire
+catalogue = DocumentCatalogue()
+
+# Mesures de chaque extraction de PDF, qu'elle vienne de /documents ou d'un PDF joint à une question
+def observe_extraction(job):
+    STAGE_SECONDS.observe(job.extraction_seconds, endpoint="extraction", stage="pdf_extraction")
+    if job.ocr_seconds:
+        STAGE_SECONDS.observe(job.ocr_seconds, endpoint="extraction", stage="ocr")
+    if job.status == FAILED:
+        ERRORS.inc(stage="pdf_extraction", type="ExtractionFailedError")
+    logger.info("Extraction du document %s : %s en %.2f s (OCR %.2f s)",
+                job.id[:12], job.status, job.extraction_seconds, job.ocr_seconds)
+
+# Extraction en arrière-plan des PDF complémentaires (endpoint /documents)
+extraction_queue = ExtractionQueue(on_finished=observe_extraction)
+
+# Code HTTP renvoyé pour chaque erreur de la file d'extraction
+EXTRACTION_ERROR_STATUS = {
+    QueueFullError: 503,
+    UploadTooLargeError: 413,
+    DocumentNotFoundError: 404,
+    DocumentNotReadyError: 409,
+    ExtractionFailedError: 422,
+}
+
+# Client du modèle : pool de connexions, limite de débit, nouvelles tentatives et disjoncteur
+llm_client = get_llm_client()
 
-# Charger le contenu d'un fichier Excel
-def load_text_from_excel(file_path):
+# Clé API OpenAI (variable d'environnement OPENAI_API_KEY, sinon la valeur ci-dessous)
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", 'clé_api')
+
+# Préfixe des messages d'erreur renvoyés quand l'appel au modèle échoue
+OPENAI_ERROR_PREFIX = "Erreur lors de la requête OpenAI"
+
+# Compteurs tenus par les caches et le client du modèle, lus au moment de l'export
+def document_cache_results():
+    cache = get_document_cache()
+    if cache is None:
+        return None
+    return {(("result", "hit"),): cache.hits, (("result", "miss"),): cache.misses}
+
+metrics.callback("assistant_document_cache_total", "Consultations du cache des documents, par résultat",
+                 document_cache_results, kind="counter")
+metrics.callback("assistant_token_count_cache_total", "Consultations du cache des nombres de tokens, par résultat",
+                 lambda: {(("result", "hit"),): token_count_stats()["hits"],
+                          (("result", "miss"),): token_count_stats()["misses"]}, kind="counter")
+metrics.callback("assistant_llm_calls_total", "Appels au modèle, par résultat",
+                 lambda: {(("result", name),): llm_client.stats()[name] for name in ("calls", "errors", "retries", "rejected")},
+                 kind="counter")
+metrics.callback("assistant_llm_circuit_open", "1 si le disjoncteur du client du modèle est ouvert",
+                 lambda: int(llm_client.breaker.state == "open"))
+metrics.callback("assistant_llm_in_flight", "Appels au modèle en cours (synchrones et en flux)",
+                 lambda: llm_client.slots.active)
+metrics.callback("assistant_extraction_queue_pending", "PDF en attente ou en cours d'extraction",
+                 lambda: extraction_queue.stats()["pending"])
+metrics.callback("assistant_knowledge_chunks", "Passages indexés dans la base de connaissances",
+                 lambda: len(knowledge_base.snapshot.index.chunks))
+metrics.callback("assistant_catalogue_documents", "Documents du catalogue proposés au téléchargement",
+                 lambda: len(catalogue.snapshot.entries))
+
+# Charger la base de connaissances au démarrage de l'application,
+# puis surveiller le dossier si ASSISTANT_KNOWLEDGE_WATCH_SECONDS est défini.
+# Le préchauffage (ASSISTANT_WARMUP) se poursuit en arrière-plan pendant que l'API répond.
+# En mode production (ASSISTANT_INDEX_STORE), l'index enregistré par le lanceur est projeté en mémoire.
+@asynccontextmanager
+async def lifespan(app):
     try:
-        df = pd.read_excel(file_path)
-        return df.to_string(index=False)
+        if INDEX_STORE:
+            # Worker du mode production : index construit une fois par le lanceur et projeté en mémoire
+            knowledge_base.load_store(INDEX_STORE)
+        else:
+            knowledge_base.refresh()
+        logger.info("Base de connaissances chargée avec succès.")
+        for name, error in knowledge_base.snapshot.errors.items():
+            logger.warning("%s ignoré — %s", name, error)
+        for name, report in knowledge_base.snapshot.reports().items():
+            logger.info("%s nettoyé : %s tokens économisés sur %s %s", name, report.tokens_saved, report.tokens_before,
+                        report.to_dict())
+        cache = get_document_cache()
+        if cache is not None:
+            logger.info("Cache des documents : %s succès, %s analyses", cache.hits, cache.misses)
     except Exception as e:
-        return f"Erreur lors de la lecture du fichier Excel : {e}"
-
-# Fonction pour extraire du texte d'un PDF avec PyMuPDF et EasyOCR
-def extract_text_from_pdf_with_fitz(pdf_file):
+        ERRORS.inc(stage="knowledge_base", type=type(e).__name__)
+        logger.error("Erreur lors du chargement de la base de connaissances : %s", e)
+    if not INDEX_STORE:
+        knowledge_base.start_watching()
     try:
-        with tempfile.TemporaryDirectory() as image_output_dir:
-            pdf = fitz.open(pdf_file)
-            image_files = []
-
-            for page_num in range(pdf.page_count):
-                page = pdf[page_num]
-                pix = page.get_pixmap(matrix=fitz.Matrix(2, 2), alpha=False)
-                image_path = Path(image_output_dir) / f"page_{page_num + 1}.png"
-                pix.save(image_path)
-                image_files.append(image_path)
-
-            pdf.close()
-
-            reader = easyocr.Reader(["fr"])
-            text_output = []
-            for image_path in image_files:
-                text = reader.readtext(str(image_path), detail=0, paragraph=True)
-                text_output.append(" ".join(text))
-
-            return "\n".join(text_output)
+        catalogue.refresh()
+        for name, error in catalogue.snapshot.errors.items():
+            logger.warning("%s absent du catalogue — %s", name, error)
     except Exception as e:
-        return f"Erreur lors de l'extraction du texte : {e}"
+        ERRORS.inc(stage="catalogue", type=type(e).__name__)
+        logger.error("Erreur lors du chargement du catalogue : %s", e)
+    catalogue.start_watching()
+    report = warmup_report()["imports"]
+    logger.info("API importée en %.2f s ; imports différés : %s ; non chargés : %s",
+                IMPORT_SECONDS, report["seconds"], ", ".join(report["not_loaded"]) or "aucun")
+    start_warm_up()
+    yield
+    knowledge_base.stop_watching()
+    catalogue.stop_watching()
+    extraction_queue.shutdown()
+    await llm_client.aclose()
 
-# Fonction pour compter les tokens
-def count_tokens(messages, model="gpt-4o-mini"):
-    encoding = tiktoken.encoding_for_model(model)
-    total_tokens = 0
-    for message in messages:
-        total_tokens += len(encoding.encode(message["content"]))
-    return total_tokens
+app = FastAPI(lifespan=lifespan)
 
-# Fonction pour interroger OpenAI avec une base de connaissances et du texte complémentaire
-def query_openai_with_context(knowledge_base_text, conversation_history, user_input, supplemental_text=""):
-    openai.api_key = 'clé_api'
+# Marge accordée aux autres champs du formulaire dans la taille annoncée d'un envoi
+UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024
+
+# Envoi annoncé (en-tête Content-Length) comme plus gros que la limite des PDF : il est refusé
+# avant que son corps ne soit lu. Les envois sans taille annoncée sont limités par save_upload.
+def announced_too_large(request):
+    length = request.headers.get("content-length", "")
+    return length.isdigit() and int(length) > UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD_BYTES
+
+# Identifiant de requête : repris de l'en-tête X-Request-ID ou créé, renvoyé dans la réponse
+# et ajouté à chaque ligne de log écrite pendant la requête
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    request_id = request.headers.get("X-Request-ID") or new_request_id()
+    token = request_id_var.set(request_id)
     try:
-        messages = [
-            {"role": "system", "content": """Vous êtes un assistant virtuel conçu pour une mutuelle, 
+        if announced_too_large(request):
+            ERRORS.inc(stage="upload", type="UploadTooLargeError")
+            response = JSONResponse(
+                content={"error": f"Fichier trop volumineux (maximum {UPLOAD_MAX_BYTES / (1024 * 1024):g} Mo)."},
+                status_code=413,
+            )
+        else:
+            response = await call_next(request)
+    except Exception as e:
+        ERRORS.inc(stage="http", type=type(e).__name__)
+        REQUESTS.inc(endpoint=request.url.path, status="500")
+        logger.exception("Erreur non gérée sur %s", request.url.path)
+        raise
+    finally:
+        request_id_var.reset(token)
+    route = request.scope.get("route")
+    REQUESTS.inc(endpoint=getattr(route, "path", request.url.path), status=str(response.status_code))
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+# Consigne donnée au modèle
+SYSTEM_PROMPT = """Vous êtes un assistant virtuel conçu pour une mutuelle, 
              utilisant une base de connaissances issue de plusieurs documents. Votre rôle principal est de 
              répondre de manière claire et utile aux questions des utilisateurs, en vous basant sur les 
              informations disponibles. Si vous ne trouvez pas la réponse adéquate, formulez une réponse 
@@ -102,39 +212,89 @@ def query_openai_with_context(knowledge_base_text, conversation_history, user_in
              Ne proposez pas systématiquement l'adhésion dès le début, mais privilégiez un moment opportun 
              dans l'échange pour poser la question et adapter votre suggestion en fonction des besoins 
              exprimés. Pour les réponses tu devras etre synthétique pour pas que la personne n'est trop 
-             de mot a lire mais tout en gardant les informations pertinantes a la question posée."""},
-            {"role": "system", "content": f"Base de connaissances :\n{knowledge_base_text}"}
-        ]
-        messages.extend(conversation_history)
-
-        if supplemental_text:
-            user_input = f"{user_input}\n\nInformations supplémentaires issues du PDF :\n{supplemental_text}"
+             de mot a lire mais tout en gardant les informations pertinantes a la question posée."""
 
-        messages.append({"role": "user", "content": user_input})
+# Début de prompt partagé avec l'appel précédent de chaque session (cache de prompt du fournisseur)
+prefix_tracker = PrefixTracker()
 
-        token_count = count_tokens(messages, model="gpt-4o-mini")
-        print(f"Nombre total de tokens envoyés : {token_count}")
+# Construire les messages envoyés au modèle, dans le budget de tokens du prompt.
+# Avec session_id, breakdown["shared_prefix"] donne le nombre de tokens en tête du prompt
+# identiques à ceux de l'appel précédent de la session.
+def build_messages(knowledge_base_text, conversation_history, user_input, supplemental_text="", session_id=None):
+    prompt = build_prompt(SYSTEM_PROMPT, knowledge_base_text, conversation_history, user_input, supplemental_text)
+    if session_id is not None:
+        prompt.breakdown["shared_prefix"] = prefix_tracker.observe(session_id, prompt.messages)
+    return prompt
 
-        response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            temperature=0,
-            max_tokens=500
-        )
-        return response['choices'][0]['message']['content']
-    except Exception as e:
-        return f"Erreur lors de la requête OpenAI : {e}"
+# Tokens envoyés au modèle, dont ceux du début de prompt déjà envoyé lors de l'appel précédent
+def count_prompt_tokens(prompt):
+    TOKENS.inc(prompt.breakdown["total"], direction="in")
+    TOKENS.inc(prompt.breakdown.get("shared_prefix", 0), direction="shared_prefix")
 
-# Charger la base de connaissances au démarrage de l'application
-@app.on_event("startup")
-def load_base_on_startup():
-    global knowledge_base
-    directory_path = Path("./contexte")
+# Interroger OpenAI avec un prompt déjà assemblé. Un échec n'est jamais renvoyé comme une réponse
+# (ni mis en cache, ni gardé dans la session) : HTTPException 503 avec Retry-After quand le modèle
+# est indisponible (nouvelles tentatives épuisées, disjoncteur ouvert), 502 pour les autres erreurs.
+def query_openai_with_prompt(prompt):
     try:
-        knowledge_base = load_knowledge_base_from_directory(directory_path)
-        print("Base de connaissances chargée avec succès.")
+        logger.info("Nombre total de tokens envoyés : %s %s (partie fixe %s)",
+                    prompt.breakdown["total"], prompt.breakdown, prompt.static_version)
+        response = llm_client.chat(prompt.messages, api_key=OPENAI_API_KEY, temperature=0, max_tokens=500)
     except Exception as e:
-        print(f"Erreur lors du chargement de la base de connaissances : {e}")
+        ERRORS.inc(stage="llm", type=type(e).__name__)
+        logger.warning("%s : %s", OPENAI_ERROR_PREFIX, e)
+        if isinstance(e, CircuitOpenError) or is_retryable(e):
+            raise HTTPException(status_code=503, detail=f"{OPENAI_ERROR_PREFIX} : {e}",
+                                headers={"Retry-After": str(llm_client.retry_after(e))})
+        raise HTTPException(status_code=502, detail=f"{OPENAI_ERROR_PREFIX} : {e}")
+    count_prompt_tokens(prompt)
+    TOKENS.inc(count_text_tokens(response), direction="out")
+    return response
+
+# Fonction pour interroger OpenAI avec une base de connaissances et du texte complémentaire
+def query_openai_with_context(knowledge_base_text, conversation_history, user_input, supplemental_text=""):
+    return query_openai_with_prompt(build_messages(knowledge_base_text, conversation_history, user_input, supplemental_text))
+
+# Interroger OpenAI en flux : produit les morceaux de la réponse au fur et à mesure de leur génération
+async def stream_openai_with_prompt(prompt):
+    logger.info("Nombre total de tokens envoyés : %s %s (partie fixe %s)",
+                prompt.breakdown["total"], prompt.breakdown, prompt.static_version)
+    async for delta in llm_client.stream_chat(prompt.messages, api_key=OPENAI_API_KEY, temperature=0, max_tokens=500):
+        yield delta
+
+# Texte complémentaire d'une question et détail de la méthode utilisée par page :
+# document déjà envoyé sur /documents (document_id) ou PDF joint (recopié sur disque par
+# save_upload), extrait en attendant le résultat. La couche texte est lue en priorité, seules
+# les pages scannées passent par l'OCR, et la lecture s'arrête au budget de tokens du PDF.
+def load_supplemental_text(upload=None, filename="", document_id=None, trace=None):
+    texts = []
+    pages = []
+    if document_id:
+        job = extraction_queue.document(document_id)
+        texts.append(job.text)
+        pages.extend(job.pages)
+    if upload is not None:
+        submitted_at = time.time()
+        started = time.perf_counter()
+        job = extraction_queue.extract(upload, filename)
+        if trace is not None:
+            trace.record("pdf_extraction", time.perf_counter() - started)
+            # L'OCR n'est compté que si le document a été analysé pour cette requête
+            if job.created_at >= submitted_at and job.ocr_seconds:
+                trace.record("ocr", job.ocr_seconds)
+        texts.append(job.text)
+        pages.extend(job.pages)
+    return "\n".join(texts), pages
+
+# Réponse d'erreur pour un échec de la file d'extraction
+def extraction_error_response(error):
+    ERRORS.inc(stage="pdf_extraction", type=type(error).__name__)
+    headers = {"Retry-After": "5"} if isinstance(error, (QueueFullError, DocumentNotReadyError)) else None
+    return JSONResponse(content={"error": str(error)}, status_code=EXTRACTION_ERROR_STATUS[type(error)], headers=headers)
+
+# Mettre en forme un événement Server-Sent Events
+def sse_event(data, event=None):
+    payload = f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return f"event: {event}\n{payload}" if event else payload
 
 # Endpoint pour poser une question
 @app.post("/query")
@@ -142,27 +302,265 @@ def query_knowledge_base(
     id: str = Form(...),
     message: str = Form(...),
     supplemental_pdf: UploadFile = File(None),
+    document_id: str = Form(None),
 ):
-    global knowledge_base
+    trace = RequestTrace("/query", STAGE_SECONDS, logger)
     try:
-        if not knowledge_base:
+        # Version de la base utilisée pendant toute la requête
+        knowledge_index = knowledge_base.index
+        if not knowledge_index.chunks:
+            ERRORS.inc(stage="knowledge_base", type="KnowledgeBaseNotLoaded")
             return JSONResponse(content={"error": "La base de connaissances n'a pas été chargée."}, status_code=500)
 
-        # Charger un PDF complémentaire si fourni
-        supplemental_text = ""
-        if supplemental_pdf:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_pdf:
-                temp_pdf.write(supplemental_pdf.file.read())
-                supplemental_text = extract_text_from_pdf_with_fitz(temp_pdf.name)
+        # Charger le PDF complémentaire joint ou déjà extrait (document_id), si fourni
+        with trace.stage("upload_read"):
+            upload = save_upload(supplemental_pdf.file) if supplemental_pdf else None
+        supplemental_text, supplemental_pages = load_supplemental_text(
+            upload, supplemental_pdf.filename if supplemental_pdf else "", document_id, trace
+        )
+
+        # Historique de la session, limité aux derniers échanges
+        with trace.stage("session"):
+            conversation_history = session_store.get_history(id)
 
-        # Historique fictif pour l'instant (à améliorer pour une vraie gestion des sessions)
-        conversation_history = []
+        # Une question posée sans historique ni PDF peut être servie par le cache des réponses
+        cacheable = not conversation_history and not supplemental_text
+        cached = answer_cache.get(message, knowledge_index.version) if cacheable else None
+        if cached is not None:
+            response, cache_status = cached
+            tokens = {"total": 0}
+        else:
+            # Ne garder que les passages de la base utiles à la question, puis assembler le prompt
+            # dans le budget de tokens (token_count : temps de comptage inclus dans ces deux étapes)
+            with measure_token_counting() as token_counting:
+                with trace.stage("retrieval"):
+                    knowledge_context = knowledge_index.build_context(message)
+                with trace.stage("prompt_assembly"):
+                    prompt = build_messages(knowledge_context, conversation_history, message, supplemental_text, id)
+            trace.record("token_count", token_counting[0])
 
-        # Interroger OpenAI
-        response = query_openai_with_context(knowledge_base, conversation_history, message, supplemental_text)
-        return {"id": id, "response": response}
+            with trace.stage("llm_wait"):
+                response = query_openai_with_prompt(prompt)
+            tokens = prompt.breakdown
+            cache_status = "miss" if cacheable else "bypass"
+            if cacheable:
+                answer_cache.put(message, knowledge_index.version, response)
+        ANSWER_CACHE_RESULTS.inc(result=cache_status)
+
+        with trace.stage("session_save"):
+            session_store.append_turn(id, message, response)
+        result = {"id": id, "response": response, "tokens": tokens, "cache": cache_status}
+        if supplemental_pdf or document_id:
+            result["supplemental_pages"] = supplemental_pages
+        result["timings"] = trace.finish()
+        return result
+    except (QueueFullError, DocumentNotFoundError, DocumentNotReadyError, ExtractionFailedError, UploadTooLargeError) as e:
+        return extraction_error_response(e)
+    except HTTPException:
+        trace.finish()
+        raise
     except Exception as e:
+        ERRORS.inc(stage="query", type=type(e).__name__)
+        logger.exception("Erreur lors du traitement de la question")
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
+# Endpoint pour poser une question avec une réponse diffusée en flux (Server-Sent Events).
+# Chaque morceau de réponse est envoyé dès sa génération dans un événement {"delta": ...},
+# puis un événement "end" clôt le flux (ou "error" en cas d'échec du modèle).
+@app.post("/query/stream")
+async def stream_query_knowledge_base(
+    id: str = Form(...),
+    message: str = Form(...),
+    supplemental_pdf: UploadFile = File(None),
+    document_id: str = Form(None),
+):
+    trace = RequestTrace("/query/stream", STAGE_SECONDS, logger)
+
+    # Version de la base utilisée pendant toute la requête
+    knowledge_index = knowledge_base.index
+    if not knowledge_index.chunks:
+        ERRORS.inc(stage="knowledge_base", type="KnowledgeBaseNotLoaded")
+        return JSONResponse(content={"error": "La base de connaissances n'a pas été chargée."}, status_code=500)
+
+    try:
+        # L'OCR et la recherche sont exécutés hors de la boucle d'événements
+        with trace.stage("upload_read"):
+            upload = await run_in_threadpool(save_upload, supplemental_pdf.file) if supplemental_pdf else None
+        supplemental_text, supplemental_pages = await run_in_threadpool(
+            load_supplemental_text, upload, supplemental_pdf.filename if supplemental_pdf else "", document_id, trace
+        )
+
+        with trace.stage("session"):
+            conversation_history = await run_in_threadpool(session_store.get_history, id)
+        version = knowledge_index.version
+        cacheable = not conversation_history and not supplemental_text
+        cached = answer_cache.get(message, version) if cacheable else None
+        prompt = None
+        if cached is None:
+            def retrieve_and_build():
+                with measure_token_counting() as token_counting:
+                    with trace.stage("retrieval"):
+                        knowledge_context = knowledge_index.build_context(message)
+                    with trace.stage("prompt_assembly"):
+                        prompt = build_messages(knowledge_context, conversation_history, message, supplemental_text, id)
+                trace.record("token_count", token_counting[0])
+                return prompt
+
+            prompt = await run_in_threadpool(retrieve_and_build)
+    except (QueueFullError, DocumentNotFoundError, DocumentNotReadyError, ExtractionFailedError, UploadTooLargeError) as e:
+        return extraction_error_response(e)
+    except Exception as e:
+        ERRORS.inc(stage="query", type=type(e).__name__)
+        logger.exception("Erreur lors du traitement de la question")
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+
+    async def events():
+        if cached is not None:
+            # Réponse déjà connue : envoyée en un seul morceau
+            response, cache_status = cached
+            yield sse_event({"delta": response})
+            tokens = {"total": 0}
+        else:
+            deltas = []
+            started = time.perf_counter()
+            try:
+                async for delta in stream_openai_with_prompt(prompt):
+                    if not deltas:
+                        trace.record("llm_first_token", time.perf_counter() - started)
+                    deltas.append(delta)
+                    yield sse_event({"delta": delta})
+            except Exception as e:
+                ERRORS.inc(stage="llm", type=type(e).__name__)
+                logger.warning("%s : %s", OPENAI_ERROR_PREFIX, e)
+                trace.finish()
+                yield sse_event({"error": f"{OPENAI_ERROR_PREFIX} : {e}"}, event="error")
+                return
+            trace.record("llm_wait", time.perf_counter() - started)
+            response = "".join(deltas)
+            tokens = prompt.breakdown
+            count_prompt_tokens(prompt)
+            TOKENS.inc(count_text_tokens(response), direction="out")
+            cache_status = "miss" if cacheable else "bypass"
+            if cacheable:
+                answer_cache.put(message, version, response)
+        ANSWER_CACHE_RESULTS.inc(result=cache_status)
+        with trace.stage("session_save"):
+            await run_in_threadpool(session_store.append_turn, id, message, response)
+        end = {"id": id, "tokens": tokens, "cache": cache_status}
+        if supplemental_pdf or document_id:
+            end["supplemental_pages"] = supplemental_pages
+        end["timings"] = trace.finish()
+        yield sse_event(end, event="end")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Endpoint pour envoyer un PDF complémentaire : l'extraction est faite en arrière-plan.
+# Retourne l'identifiant du document (202 tant que l'extraction n'est pas terminée, 200 si le
+# fichier était déjà extrait) ; 503 si la file d'extraction est pleine, 413 si le fichier est trop gros.
+@app.post("/documents")
+def upload_document(file: UploadFile = File(...)):
+    trace = RequestTrace("/documents", STAGE_SECONDS, logger)
+    try:
+        with trace.stage("upload_read"):
+            upload = save_upload(file.file)
+        job = extraction_queue.submit(upload, file.filename)
+        trace.finish()
+    except (QueueFullError, UploadTooLargeError) as e:
+        return extraction_error_response(e)
+    return JSONResponse(content=job.to_dict(), status_code=200 if job.status == DONE else 202)
+
+# Endpoint pour suivre l'extraction d'un document envoyé sur /documents
+@app.get("/documents/{document_id}")
+def document_status(document_id: str):
+    job = extraction_queue.get(document_id)
+    if job is None:
+        return JSONResponse(content={"error": f"Document inconnu : {document_id}"}, status_code=404)
+    return job.to_dict()
+
+# Endpoint de la liste des documents à télécharger et de leurs métadonnées
+@app.get("/catalogue")
+def list_catalogue():
+    snapshot = catalogue.snapshot
+    return {
+        "number": snapshot.number,
+        "documents": [entry.to_dict() for entry in snapshot.entries.values()],
+        "errors": snapshot.errors,
+    }
+
+# Endpoint de téléchargement du premier document d'un type (devis...), servi depuis la mémoire.
+# Le client qui renvoie l'ETag reçu (If-None-Match) obtient 304 tant que le document n'a pas changé.
+@app.get("/catalogue/{document_type}")
+def catalogue_document(document_type: str, request: Request):
+    entry = catalogue.find(document_type)
+    if entry is None:
+        return JSONResponse(content={"error": f"Aucun document de type {document_type} dans le catalogue."},
+                            status_code=404)
+    headers = {
+        "ETag": entry.etag,
+        "Cache-Control": "no-cache",
+        "Content-Disposition": f"attachment; filename*=UTF-8''{quote(entry.name)}",
+    }
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.content, media_type=entry.mime, headers=headers)
+
+# Endpoint des compteurs des caches (documents, tokens, réponses), de la version de la base
+# et du démarrage (imports, préchauffage)
+@app.get("/stats")
+def cache_stats():
+    document_cache = get_document_cache()
+    snapshot = knowledge_base.snapshot
+    return {
+        "knowledge_base": {
+            "number": snapshot.number,
+            "version": snapshot.version,
+            "chunks": len(snapshot.index.chunks),
+            "cleaning": {name: report.to_dict() for name, report in snapshot.reports().items()},
+        },
+        "document_cache": document_cache.stats() if document_cache is not None else None,
+        "token_count_cache": token_count_stats(),
+        "answer_cache": answer_cache.stats(),
+        "extraction_queue": extraction_queue.stats(),
+        "llm": llm_client.stats(),
+        "catalogue": catalogue.stats(),
+        "startup": {"import_seconds": round(IMPORT_SECONDS, 3), "warmup": warmup_report()},
+    }
+
+# Endpoint des métriques au format texte de Prometheus
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Mode production : la base est analysée et indexée une seule fois ici, enregistrée dans
+# INDEX_STORE_DIRECTORY, puis chaque worker projette ces fichiers en mémoire en lecture seule.
+# La mémoire occupée par la base ne dépend donc pas du nombre de workers. Les sessions passent
+# par SQLite pour être partagées entre les workers. Pour prendre en compte une modification
+# du dossier de contexte, relancer le serveur.
+def serve_production(workers, host="0.0.0.0", port=8000):
+    changes = knowledge_base.refresh()
+    store_path = save_index(knowledge_base.index, INDEX_STORE_DIRECTORY, changes["errors"])
+    logger.info("Index %s enregistré dans %s (%s passages)", knowledge_base.snapshot.version, store_path,
+                len(knowledge_base.index.chunks))
+    # Les workers sont des processus lancés avec l'environnement de celui-ci
+    os.environ["ASSISTANT_INDEX_STORE"] = str(store_path)
+    os.environ.setdefault("ASSISTANT_SESSION_BACKEND", "sqlite")
+    uvicorn.run("api_assistant:app", host=host, port=port, workers=workers)
+
 if __name__ == "__main__":
-    uvicorn.run("api_assistant:app", host="0.0.0.0", port=8000, reload=True)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="API de l'assistant")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="nombre de workers (mode production) ; sans cette option, un seul processus avec rechargement du code")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    if args.workers:
+        serve_production(args.workers, args.host, args.port)
+    else:
+        uvicorn.run("api_assistant:app", host=args.host, port=args.port, reload=True)
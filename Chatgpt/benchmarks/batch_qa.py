@@ -0,0 +1,242 @@
+# Rejouer un lot de questions (JSONL ou CSV) contre l'assistant, sans passer par l'API HTTP :
+# mêmes recherche, prompt et client du modèle que /query, avec un nombre borné d'appels simultanés.
+# Chaque réponse est ajoutée au fichier de sortie dès qu'elle est connue ; une exécution
+# interrompue reprend avec --resume en sautant les questions déjà répondues (celles en échec
+# sont reposées).
+#   python batch_qa.py questions.jsonl --output reponses.jsonl --concurrency 8
+#   python batch_qa.py questions.csv --output reponses.jsonl --stub --stub-latency 0.5
+#   python batch_qa.py questions.jsonl --output reponses.jsonl --resume
+# Chaque question est un objet JSON (ou une ligne CSV) avec un champ question (ou message),
+# et facultativement id, history (liste de messages {"role", "content"}, JSONL seulement)
+# et expected (réponse attendue, recopiée telle quelle dans la sortie).
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+
+# Rendre le paquet commun et l'API importables depuis ce dossier
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+sys.path.append(str(Path(__file__).resolve().parent.parent / "api_AI"))
+
+from commun.knowledge_base import KnowledgeBase
+from stub_model import StubModelServer, stub_llm_client
+
+# Réponse du modèle simulé (--stub)
+STUB_ANSWER = "Réponse simulée."
+
+# Lire les questions d'un fichier JSONL ou CSV : liste de dictionnaires {id, question, history, expected}
+def read_questions(input_path):
+    if input_path.suffix.lower() == ".csv":
+        with open(input_path, newline="", encoding="utf-8-sig") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(input_path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    questions = []
+    for number, row in enumerate(rows, start=1):
+        question = row.get("question") or row.get("message")
+        if not question:
+            raise ValueError(f"{input_path} : question manquante à l'entrée {number}")
+        questions.append({
+            "id": str(row.get("id") or number),
+            "question": question,
+            "history": row.get("history") or [],
+            "expected": row.get("expected"),
+        })
+    return questions
+
+# Reprise : ne garder du fichier de sortie que les questions répondues, et retourner leurs
+# identifiants. Les questions en échec (503, 429, disjoncteur ouvert...) sont ainsi reposées, leur
+# ligne étant remplacée par le nouveau résultat, et une dernière ligne interrompue pendant
+# l'écriture est retirée. Le fichier est réécrit à côté puis remplacé d'un seul coup.
+def prepare_resume(output_path):
+    done = set()
+    if not output_path.exists():
+        return done
+    temporary = output_path.with_name(output_path.name + ".tmp")
+    with open(output_path, encoding="utf-8") as source, open(temporary, "w", encoding="utf-8") as target:
+        for line in source:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("error") is not None or "id" not in record or record["id"] in done:
+                continue
+            done.add(record["id"])
+            target.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(temporary, output_path)
+    return done
+
+# Répondre à une question comme /query : passages de la base, prompt, appel au modèle.
+# Retourne le résultat à écrire dans le fichier de sortie.
+def answer_question(api, knowledge_index, item):
+    started = time.perf_counter()
+    knowledge_context = knowledge_index.build_context(item["question"])
+    retrieved = time.perf_counter()
+    prompt = api.build_messages(knowledge_context, item["history"], item["question"])
+    built = time.perf_counter()
+    # Échec du modèle : même erreur que celle renvoyée par /query (503 ou 502)
+    try:
+        response, error = api.query_openai_with_prompt(prompt), None
+    except api.HTTPException as e:
+        response, error = None, e.detail
+    finished = time.perf_counter()
+
+    return {
+        "id": item["id"],
+        "question": item["question"],
+        "answer": response,
+        "error": error,
+        "expected": item["expected"],
+        "tokens": prompt.breakdown,
+        "latency_ms": {
+            "retrieval": round((retrieved - started) * 1000.0, 2),
+            "prompt_assembly": round((built - retrieved) * 1000.0, 2),
+            "llm": round((finished - built) * 1000.0, 2),
+            "total": round((finished - started) * 1000.0, 2),
+        },
+        "knowledge_version": knowledge_index.version,
+        "static_version": prompt.static_version,
+    }
+
+# Résultat d'une question dont le traitement a échoué (erreur de la recherche, du prompt...)
+def failed_result(item, error):
+    return {
+        "id": item["id"],
+        "question": item["question"],
+        "answer": None,
+        "error": f"{type(error).__name__} : {error}",
+        "expected": item["expected"],
+        "tokens": {"total": 0},
+        "latency_ms": None,
+    }
+
+# Traiter les questions avec au plus concurrency appels simultanés ; chaque résultat est écrit
+# (et le fichier vidé sur disque) dès qu'il est connu. Une question en échec est enregistrée avec
+# son erreur sans interrompre le lot. Retourne la liste des résultats.
+def run_batch(api, knowledge_index, questions, output, concurrency):
+    results = []
+    write_lock = threading.Lock()
+    pending = {}
+    remaining = iter(questions)
+
+    def record(result):
+        with write_lock:
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+            results.append(result)
+            if len(results) % 100 == 0:
+                print(f"{len(results)} / {len(questions)} questions traitées", file=sys.stderr)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as executor:
+        while True:
+            # Garder au plus concurrency questions en cours, sans tout soumettre d'un coup
+            for item in remaining:
+                pending[executor.submit(answer_question, api, knowledge_index, item)] = item
+                if len(pending) >= concurrency:
+                    break
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                item = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Question {item['id']} en échec : {e}", file=sys.stderr)
+                    result = failed_result(item, e)
+                record(result)
+    return results
+
+# Résumé d'une exécution : débit, latences et tokens
+def summarize_results(results, elapsed):
+    summary = {
+        "questions": len(results),
+        "errors": sum(1 for result in results if result["error"]),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_qps": round(len(results) / elapsed, 3) if elapsed > 0 else None,
+    }
+    # Les questions en échec avant l'appel au modèle n'ont pas de latence
+    timed = [result for result in results if result["latency_ms"]]
+    if timed:
+        latencies = np.asarray([result["latency_ms"]["total"] for result in timed], dtype=np.float64)
+        summary["latency_ms"] = {
+            "mean": round(float(latencies.mean()), 2),
+            "p50": round(float(np.percentile(latencies, 50)), 2),
+            "p95": round(float(np.percentile(latencies, 95)), 2),
+            "p99": round(float(np.percentile(latencies, 99)), 2),
+            "max": round(float(latencies.max()), 2),
+        }
+    if results:
+        summary["prompt_tokens"] = sum(result["tokens"]["total"] for result in results)
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Rejouer un lot de questions contre l'assistant")
+    parser.add_argument("input", type=Path, help="questions au format JSONL ou CSV")
+    parser.add_argument("--output", type=Path, required=True, help="fichier JSONL des réponses (sert aussi de point de reprise)")
+    parser.add_argument("--context", type=Path, default=Path(__file__).resolve().parent.parent / "streamlit" / "contexte",
+                        help="dossier de la base de connaissances")
+    parser.add_argument("--concurrency", type=int, default=4, help="nombre maximal d'appels simultanés au modèle")
+    parser.add_argument("--limit", type=int, help="ne traiter que les premières questions")
+    parser.add_argument("--resume", action="store_true", help="reprendre une exécution : sauter les questions déjà répondues dans --output")
+    parser.add_argument("--overwrite", action="store_true", help="remplacer --output s'il existe")
+    parser.add_argument("--stub", action="store_true", help="brancher le client du modèle sur un serveur local qui répond un texte fixe")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="durée de chaque réponse simulée, en secondes")
+    parser.add_argument("--summary", type=Path, help="fichier JSON où enregistrer le résumé de l'exécution")
+    parser.add_argument("--verbose", action="store_true", help="journaliser chaque appel au modèle")
+    args = parser.parse_args()
+
+    if args.output.exists() and args.output.stat().st_size and not (args.resume or args.overwrite):
+        parser.error(f"{args.output} existe déjà : utilisez --resume pour reprendre ou --overwrite pour le remplacer")
+
+    import api_assistant as api
+
+    if not args.verbose:
+        api.logger.setLevel(logging.WARNING)
+    # Modèle simulé : un client branché sur le serveur local remplace celui de l'API
+    stub_server = StubModelServer(STUB_ANSWER, args.stub_latency) if args.stub else None
+    if stub_server is not None:
+        api.llm_client = stub_llm_client(stub_server, args.concurrency)
+
+    knowledge_base = KnowledgeBase(args.context)
+    knowledge_base.refresh()
+    for name, error in knowledge_base.snapshot.errors.items():
+        print(f"{name} ignoré — {error}", file=sys.stderr)
+    if not knowledge_base.index.chunks:
+        sys.exit(f"Aucun passage dans la base de connaissances {args.context}")
+
+    questions = read_questions(args.input)
+    if args.limit is not None:
+        questions = questions[:args.limit]
+    done = prepare_resume(args.output) if args.resume else set()
+    todo = [item for item in questions if item["id"] not in done]
+    print(f"{len(todo)} questions à traiter ({len(done)} déjà faites), base {knowledge_base.snapshot.version}",
+          file=sys.stderr)
+
+    started = time.perf_counter()
+    try:
+        with open(args.output, "a" if args.resume else "w", encoding="utf-8") as output:
+            results = run_batch(api, knowledge_base.index, todo, output, args.concurrency)
+    finally:
+        if stub_server is not None:
+            stub_server.close()
+    summary = summarize_results(results, time.perf_counter() - started)
+    summary["skipped"] = len(done)
+    api.extraction_queue.shutdown()
+
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    if args.summary:
+        args.summary.write_text(json.dumps(summary, indent=2, ensure_ascii=False), encoding="utf-8")
+
+if __name__ == "__main__":
+    main()
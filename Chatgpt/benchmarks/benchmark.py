@@ -0,0 +1,315 @@
+# Mesures de performance sur un corpus synthétique : analyse des documents par type de fichier,
+# OCR par page, comptage des tokens et /query de bout en bout avec un modèle simulé.
+#   python benchmark.py --documents 20 --output avant.json
+#   python benchmark.py --documents 20 --output apres.json --compare avant.json
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Le cache des documents est désactivé : on mesure l'analyse des fichiers, pas la relecture du cache
+os.environ.setdefault("ASSISTANT_DOCUMENT_CACHE", "")
+
+# Rendre le paquet commun et l'API importables depuis ce dossier
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+sys.path.append(str(Path(__file__).resolve().parent.parent / "api_AI"))
+
+import fitz  # PyMuPDF
+import numpy as np
+import pandas as pd
+from docx import Document
+
+from commun.documents import load_knowledge_base_from_directory
+from commun.ocr import extract_pages_from_pdf
+from commun.tokens import count_tokens
+from stub_model import StubModelServer, stub_llm_client
+
+# Vocabulaire des documents synthétiques
+WORDS = (
+    "adhérent mutuelle remboursement garantie formule bronze silver gold dentaire optique hospitalisation "
+    "devis prothèse implant couronne monture verres consultation spécialiste tiers payant cotisation "
+    "contrat résiliation délai carence plafond annuel forfait prise en charge sécurité sociale médecin "
+    "traitant pharmacie analyse radiologie orthodontie audioprothèse franchise justificatif facture"
+).split()
+
+QUESTIONS = [
+    "Quel est le remboursement des implants dentaires ?",
+    "Combien coûte la formule gold pour une famille ?",
+    "Quels justificatifs fournir pour une prothèse ?",
+    "Quel est le délai de carence en optique ?",
+    "Comment résilier mon contrat de mutuelle ?",
+]
+
+STUB_ANSWER = "Réponse de test."
+
+def random_sentence(rng, length=12):
+    return " ".join(rng.choice(WORDS) for _ in range(length)).capitalize() + "."
+
+def random_paragraph(rng, sentences=5):
+    return " ".join(random_sentence(rng, rng.randint(8, 16)) for _ in range(sentences))
+
+# Générer un corpus synthétique : documents Word, PDF à couche texte et classeurs Excel,
+# chacun dans son dossier, plus un dossier contexte qui les réunit et un PDF scanné
+def make_corpus(directory, rng, documents, pages, rows, scanned_pages):
+    directory = Path(directory)
+    folders = {suffix: directory / suffix for suffix in ("docx", "pdf", "xlsx")}
+    for folder in folders.values():
+        folder.mkdir(parents=True)
+
+    for number in range(documents):
+        doc = Document()
+        for _ in range(pages * 4):
+            doc.add_paragraph(random_paragraph(rng))
+        doc.save(folders["docx"] / f"document_{number:03d}.docx")
+
+        pdf = fitz.open()
+        for _ in range(pages):
+            page = pdf.new_page()
+            page.insert_textbox(page.rect + (50, 50, -50, -50), random_paragraph(rng, 20), fontsize=9)
+        pdf.save(folders["pdf"] / f"document_{number:03d}.pdf")
+        pdf.close()
+
+        table = pd.DataFrame({
+            "Acte": [f"{rng.choice(WORDS)} {rng.choice(WORDS)} {row}" for row in range(rows)],
+            "Formule": [rng.choice(["Bronze", "Silver", "Gold"]) for _ in range(rows)],
+            "Montant": [rng.randint(10, 900) for _ in range(rows)],
+            "Pièces attendues": [random_sentence(rng) for _ in range(rows)],
+        })
+        table.to_excel(folders["xlsx"] / f"document_{number:03d}.xlsx", index=False)
+
+    context = directory / "contexte"
+    context.mkdir()
+    for folder in folders.values():
+        for file_path in folder.iterdir():
+            shutil.copy(file_path, context / f"{folder.name}_{file_path.name}")
+
+    # PDF sans couche texte : chaque page est une image, comme un devis scanné
+    scanned = directory / "scanned.pdf"
+    source = fitz.open()
+    pdf = fitz.open()
+    for _ in range(scanned_pages):
+        page = source.new_page()
+        page.insert_textbox(page.rect + (50, 50, -50, -50), random_paragraph(rng, 12), fontsize=11)
+        pix = page.get_pixmap(dpi=100)
+        pdf.new_page(width=page.rect.width, height=page.rect.height).insert_image(page.rect, pixmap=pix)
+    pdf.save(scanned)
+    pdf.close()
+    source.close()
+    return folders, context, scanned
+
+# Statistiques d'une série de mesures, en millisecondes
+def summarize(samples):
+    values = np.asarray(samples, dtype=np.float64) * 1000.0
+    return {
+        "runs": len(values),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "min_ms": round(float(values.min()), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+# Pic de mémoire résidente du processus depuis son lancement, en Mo (ne fait que croître)
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est en octets sur macOS, en kilo-octets ailleurs
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+# Mémoire résidente actuelle du processus, en Mo (lue dans /proc : None hors de Linux)
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+
+# Mémoire d'une étape : résidente à la fin, variation pendant l'étape, et hausse du pic du
+# processus due à l'étape (0 si elle est restée sous le pic d'une étape précédente)
+@contextlib.contextmanager
+def stage_memory(report, stage):
+    rss_before, peak_before = current_rss_mb(), peak_rss_mb()
+    yield
+    rss_after, peak_after = current_rss_mb(), peak_rss_mb()
+    report[stage] = {
+        "rss_mb": rss_after,
+        "rss_delta_mb": round(rss_after - rss_before, 1) if rss_before is not None else None,
+        "peak_growth_mb": round(peak_after - peak_before, 1),
+    }
+
+# Durées de repeat appels à function, divisées par per (durée par fichier, par page...)
+def measure(function, repeat, per=1):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) / per)
+    return samples
+
+def bench_ingestion(folders, repeat):
+    results = {}
+    for suffix, folder in folders.items():
+        count = len(list(folder.iterdir()))
+        samples = measure(lambda: load_knowledge_base_from_directory(folder), repeat, per=count)
+        results[suffix] = {"files": count, "per_file": summarize(samples)}
+    return results
+
+# Extraction d'un PDF scanné par le chemin de l'API (couche texte d'abord, OCR des pages scannées,
+# arrêt au budget de tokens du PDF) ; durée ramenée aux pages effectivement lues
+def bench_ocr(scanned, repeat):
+    pdf_bytes = scanned.read_bytes()
+    # Le premier appel charge le modèle d'OCR : il est mesuré à part
+    started = time.perf_counter()
+    extraction = extract_pages_from_pdf(pdf_bytes)
+    warmup = time.perf_counter() - started
+    if extraction.error:
+        raise RuntimeError(f"Extraction du PDF scanné en échec : {extraction.error}")
+    pages = len(extraction.pages)
+    samples = measure(lambda: extract_pages_from_pdf(pdf_bytes), repeat, per=pages)
+    return {
+        "pages": pages,
+        "ocr_pages": sum(1 for page in extraction.pages if page.method == "ocr"),
+        "truncated": extraction.truncated,
+        "first_call_ms": round(warmup * 1000.0, 3),
+        "per_page": summarize(samples),
+    }
+
+def bench_count_tokens(rng, repeat):
+    conversations = [
+        [{"role": "user", "content": random_paragraph(rng)}, {"role": "assistant", "content": random_paragraph(rng)}]
+        for _ in range(repeat)
+    ]
+    # Textes jamais vus (encodage) puis les mêmes textes (mémo des comptes)
+    cold = []
+    for messages in conversations:
+        started = time.perf_counter()
+        count_tokens(messages)
+        cold.append(time.perf_counter() - started)
+    warm = measure(lambda: count_tokens(conversations[0]), repeat)
+    return {"cold": summarize(cold), "warm": summarize(warm)}
+
+# /query de bout en bout avec un modèle simulé (serveur local, voir stub_model) : OCR exclu,
+# recherche, prompt, client du modèle et sessions inclus. Les objets de l'API remplacés pour
+# la mesure sont remis en place ensuite.
+def bench_query(context, queries):
+    import api_assistant
+    from fastapi.testclient import TestClient
+    from commun.answer_cache import AnswerCache
+    from commun.knowledge_base import KnowledgeBase
+
+    previous = (api_assistant.knowledge_base, api_assistant.answer_cache, api_assistant.llm_client)
+    samples = []
+    try:
+        with StubModelServer(STUB_ANSWER) as stub_server:
+            api_assistant.knowledge_base = KnowledgeBase(context)
+            # Questions toutes différentes et niveau quasi-doublon désactivé : aucune réponse servie par le cache
+            api_assistant.answer_cache = AnswerCache(similarity_threshold=0)
+            api_assistant.llm_client = stub_llm_client(stub_server, max_concurrency=1)
+            with contextlib.redirect_stdout(io.StringIO()), TestClient(api_assistant.app) as client:
+                for number in range(queries):
+                    data = {"id": f"benchmark-{number % 10}", "message": f"{QUESTIONS[number % len(QUESTIONS)]} ({number})"}
+                    started = time.perf_counter()
+                    response = client.post("/query", data=data)
+                    samples.append(time.perf_counter() - started)
+                    if response.status_code != 200:
+                        raise RuntimeError(f"/query a échoué : {response.status_code} {response.text}")
+            chunks = len(api_assistant.knowledge_base.index.chunks)
+    finally:
+        api_assistant.knowledge_base, api_assistant.answer_cache, api_assistant.llm_client = previous
+    return {"chunks": chunks, "latency": summarize(samples)}
+
+# Comparer les médianes de deux exécutions
+def compare(previous, current, prefix=""):
+    for key, value in current.items():
+        old = previous.get(key) if isinstance(previous, dict) else None
+        if old is None:
+            continue
+        if isinstance(value, dict) and "p50_ms" in value:
+            ratio = value["p50_ms"] / old["p50_ms"] if old["p50_ms"] else float("inf")
+            print(f"{prefix + key:<32} p50 {old['p50_ms']:>10.3f} ms -> {value['p50_ms']:>10.3f} ms  (x{ratio:.2f})")
+        elif isinstance(value, dict):
+            compare(old, value, f"{prefix}{key}.")
+
+def print_results(results, prefix=""):
+    for key, value in results.items():
+        if isinstance(value, dict) and "p50_ms" in value:
+            print(f"{prefix + key:<32} p50 {value['p50_ms']:>10.3f}  p95 {value['p95_ms']:>10.3f}  "
+                  f"p99 {value['p99_ms']:>10.3f} ms  ({value['runs']} mesures)")
+        elif isinstance(value, dict):
+            print_results(value, f"{prefix}{key}.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Mesures de performance de l'assistant sur un corpus synthétique")
+    parser.add_argument("--documents", type=int, default=5, help="nombre de documents par type")
+    parser.add_argument("--pages", type=int, default=3, help="pages par document Word ou PDF")
+    parser.add_argument("--rows", type=int, default=100, help="lignes par classeur Excel")
+    parser.add_argument("--scanned-pages", type=int, default=3, help="pages du PDF scanné passé à l'OCR")
+    parser.add_argument("--repeat", type=int, default=5, help="répétitions de chaque mesure")
+    parser.add_argument("--queries", type=int, default=50, help="nombre de requêtes /query")
+    parser.add_argument("--seed", type=int, default=0, help="graine du générateur de corpus")
+    parser.add_argument("--skip-ocr", action="store_true", help="ne pas mesurer l'OCR")
+    parser.add_argument("--skip-query", action="store_true", help="ne pas mesurer /query")
+    parser.add_argument("--output", type=Path, help="fichier JSON où enregistrer les résultats")
+    parser.add_argument("--compare", type=Path, help="résultats JSON d'une exécution précédente")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    report = {
+        "date": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+        "results": {},
+        "memory_mb": {},
+    }
+    results = report["results"]
+    memory = report["memory_mb"]
+
+    with tempfile.TemporaryDirectory() as directory:
+        with stage_memory(memory, "corpus"):
+            folders, context, scanned = make_corpus(
+                directory, rng, args.documents, args.pages, args.rows, args.scanned_pages
+            )
+
+        with stage_memory(memory, "ingestion"):
+            results["ingestion"] = bench_ingestion(folders, args.repeat)
+
+        if not args.skip_ocr:
+            with stage_memory(memory, "ocr"):
+                results["ocr"] = bench_ocr(scanned, args.repeat)
+
+        with stage_memory(memory, "count_tokens"):
+            results["count_tokens"] = bench_count_tokens(rng, max(args.repeat, 100))
+
+        if not args.skip_query:
+            with stage_memory(memory, "query"):
+                results["query"] = bench_query(context, args.queries)
+    report["peak_rss_mb"] = peak_rss_mb()
+
+    print_results(results)
+    for stage, usage in memory.items():
+        print(f"Mémoire {stage:<20} résidente {usage['rss_mb']} Mo, variation {usage['rss_delta_mb']} Mo, "
+              f"hausse du pic {usage['peak_growth_mb']} Mo")
+    print(f"Pic de mémoire résidente du processus : {report['peak_rss_mb']} Mo")
+
+    if args.compare:
+        print(f"\nComparaison avec {args.compare} :")
+        compare(json.loads(args.compare.read_text(encoding="utf-8"))["results"], results)
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"Résultats enregistrés dans {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# Modèle simulé pour les mesures : serveur local qui imite /v1/chat/completions d'OpenAI et répond
+# toujours le même texte après un délai fixe, sans appel réseau. Le client du modèle (LLMClient)
+# y est branché comme sur le vrai service : pool de connexions, limites et nouvelles tentatives compris.
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Rendre le paquet commun importable depuis ce dossier
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from commun.llm_client import LLMClient, TokenBucket
+
+class StubModelServer:
+    def __init__(self, answer, latency=0.0):
+        self.answer = answer
+        self.latency = latency
+        self.calls = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stub.calls += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                payload = json.dumps({
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": stub.answer}}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0},
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        threading.Thread(target=self.server.serve_forever, name="stub-model", daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# Client du modèle branché sur le serveur simulé : sans limite de débit, pour mesurer l'assistant
+# et non le limiteur, et avec max_concurrency appels simultanés
+def stub_llm_client(server, max_concurrency):
+    return LLMClient(api_base=server.url, max_concurrency=max_concurrency, rate_limiter=TokenBucket(rate=0))
@@ -0,0 +1 @@
+# Briques communes à l'API FastAPI et aux applications Streamlit
@@ -0,0 +1,128 @@
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from .config import ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_SIMILARITY, ANSWER_CACHE_TTL_SECONDS
+from .retrieval import STOPWORDS, WORD_PATTERN, normalize_text, singular
+
+# Question normalisée pour le niveau exact : minuscules, sans accents ni ponctuation
+def normalize_question(question):
+    return " ".join(WORD_PATTERN.findall(normalize_text(question)))
+
+# Mots qui inversent le sens d'une question (sans accents, comme après normalize_text) :
+# ils restent dans le vecteur même quand ils font partie des mots vides de la recherche
+NEGATION_WORDS = frozenset({"ne", "n", "pas", "non", "jamais", "aucun", "aucune", "rien", "ni", "sans"})
+
+# Termes d'une question : mots de la recherche (sans mots vides), négations comprises
+def question_terms(question):
+    return [
+        singular(word) for word in WORD_PATTERN.findall(normalize_text(question))
+        if word not in STOPWORDS or word in NEGATION_WORDS
+    ]
+
+# Ensemble des termes d'une question : deux questions ne sont des quasi-doublons que si elles
+# ont exactement les mêmes. Un seul mot décisif qui diffère (formule, âge, montant, type de soins,
+# négation) change la réponse : "formule gold" / "formule bronze", "moins de 12 ans" / "de 16 ans".
+def question_term_set(question):
+    return frozenset(question_terms(question))
+
+# Vecteur de termes d'une question, normé pour le calcul du cosinus
+def question_vector(question):
+    terms = Counter(question_terms(question))
+    norm = math.sqrt(sum(count * count for count in terms.values()))
+    return {term: count / norm for term, count in terms.items()} if norm else {}
+
+def cosine(left, right):
+    if len(left) > len(right):
+        left, right = right, left
+    return sum(weight * right.get(term, 0.0) for term, weight in left.items())
+
+# Cache des réponses aux questions fréquentes, en deux niveaux :
+# - exact : même question une fois normalisée ;
+# - quasi-doublon (désactivé par défaut) : question formée des mêmes termes qu'une question en cache
+#   (ordre des mots, mots vides, pluriels près) et dont le cosinus avec elle dépasse similarity_threshold.
+# Les entrées sont liées à une version de la base de connaissances : un changement de version
+# vide le cache. Éviction LRU au-delà de max_entries et expiration après ttl_seconds.
+class AnswerCache:
+    def __init__(self, max_entries=ANSWER_CACHE_MAX_ENTRIES, ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+                 similarity_threshold=ANSWER_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.version = None
+        self._entries = OrderedDict()
+        # Question la plus récente en cache pour chaque ensemble de termes (niveau quasi-doublon)
+        self._by_terms = {}
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _check_version(self, version):
+        if version != self.version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._by_terms.clear()
+            self.version = version
+
+    def _expire(self):
+        now = time.time()
+        while self._entries:
+            key, (created_at, _, terms, _) = next(iter(self._entries.items()))
+            if len(self._entries) > self.max_entries or now - created_at > self.ttl_seconds:
+                del self._entries[key]
+                if self._by_terms.get(terms) == key:
+                    del self._by_terms[terms]
+            else:
+                break
+
+    # Réponse en cache pour une question : (réponse, "exact" ou "similar"), ou None
+    def get(self, question, version):
+        key = normalize_question(question)
+        with self._lock:
+            self._check_version(version)
+            self._expire()
+            now = time.time()
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry[3], "exact"
+
+            if self.similarity_threshold > 0:
+                candidate_key = self._by_terms.get(question_term_set(question))
+                candidate = self._entries.get(candidate_key) if candidate_key is not None else None
+                if (candidate is not None and now - candidate[0] <= self.ttl_seconds
+                        and cosine(question_vector(question), candidate[1]) >= self.similarity_threshold):
+                    self._entries.move_to_end(candidate_key)
+                    self.similar_hits += 1
+                    return candidate[3], "similar"
+
+            self.misses += 1
+            return None
+
+    def put(self, question, version, answer):
+        key = normalize_question(question)
+        with self._lock:
+            self._check_version(version)
+            terms = question_term_set(question)
+            self._entries[key] = (time.time(), question_vector(question), terms, answer)
+            self._entries.move_to_end(key)
+            self._by_terms[terms] = key
+            self._expire()
+
+    # Compteurs et taux de succès du cache
+    def stats(self):
+        with self._lock:
+            lookups = self.exact_hits + self.similar_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.similar_hits) / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,178 @@
+import hashlib
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from .config import CATALOGUE_DIRECTORY, CATALOGUE_MAX_FILE_BYTES, CATALOGUE_WATCH_SECONDS
+from .knowledge_base import file_state
+from .metrics import get_logger
+
+# Types de documents reconnus dans le nom des fichiers, dans l'ordre de priorité ;
+# un fichier dont le nom n'en contient aucun est de type "autre"
+DOCUMENT_TYPES = ("devis", "mandat", "notice", "attestation", "contrat")
+OTHER_TYPE = "autre"
+
+# Extensions proposées au téléchargement et type MIME de chacune
+MIME_TYPES = {
+    ".pdf": "application/pdf",
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+
+# Type d'un document d'après son nom de fichier
+def document_type(name):
+    lowered = name.lower()
+    return next((kind for kind in DOCUMENT_TYPES if kind in lowered), OTHER_TYPE)
+
+# Vrai si l'en-tête If-None-Match d'une requête désigne l'ETag donné (liste, forme faible W/ ou *)
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in (candidate.removeprefix("W/") for candidate in candidates)
+
+# Document du catalogue : métadonnées et contenu, gardé en mémoire.
+# Le contenu est une copie et non une projection du fichier (mmap) : un fichier remplacé ou tronqué
+# sur le disque pendant qu'on le sert ne peut pas interrompre le processus.
+@dataclass(frozen=True)
+class CatalogueEntry:
+    name: str
+    document_type: str
+    mime: str
+    content: bytes = field(repr=False)
+    etag: str
+    modified: float
+
+    @property
+    def size(self):
+        return len(self.content)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "type": self.document_type,
+            "mime": self.mime,
+            "size": self.size,
+            "etag": self.etag,
+            "modified": self.modified,
+        }
+
+# Lire un fichier du catalogue ; l'ETag est l'empreinte SHA-256 de son contenu
+def read_catalogue_entry(file_path, max_bytes=CATALOGUE_MAX_FILE_BYTES):
+    stat = file_path.stat()
+    if stat.st_size > max_bytes:
+        raise ValueError(f"Fichier trop volumineux pour le catalogue (maximum {max_bytes / (1024 * 1024):g} Mo).")
+    content = file_path.read_bytes()
+    return CatalogueEntry(
+        name=file_path.name,
+        document_type=document_type(file_path.name),
+        mime=MIME_TYPES[file_path.suffix.lower()],
+        content=content,
+        etag=f'"{hashlib.sha256(content).hexdigest()}"',
+        modified=stat.st_mtime,
+    )
+
+# Fichiers du dossier proposés au téléchargement, par ordre de nom (aucun si le dossier n'existe pas)
+def list_catalogue_files(directory_path):
+    directory = Path(directory_path)
+    if not directory.is_dir():
+        return []
+    return [path for path in sorted(directory.iterdir()) if path.is_file() and path.suffix.lower() in MIME_TYPES]
+
+# Version figée du catalogue : documents par nom et par type (dans l'ordre des noms)
+@dataclass(frozen=True)
+class CatalogueSnapshot:
+    number: int
+    entries: dict = field(default_factory=dict)
+    by_type: dict = field(default_factory=dict)
+    file_states: dict = field(default_factory=dict)
+    errors: dict = field(default_factory=dict)
+
+# Catalogue des documents à télécharger (devis...) d'un dossier, construit une fois puis rechargé
+# quand un fichier est ajouté, modifié ou supprimé. Les recherches se font dans la version publiée,
+# en mémoire : ni parcours du dossier ni lecture de fichier pendant une requête.
+class DocumentCatalogue:
+    def __init__(self, directory_path=CATALOGUE_DIRECTORY, max_bytes=CATALOGUE_MAX_FILE_BYTES):
+        self.directory_path = Path(directory_path)
+        self.max_bytes = max_bytes
+        self.snapshot = CatalogueSnapshot(0)
+        self._refresh_lock = threading.Lock()
+        self._stop_watching = None
+
+    # Premier document d'un type ("devis"...), ou None
+    def find(self, kind):
+        entries = self.snapshot.by_type.get(kind.lower(), ())
+        return entries[0] if entries else None
+
+    # Document par nom de fichier, ou None
+    def get(self, name):
+        return self.snapshot.entries.get(name)
+
+    # Charger ou recharger le catalogue ; seuls les fichiers ajoutés ou modifiés sont relus.
+    # Retourne le résumé des changements, ou None si rien n'a changé.
+    def refresh(self):
+        with self._refresh_lock:
+            current = self.snapshot
+            file_paths = list_catalogue_files(self.directory_path)
+            states = {path.name: file_state(path) for path in file_paths}
+            if states == current.file_states and current.number > 0:
+                return None
+
+            entries = {}
+            errors = {}
+            changed = []
+            for path in file_paths:
+                if current.file_states.get(path.name) == states[path.name] and path.name in current.entries:
+                    entries[path.name] = current.entries[path.name]
+                    continue
+                try:
+                    entries[path.name] = read_catalogue_entry(path, self.max_bytes)
+                    changed.append(path.name)
+                except (OSError, ValueError) as e:
+                    errors[path.name] = str(e)
+
+            by_type = {}
+            for entry in entries.values():
+                by_type.setdefault(entry.document_type, []).append(entry)
+            by_type = {kind: tuple(kind_entries) for kind, kind_entries in by_type.items()}
+
+            self.snapshot = CatalogueSnapshot(current.number + 1, entries, by_type, states, errors)
+            return {
+                "number": self.snapshot.number,
+                "changed": changed,
+                "removed": [name for name in current.entries if name not in entries],
+                "errors": errors,
+            }
+
+    # Compteurs exposés par l'API
+    def stats(self):
+        snapshot = self.snapshot
+        return {
+            "number": snapshot.number,
+            "documents": len(snapshot.entries),
+            "bytes": sum(entry.size for entry in snapshot.entries.values()),
+            "types": {kind: len(entries) for kind, entries in snapshot.by_type.items()},
+            "errors": snapshot.errors,
+        }
+
+    # Surveiller le dossier en tâche de fond, toutes les interval secondes
+    def start_watching(self, interval=CATALOGUE_WATCH_SECONDS):
+        if interval <= 0 or self._stop_watching is not None:
+            return
+        stop = threading.Event()
+        self._stop_watching = stop
+
+        def watch():
+            while not stop.wait(interval):
+                try:
+                    changes = self.refresh()
+                    if changes:
+                        get_logger().info("Catalogue rechargé : %s", changes)
+                except Exception as e:
+                    get_logger().exception("Erreur lors du rechargement du catalogue : %s", e)
+
+        threading.Thread(target=watch, name="catalogue-watcher", daemon=True).start()
+
+    def stop_watching(self):
+        if self._stop_watching is not None:
+            self._stop_watching.set()
+            self._stop_watching = None
@@ -0,0 +1,199 @@
+import hashlib
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+
+import numpy as np
+
+from .config import DEDUP_MIN_WORDS, DEDUP_SIMILARITY
+from .metrics import get_logger
+from .tokens import count_text_tokens
+
+# Séparateur des pages dans le texte des PDF (voir documents.read_text_from_pdf)
+PAGE_BREAK = "\f"
+
+# Lignes examinées en haut et en bas de chaque page pour repérer les en-têtes et pieds de page,
+# et part minimale des pages où une ligne doit se répéter pour être retirée
+FURNITURE_EDGE_LINES = 3
+FURNITURE_MIN_SHARE = 0.5
+
+# Numéro de page seul sur sa ligne : "3", "Page 3", "p. 3", "3 / 12", "Page 3 sur 12"
+PAGE_NUMBER = re.compile(r"^(page|p\.)?\s*\d{1,4}(\s*(/|sur|of)\s*\d{1,4})?$", re.IGNORECASE)
+
+# Documents dont chaque ligne est une ligne de tableau indexée par sa clé : jamais dédoublonnés
+TABLE_SUFFIXES = (".xlsx",)
+
+# MinHash : mots par fragment comparé, nombre de fonctions de hachage, et découpage de la
+# signature en bandes pour ne comparer que les paragraphes qui partagent au moins une bande
+SHINGLE_WORDS = 5
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16
+
+# Caractères par token retenus pour estimer la taille d'un texte sans le tokenizer
+CHARS_PER_TOKEN = 4
+
+_tokenizer_unavailable = False
+
+_SPACES = re.compile(r"[ \t\u00a0]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+_DIGITS = re.compile(r"\d+")
+_WORDS = re.compile(r"\w+")
+
+_rng = np.random.default_rng(20240401)
+_MULTIPLIERS = _rng.integers(1, 2 ** 63, MINHASH_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+_INCREMENTS = _rng.integers(0, 2 ** 63, MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+# Ce que le nettoyage a retiré d'un document, et les tokens gagnés
+@dataclass
+class CleaningReport:
+    tokens_before: int = 0
+    tokens_after: int = 0
+    furniture_lines: int = 0
+    duplicate_paragraphs: int = 0
+
+    @property
+    def tokens_saved(self):
+        return self.tokens_before - self.tokens_after
+
+    def to_dict(self):
+        return {
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "tokens_saved": self.tokens_saved,
+            "furniture_lines": self.furniture_lines,
+            "duplicate_paragraphs": self.duplicate_paragraphs,
+        }
+
+# Taille d'un texte pour les rapports de nettoyage, en tokens. Le rapport n'est qu'indicatif :
+# si le tokenizer est indisponible (encodage tiktoken non téléchargé, par exemple), la taille est
+# estimée d'après le nombre de caractères, et le nettoyage comme l'indexation n'en dépendent pas.
+def report_tokens(text):
+    global _tokenizer_unavailable
+    if not _tokenizer_unavailable:
+        try:
+            return count_text_tokens(text)
+        except Exception as e:
+            _tokenizer_unavailable = True
+            get_logger().warning("Tokenizer indisponible, tailles des rapports de nettoyage estimées : %s", e)
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+# Espaces et tabulations regroupés, lignes sans blancs en début et en fin,
+# au plus une ligne vide de suite
+def collapse_whitespace(text):
+    lines = (_SPACES.sub(" ", line).strip() for line in text.replace("\r\n", "\n").replace("\r", "\n").split("\n"))
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+
+# Forme d'une ligne comparée d'une page à l'autre : les numéros (de page, de date) ne comptent pas
+def _furniture_key(line):
+    return _DIGITS.sub("#", line.lower())
+
+# Positions des premières et dernières lignes non vides d'une page
+def _edge_positions(lines):
+    filled = [position for position, line in enumerate(lines) if line]
+    return set(filled[:FURNITURE_EDGE_LINES] + filled[-FURNITURE_EDGE_LINES:])
+
+# Retirer des pages les numéros de page et les lignes répétées en haut ou en bas de la plupart
+# des pages (en-têtes, pieds de page, références du document).
+# Retourne les pages nettoyées et le nombre de lignes retirées.
+def strip_page_furniture(pages):
+    pages = [[_SPACES.sub(" ", line).strip() for line in page.split("\n")] for page in pages]
+    edges = [_edge_positions(lines) for lines in pages]
+
+    repeated = set()
+    if len(pages) >= 2:
+        counts = Counter()
+        for lines, positions in zip(pages, edges):
+            counts.update({_furniture_key(lines[position]) for position in positions})
+        minimum = max(2, math.ceil(len(pages) * FURNITURE_MIN_SHARE))
+        repeated = {key for key, count in counts.items() if count >= minimum}
+
+    cleaned = []
+    removed = 0
+    for lines, positions in zip(pages, edges):
+        kept = []
+        for position, line in enumerate(lines):
+            if position in positions and (PAGE_NUMBER.match(line) or _furniture_key(line) in repeated):
+                removed += 1
+                continue
+            kept.append(line)
+        cleaned.append("\n".join(kept))
+    return cleaned, removed
+
+# Nettoyer le texte d'un document : en-têtes, pieds de page et numéros de page des PDF,
+# puis blancs superflus. Retourne le texte et le nombre de lignes de mise en page retirées.
+def normalize_document(text):
+    removed = 0
+    if PAGE_BREAK in text:
+        pages, removed = strip_page_furniture(text.split(PAGE_BREAK))
+        text = "\n".join(pages)
+    return collapse_whitespace(text), removed
+
+# Signature MinHash d'un paragraphe : pour chaque fonction de hachage, la plus petite valeur
+# prise sur ses fragments de SHINGLE_WORDS mots consécutifs
+def minhash_signature(words):
+    shingles = {" ".join(words[start:start + SHINGLE_WORDS]) for start in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little") for shingle in shingles),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+    with np.errstate(over="ignore"):
+        permuted = _MULTIPLIERS[:, None] * hashes[None, :] + _INCREMENTS[:, None]
+    return permuted.min(axis=1)
+
+# Retirer les paragraphes (lignes) presque identiques à un paragraphe d'un document précédent
+# (textes réglementaires ou mentions reprises d'un document à l'autre) : la première occurrence,
+# dans l'ordre des documents, est gardée. Les répétitions internes à un document (lignes de
+# tableau, formules) sont conservées, de même que les paragraphes de moins de min_words mots
+# et les tableaux. Retourne les documents (nom, texte) et le nombre de paragraphes retirés par document.
+def deduplicate_documents(documents, similarity=DEDUP_SIMILARITY, min_words=DEDUP_MIN_WORDS):
+    removed = {name: 0 for name, _ in documents}
+    if similarity <= 0:
+        return list(documents), removed
+
+    rows = MINHASH_PERMUTATIONS // MINHASH_BANDS
+    buckets = {}
+    signatures = []
+    result = []
+    for name, text in documents:
+        if name.endswith(TABLE_SUFFIXES):
+            result.append((name, text))
+            continue
+        kept = []
+        seen = []
+        for line in text.split("\n"):
+            words = _WORDS.findall(line.lower())
+            if len(words) < min_words:
+                kept.append(line)
+                continue
+            signature = minhash_signature(words)
+            bands = [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(MINHASH_BANDS)]
+            candidates = {number for band in bands for number in buckets.get(band, ())}
+            if any(np.mean(signatures[number] == signature) >= similarity for number in candidates):
+                removed[name] += 1
+                continue
+            seen.append((signature, bands))
+            kept.append(line)
+        # Les paragraphes du document ne servent de référence qu'aux documents suivants
+        for signature, bands in seen:
+            for band in bands:
+                buckets.setdefault(band, []).append(len(signatures))
+            signatures.append(signature)
+        result.append((name, _BLANK_LINES.sub("\n\n", "\n".join(kept)).strip()))
+    return result, removed
+
+# Nettoyer un ensemble de documents (nom, texte brut) avant indexation : mise en page et blancs,
+# puis paragraphes en double. Retourne les documents nettoyés et un rapport par document.
+def clean_documents(documents, similarity=DEDUP_SIMILARITY):
+    normalized = []
+    reports = {}
+    for name, text in documents:
+        cleaned, furniture = normalize_document(text)
+        normalized.append((name, cleaned))
+        reports[name] = CleaningReport(report_tokens(text), furniture_lines=furniture)
+    deduplicated, removed = deduplicate_documents(normalized, similarity)
+    for name, text in deduplicated:
+        reports[name].duplicate_paragraphs = removed[name]
+        reports[name].tokens_after = report_tokens(text)
+    return deduplicated, reports
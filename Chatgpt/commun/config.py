@@ -0,0 +1,140 @@
+import os
+from pathlib import Path
+
+# Paramètres partagés par l'API et les applications Streamlit.
+# Chaque valeur peut être surchargée par une variable d'environnement.
+
+# Modèle utilisé pour les réponses et le comptage des tokens
+OPENAI_MODEL = os.environ.get("ASSISTANT_OPENAI_MODEL", "gpt-4o-mini")
+
+# Découpage de la base de connaissances en passages indexables
+CHUNK_MAX_CHARS = int(os.environ.get("ASSISTANT_CHUNK_MAX_CHARS", "1200"))
+
+# Nombre maximal de passages envoyés au modèle pour une question
+RETRIEVAL_TOP_K = int(os.environ.get("ASSISTANT_RETRIEVAL_TOP_K", "8"))
+
+# Budget de tokens alloué aux passages de la base de connaissances
+RETRIEVAL_TOKEN_BUDGET = int(os.environ.get("ASSISTANT_RETRIEVAL_TOKEN_BUDGET", "3000"))
+
+# Cache sur disque du texte extrait des documents (chaîne vide pour le désactiver)
+DOCUMENT_CACHE_PATH = os.environ.get(
+    "ASSISTANT_DOCUMENT_CACHE", str(Path(__file__).resolve().parent.parent / ".cache" / "documents.sqlite3")
+)
+
+# Nombre de processus pour analyser les documents (1 = analyse séquentielle)
+INGESTION_WORKERS = int(os.environ.get("ASSISTANT_INGESTION_WORKERS", "1"))
+
+# Nettoyage des documents avant indexation : seuil de similarité (estimée par MinHash) au-delà
+# duquel un paragraphe déjà vu dans la base est retiré (0 = pas de dédoublonnage), et nombre
+# minimal de mots d'un paragraphe pour être comparé
+DEDUP_SIMILARITY = float(os.environ.get("ASSISTANT_DEDUP_SIMILARITY", "0.8"))
+DEDUP_MIN_WORDS = int(os.environ.get("ASSISTANT_DEDUP_MIN_WORDS", "8"))
+
+# OCR des PDF scannés : langues reconnues, utilisation du GPU et nombre de pages par lot
+OCR_LANGUAGES = os.environ.get("ASSISTANT_OCR_LANGUAGES", "fr").split(",")
+OCR_GPU = os.environ.get("ASSISTANT_OCR_GPU", "1") == "1"
+OCR_BATCH_SIZE = int(os.environ.get("ASSISTANT_OCR_BATCH_SIZE", "8"))
+
+# En dessous de ce nombre de caractères, la couche texte d'une page est jugée vide
+# (page scannée) et la page passe par l'OCR
+TEXT_LAYER_MIN_CHARS = int(os.environ.get("ASSISTANT_TEXT_LAYER_MIN_CHARS", "50"))
+
+# Sessions de conversation de l'API : stockage ("memory" ou "sqlite"), durée de vie,
+# nombre maximal de sessions conservées et taille maximale de l'historique gardé par session,
+# en tokens. Ce n'est qu'une borne de mémoire : l'historique envoyé au modèle est choisi
+# (et les échanges anciens résumés) par build_prompt, dans le budget du prompt.
+SESSION_BACKEND = os.environ.get("ASSISTANT_SESSION_BACKEND", "memory")
+SESSION_DB_PATH = os.environ.get(
+    "ASSISTANT_SESSION_DB", str(Path(__file__).resolve().parent.parent / ".cache" / "sessions.sqlite3")
+)
+SESSION_TTL_SECONDS = int(os.environ.get("ASSISTANT_SESSION_TTL_SECONDS", "3600"))
+SESSION_MAX_SESSIONS = int(os.environ.get("ASSISTANT_SESSION_MAX_SESSIONS", "10000"))
+SESSION_HISTORY_TOKEN_BUDGET = int(os.environ.get("ASSISTANT_SESSION_HISTORY_TOKEN_BUDGET", "20000"))
+
+# Budget total de tokens du prompt (consigne, contexte, PDF complémentaire, historique, question),
+# part réservée à l'historique récent et taille maximale du résumé des échanges plus anciens
+PROMPT_TOKEN_BUDGET = int(os.environ.get("ASSISTANT_PROMPT_TOKEN_BUDGET", "8000"))
+PROMPT_HISTORY_RESERVED_TOKENS = int(os.environ.get("ASSISTANT_PROMPT_HISTORY_RESERVED_TOKENS", "1500"))
+PROMPT_SUMMARY_MAX_TOKENS = int(os.environ.get("ASSISTANT_PROMPT_SUMMARY_MAX_TOKENS", "300"))
+
+# Disposition des messages du prompt : "prefix" range le contenu du plus stable au plus variable
+# (consigne, base de connaissances fixe, historique, puis passages, PDF et question), avec des blancs
+# normalisés, pour que le début du prompt reste identique d'un appel à l'autre et profite du cache
+# de prompt du fournisseur ; "legacy" garde l'ancienne disposition.
+PROMPT_LAYOUT = os.environ.get("ASSISTANT_PROMPT_LAYOUT", "prefix")
+
+# Base de connaissances fixe (base complète envoyée à chaque appel, voir build_prompt) : elle n'entre
+# pas dans PROMPT_TOKEN_BUDGET, qui reste celui de la partie variable du prompt, et n'est tronquée
+# qu'au-delà de cette limite (contexte du modèle), ce qui est alors signalé dans le détail du prompt
+PROMPT_STATIC_KNOWLEDGE_MAX_TOKENS = int(os.environ.get("ASSISTANT_PROMPT_STATIC_KNOWLEDGE_MAX_TOKENS", "100000"))
+
+# Nombre de textes dont le nombre de tokens est gardé en mémoire
+TOKEN_COUNT_CACHE_SIZE = int(os.environ.get("ASSISTANT_TOKEN_COUNT_CACHE_SIZE", "50000"))
+
+# Cache des réponses : nombre d'entrées, durée de vie et seuil de similarité (cosinus entre
+# questions formées des mêmes termes) du niveau « quasi-doublon » ; 0 (par défaut) désactive ce
+# niveau, seules les questions identiques une fois normalisées sont alors servies par le cache
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ASSISTANT_ANSWER_CACHE_MAX_ENTRIES", "2000"))
+ANSWER_CACHE_TTL_SECONDS = int(os.environ.get("ASSISTANT_ANSWER_CACHE_TTL_SECONDS", "86400"))
+ANSWER_CACHE_SIMILARITY = float(os.environ.get("ASSISTANT_ANSWER_CACHE_SIMILARITY", "0"))
+
+# Intervalle de surveillance du dossier de contexte pour le rechargement à chaud (0 = désactivé)
+KNOWLEDGE_WATCH_SECONDS = float(os.environ.get("ASSISTANT_KNOWLEDGE_WATCH_SECONDS", "0"))
+
+# File d'extraction des PDF envoyés à l'API : nombre de workers, nombre maximal de PDF en attente
+# (au-delà, les envois sont refusés), nombre de documents extraits gardés en mémoire et attente
+# maximale d'une question dont le PDF joint est en cours d'extraction
+EXTRACTION_WORKERS = int(os.environ.get("ASSISTANT_EXTRACTION_WORKERS", "1"))
+EXTRACTION_QUEUE_SIZE = int(os.environ.get("ASSISTANT_EXTRACTION_QUEUE_SIZE", "16"))
+EXTRACTION_MAX_DOCUMENTS = int(os.environ.get("ASSISTANT_EXTRACTION_MAX_DOCUMENTS", "1000"))
+EXTRACTION_WAIT_SECONDS = float(os.environ.get("ASSISTANT_EXTRACTION_WAIT_SECONDS", "300"))
+
+# PDF complémentaires : taille maximale d'un envoi, taille des morceaux lus à la fois
+# et nombre maximal de pages d'un document
+UPLOAD_MAX_BYTES = int(os.environ.get("ASSISTANT_UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = int(os.environ.get("ASSISTANT_UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+UPLOAD_MAX_PAGES = int(os.environ.get("ASSISTANT_UPLOAD_MAX_PAGES", "200"))
+
+# Budget de tokens du texte des PDF complémentaires dans le prompt : l'extraction s'arrête
+# dès qu'il est atteint, les pages suivantes seraient de toute façon tronquées (0 = sans limite)
+SUPPLEMENTAL_TOKEN_BUDGET = int(os.environ.get("ASSISTANT_SUPPLEMENTAL_TOKEN_BUDGET", "3000"))
+
+# Client du modèle : adresse de l'API (à remplacer par un serveur local pour les essais),
+# délai maximal d'un appel, nombre de nouvelles tentatives sur 429/5xx et délais d'attente
+# entre tentatives (exponentiels, avec une part aléatoire)
+LLM_API_BASE = os.environ.get("ASSISTANT_LLM_API_BASE", "https://api.openai.com/v1")
+LLM_TIMEOUT_SECONDS = float(os.environ.get("ASSISTANT_LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_RETRIES = int(os.environ.get("ASSISTANT_LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_SECONDS = float(os.environ.get("ASSISTANT_LLM_BACKOFF_SECONDS", "0.5"))
+LLM_BACKOFF_MAX_SECONDS = float(os.environ.get("ASSISTANT_LLM_BACKOFF_MAX_SECONDS", "20"))
+
+# Limites du client du modèle : requêtes par seconde (0 = sans limite) et rafale autorisée,
+# appels simultanés, connexions HTTP gardées ouvertes, et disjoncteur (nombre d'échecs
+# consécutifs avant d'arrêter les appels, durée de la coupure)
+LLM_REQUESTS_PER_SECOND = float(os.environ.get("ASSISTANT_LLM_REQUESTS_PER_SECOND", "5"))
+LLM_BURST = int(os.environ.get("ASSISTANT_LLM_BURST", "10"))
+LLM_MAX_CONCURRENCY = int(os.environ.get("ASSISTANT_LLM_MAX_CONCURRENCY", "8"))
+LLM_POOL_SIZE = int(os.environ.get("ASSISTANT_LLM_POOL_SIZE", "16"))
+LLM_BREAKER_THRESHOLD = int(os.environ.get("ASSISTANT_LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.environ.get("ASSISTANT_LLM_BREAKER_RESET_SECONDS", "30"))
+
+# Index enregistré pour le mode multi-workers : dossier où le processus principal l'écrit, et index
+# à projeter en mémoire au démarrage (rempli par le lanceur ; vide = analyser le dossier de contexte)
+INDEX_STORE_DIRECTORY = os.environ.get(
+    "ASSISTANT_INDEX_STORE_DIRECTORY", str(Path(__file__).resolve().parent.parent / ".cache" / "index")
+)
+INDEX_STORE = os.environ.get("ASSISTANT_INDEX_STORE", "")
+
+# Préchauffage lancé en arrière-plan au démarrage (l'application répond pendant ce temps), étapes
+# séparées par des virgules : documents (PyPDF2, python-docx, pandas), pdf (PyMuPDF), ocr (EasyOCR,
+# torch et modèles de reconnaissance), tokens (encodeur tiktoken). Vide = chaque dépendance
+# est chargée au premier traitement qui en a besoin.
+WARMUP_STEPS = [step.strip() for step in os.environ.get("ASSISTANT_WARMUP", "").split(",") if step.strip()]
+
+# Catalogue des documents proposés au téléchargement (devis...) : dossier, taille maximale d'un
+# fichier gardé en mémoire, et intervalle de surveillance du dossier (0 = chargé une seule fois)
+CATALOGUE_DIRECTORY = os.environ.get(
+    "ASSISTANT_CATALOGUE_DIRECTORY", str(Path(__file__).resolve().parent.parent / "streamlit" / "fichier")
+)
+CATALOGUE_MAX_FILE_BYTES = int(os.environ.get("ASSISTANT_CATALOGUE_MAX_FILE_BYTES", str(20 * 1024 * 1024)))
+CATALOGUE_WATCH_SECONDS = float(os.environ.get("ASSISTANT_CATALOGUE_WATCH_SECONDS", "30"))
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+
+from .config import DOCUMENT_CACHE_PATH
+
+# À incrémenter quand l'extraction du texte change, pour invalider les entrées existantes
+PARSER_VERSION = 3
+
+# Taille des blocs lus pour calculer l'empreinte d'un fichier
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Empreinte SHA-256 du contenu d'un fichier
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Cache sur disque du texte extrait des documents.
+# La table files associe (chemin, taille, mtime) à l'empreinte du contenu : si ces trois valeurs
+# n'ont pas changé, le fichier n'est même pas relu. La table blobs stocke le texte compressé
+# par empreinte, si bien qu'un fichier renommé ou copié n'est pas analysé une seconde fois.
+class DocumentCache:
+    def __init__(self, path=DOCUMENT_CACHE_PATH):
+        self.path = Path(path)
+        self.hits = 0
+        self.misses = 0
+        # Consultations des textes des PDF envoyés à l'API, comptées à part de la base de connaissances
+        self.upload_hits = 0
+        self.upload_misses = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sha256 TEXT)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                "sha256 TEXT, parser_version INTEGER, text BLOB, PRIMARY KEY (sha256, parser_version))"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS uploads ("
+                "sha256 TEXT, parser_version INTEGER, text BLOB, pages TEXT, PRIMARY KEY (sha256, parser_version))"
+            )
+
+    @contextmanager
+    def _connect(self):
+        # Une connexion par opération : Streamlit exécute les reruns dans des threads différents
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _read_blob(self, connection, sha256):
+        row = connection.execute(
+            "SELECT text FROM blobs WHERE sha256 = ? AND parser_version = ?", (sha256, PARSER_VERSION)
+        ).fetchone()
+        return zlib.decompress(row[0]).decode("utf-8") if row else None
+
+    # Chercher le texte d'un fichier en cache.
+    # Retourne (texte ou None, empreinte) ; l'empreinte sert ensuite à store().
+    def lookup(self, file_path):
+        file_path = Path(file_path)
+        stat = file_path.stat()
+        key = str(file_path.resolve())
+
+        with self._lock, self._connect() as connection:
+            row = connection.execute(
+                "SELECT size, mtime_ns, sha256 FROM files WHERE path = ?", (key,)
+            ).fetchone()
+            if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+                text = self._read_blob(connection, row[2])
+                if text is not None:
+                    self.hits += 1
+                    return text, (key, stat, row[2])
+
+            sha256 = file_sha256(file_path)
+            fingerprint = (key, stat, sha256)
+            text = self._read_blob(connection, sha256)
+            if text is not None:
+                self.hits += 1
+                self._remember_file(connection, key, stat, sha256)
+                return text, fingerprint
+
+            self.misses += 1
+            return None, fingerprint
+
+    # Enregistrer le texte extrait d'un fichier absent du cache
+    def store(self, fingerprint, text):
+        key, stat, sha256 = fingerprint
+        with self._lock, self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO blobs (sha256, parser_version, text) VALUES (?, ?, ?)",
+                (sha256, PARSER_VERSION, zlib.compress(text.encode("utf-8"))),
+            )
+            self._remember_file(connection, key, stat, sha256)
+
+    # Texte d'un fichier, extrait par loader uniquement s'il n'est pas déjà en cache
+    def get_text(self, file_path, loader):
+        text, fingerprint = self.lookup(file_path)
+        if text is None:
+            # L'extraction se fait hors verrou : elle peut être longue
+            text = loader(file_path)
+            self.store(fingerprint, text)
+        return text
+
+    def _remember_file(self, connection, key, stat, sha256):
+        connection.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+            (key, stat.st_size, stat.st_mtime_ns, sha256),
+        )
+        self._delete_orphan_blobs(connection)
+
+    # Supprimer les textes qui ne correspondent plus à aucun fichier connu
+    def _delete_orphan_blobs(self, connection):
+        connection.execute(
+            "DELETE FROM blobs WHERE sha256 NOT IN (SELECT sha256 FROM files) OR parser_version != ?",
+            (PARSER_VERSION,),
+        )
+
+    # Oublier les fichiers d'un dossier qui n'en font plus partie (supprimés ou renommés),
+    # puis les textes qui ne servent plus à aucun fichier. file_paths : fichiers actuels du dossier.
+    # Retourne le nombre de fichiers oubliés.
+    def prune(self, directory_path, file_paths):
+        prefix = str(Path(directory_path).resolve()) + os.sep
+        keep = {str(Path(file_path).resolve()) for file_path in file_paths}
+        with self._lock, self._connect() as connection:
+            stale = [
+                (path,) for (path,) in connection.execute("SELECT path FROM files")
+                if path.startswith(prefix) and path not in keep
+            ]
+            if stale:
+                connection.executemany("DELETE FROM files WHERE path = ?", stale)
+                self._delete_orphan_blobs(connection)
+        return len(stale)
+
+    # Texte déjà extrait d'un fichier envoyé à l'API, par empreinte de son contenu :
+    # (texte, détail des pages) ou None
+    def get_upload(self, sha256):
+        with self._lock, self._connect() as connection:
+            row = connection.execute(
+                "SELECT text, pages FROM uploads WHERE sha256 = ? AND parser_version = ?", (sha256, PARSER_VERSION)
+            ).fetchone()
+        if row is None:
+            self.upload_misses += 1
+            return None
+        self.upload_hits += 1
+        return zlib.decompress(row[0]).decode("utf-8"), json.loads(row[1])
+
+    # Enregistrer le texte extrait d'un fichier envoyé à l'API
+    def store_upload(self, sha256, text, pages):
+        with self._lock, self._connect() as connection:
+            connection.execute(
+                "DELETE FROM uploads WHERE parser_version != ?", (PARSER_VERSION,)
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO uploads (sha256, parser_version, text, pages) VALUES (?, ?, ?, ?)",
+                (sha256, PARSER_VERSION, zlib.compress(text.encode("utf-8")), json.dumps(pages)),
+            )
+
+    # Compteurs de succès et d'échecs du cache : documents de la base, puis PDF envoyés à l'API
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "upload_hits": self.upload_hits,
+            "upload_misses": self.upload_misses,
+        }
+
+_document_cache = None
+
+# Cache partagé par tout le processus, ou None si désactivé (ASSISTANT_DOCUMENT_CACHE vide)
+def get_document_cache():
+    global _document_cache
+    if _document_cache is None and DOCUMENT_CACHE_PATH:
+        try:
+            _document_cache = DocumentCache(DOCUMENT_CACHE_PATH)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Cache des documents indisponible, lecture directe des fichiers : {e}")
+            return None
+    return _document_cache
@@ -0,0 +1,152 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from .cleaning import PAGE_BREAK, clean_documents
+from .config import INGESTION_WORKERS
+from .document_cache import get_document_cache
+from .lazy_imports import load
+from .spreadsheets import read_text_from_excel
+
+# Extensions prises en charge dans le dossier de contexte
+SUPPORTED_SUFFIXES = (".docx", ".pdf", ".xlsx")
+
+# Lire le texte d'un fichier Word
+def read_text_from_word(file_path):
+    doc = load("docx").Document(file_path)
+    return "\n".join([paragraph.text.strip() for paragraph in doc.paragraphs if paragraph.text.strip()])
+
+# Lire le texte d'un fichier PDF ; les pages sont séparées par PAGE_BREAK pour que le nettoyage
+# repère les en-têtes et pieds de page (voir cleaning.normalize_document)
+def read_text_from_pdf(file_path):
+    pdf_reader = load("PyPDF2").PdfReader(file_path)
+    return PAGE_BREAK.join([page.extract_text() for page in pdf_reader.pages if page.extract_text()])
+
+READERS = {
+    ".docx": read_text_from_word,
+    ".pdf": read_text_from_pdf,
+    ".xlsx": read_text_from_excel,
+}
+
+ERROR_MESSAGES = {
+    ".docx": "Erreur lors de la lecture du fichier Word",
+    ".pdf": "Erreur lors de la lecture du fichier PDF",
+    ".xlsx": "Erreur lors de la lecture du fichier Excel",
+}
+
+# Charger le contenu d'un fichier Word
+def load_text_from_word(file_path):
+    try:
+        return read_text_from_word(file_path)
+    except Exception as e:
+        return f"{ERROR_MESSAGES['.docx']} : {e}"
+
+# Charger le contenu d'un fichier PDF
+def load_text_from_pdf(file_path):
+    try:
+        return read_text_from_pdf(file_path)
+    except Exception as e:
+        return f"{ERROR_MESSAGES['.pdf']} : {e}"
+
+# Charger le contenu d'un fichier Excel
+def load_text_from_excel(file_path):
+    try:
+        return read_text_from_excel(file_path)
+    except Exception as e:
+        return f"{ERROR_MESSAGES['.xlsx']} : {e}"
+
+# Lire le texte d'un fichier selon son extension (lève une exception en cas d'échec)
+def read_text_from_file(file_path):
+    return READERS[Path(file_path).suffix](file_path)
+
+# Résultat du chargement d'un dossier : les documents lus, dans l'ordre des noms de fichiers,
+# les fichiers en échec avec leur message d'erreur (jamais mélangés au corpus) et, une fois
+# les documents nettoyés, ce que le nettoyage a retiré de chacun (cleaning.CleaningReport)
+@dataclass
+class IngestionResult:
+    documents: list = field(default_factory=list)
+    errors: list = field(default_factory=list)
+    reports: dict = field(default_factory=dict)
+
+# Analyser tous les documents pris en charge d'un dossier, puis les nettoyer : mise en page
+# des PDF, blancs superflus et paragraphes en double d'un document à l'autre.
+# Les fichiers déjà en cache sont relus depuis le cache ; les autres sont analysés
+# dans un pool de workers processus si workers > 1.
+def ingest_directory(directory_path, cache=None, workers=INGESTION_WORKERS):
+    file_paths = list_supported_files(directory_path)
+    result = ingest_files(file_paths, cache, workers)
+    prune_cache(directory_path, file_paths, cache)
+    result.documents, result.reports = clean_documents(result.documents)
+    return result
+
+# Fichiers pris en charge d'un dossier, triés par nom pour garder un ordre stable
+def list_supported_files(directory_path):
+    return [path for path in sorted(Path(directory_path).iterdir()) if path.suffix in SUPPORTED_SUFFIXES]
+
+# Retirer du cache les fichiers qui ne sont plus dans le dossier, et leurs textes
+def prune_cache(directory_path, file_paths, cache=None):
+    cache = cache if cache is not None else get_document_cache()
+    return cache.prune(directory_path, file_paths) if cache is not None else 0
+
+# Analyser une liste de fichiers (voir ingest_directory), sans nettoyage : le texte est celui
+# des fichiers. Le résultat suit l'ordre de la liste.
+def ingest_files(file_paths, cache=None, workers=INGESTION_WORKERS):
+    cache = cache if cache is not None else get_document_cache()
+
+    texts = {}
+    errors = {}
+    pending = []
+    for file_path in file_paths:
+        try:
+            text, fingerprint = cache.lookup(file_path) if cache is not None else (None, None)
+        except Exception as e:
+            errors[file_path] = f"{ERROR_MESSAGES[file_path.suffix]} : {e}"
+            continue
+        if text is None:
+            pending.append((file_path, fingerprint))
+        else:
+            texts[file_path] = text
+
+    if workers > 1 and len(pending) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending))) as executor:
+            futures = [(file_path, fingerprint, executor.submit(read_text_from_file, file_path))
+                       for file_path, fingerprint in pending]
+            outcomes = [(file_path, fingerprint, _call_outcome(future.result)) for file_path, fingerprint, future in futures]
+    else:
+        outcomes = [(file_path, fingerprint, _call_outcome(read_text_from_file, file_path))
+                    for file_path, fingerprint in pending]
+
+    for file_path, fingerprint, (text, error) in outcomes:
+        if error is not None:
+            errors[file_path] = f"{ERROR_MESSAGES[file_path.suffix]} : {error}"
+            continue
+        texts[file_path] = text
+        if cache is not None:
+            cache.store(fingerprint, text)
+
+    result = IngestionResult()
+    for file_path in file_paths:
+        if file_path in texts:
+            result.documents.append((file_path.name, texts[file_path]))
+        else:
+            result.errors.append((file_path.name, errors[file_path]))
+    return result
+
+# (résultat, None) si l'appel réussit, (None, exception) sinon
+def _call_outcome(function, *args):
+    try:
+        return function(*args), None
+    except Exception as e:
+        return None, e
+
+# Charger chaque document du dossier séparément, sous forme de couples (nom, texte).
+# Les fichiers illisibles sont signalés et écartés du corpus.
+def load_documents_from_directory(directory_path, cache=None, workers=INGESTION_WORKERS):
+    result = ingest_directory(directory_path, cache, workers)
+    for name, error in result.errors:
+        print(f"{name} ignoré — {error}")
+    return result.documents
+
+# Fonction pour charger une base de connaissances depuis différents fichiers
+def load_knowledge_base_from_directory(directory_path, cache=None, workers=INGESTION_WORKERS):
+    return "\n".join(text for _, text in load_documents_from_directory(directory_path, cache, workers))
@@ -0,0 +1,251 @@
+import contextvars
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from .config import EXTRACTION_MAX_DOCUMENTS, EXTRACTION_QUEUE_SIZE, EXTRACTION_WAIT_SECONDS, EXTRACTION_WORKERS
+from .document_cache import get_document_cache
+from .ocr import extract_pages_from_pdf
+from .uploads import StoredUpload
+
+# États d'une extraction
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "error"
+
+# Erreurs renvoyées aux clients de la file d'extraction
+class ExtractionError(Exception):
+    pass
+
+class QueueFullError(ExtractionError):
+    pass
+
+class DocumentNotFoundError(ExtractionError):
+    pass
+
+class DocumentNotReadyError(ExtractionError):
+    pass
+
+class ExtractionFailedError(ExtractionError):
+    pass
+
+# Extraction d'un PDF envoyé à l'API. L'identifiant est l'empreinte SHA-256 du fichier :
+# le même PDF envoyé deux fois désigne le même document. truncated indique que l'extraction
+# s'est arrêtée avant la fin du document, une fois le budget de tokens atteint.
+@dataclass
+class ExtractionJob:
+    id: str
+    filename: str = ""
+    status: str = QUEUED
+    text: str = ""
+    pages: list = field(default_factory=list)
+    error: str = ""
+    created_at: float = field(default_factory=time.time)
+    finished_at: float = None
+    extraction_seconds: float = 0.0
+    ocr_seconds: float = 0.0
+    page_count: int = 0
+    truncated: bool = False
+    finished: threading.Event = field(default_factory=threading.Event, repr=False, compare=False)
+
+    # Attendre la fin de l'extraction ; retourne False si timeout est dépassé
+    def wait(self, timeout=None):
+        return self.finished.wait(timeout)
+
+    def to_dict(self):
+        return {
+            "document_id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "pages": self.pages,
+            "page_count": self.page_count,
+            "truncated": self.truncated,
+            "chars": len(self.text),
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "extraction_seconds": round(self.extraction_seconds, 3),
+            "ocr_seconds": round(self.ocr_seconds, 3),
+        }
+
+# File d'extraction des PDF complémentaires, traitée par un pool de workers en arrière-plan.
+# Au plus queue_size PDF peuvent être en attente ou en cours : au-delà, submit() lève QueueFullError.
+# Les textes extraits sont enregistrés dans le cache des documents, si bien qu'un même fichier
+# n'est jamais analysé deux fois ; seuls les max_documents derniers restent en mémoire.
+# on_finished(job), si fourni, est appelé à la fin de chaque extraction (mesures).
+class ExtractionQueue:
+    def __init__(self, workers=EXTRACTION_WORKERS, queue_size=EXTRACTION_QUEUE_SIZE,
+                 max_documents=EXTRACTION_MAX_DOCUMENTS, cache=None, extractor=extract_pages_from_pdf,
+                 on_finished=None):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_documents = max_documents
+        self.cache = cache
+        self.extractor = extractor
+        self.on_finished = on_finished
+        self.rejected = 0
+        self._jobs = OrderedDict()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="extraction")
+
+    def _document_cache(self):
+        return self.cache if self.cache is not None else get_document_cache()
+
+    # Document déjà extrait lors d'une exécution précédente, ou None
+    def _from_cache(self, document_id, filename=""):
+        cache = self._document_cache()
+        stored = cache.get_upload(document_id) if cache is not None else None
+        if stored is None:
+            return None
+        job = ExtractionJob(document_id, filename, DONE, stored[0], stored[1], finished_at=time.time())
+        job.finished.set()
+        return job
+
+    def _remember(self, job):
+        self._jobs[job.id] = job
+        self._jobs.move_to_end(job.id)
+        # Oublier les plus anciens documents terminés (ils restent dans le cache sur disque)
+        for document_id in list(self._jobs):
+            if len(self._jobs) <= self.max_documents:
+                break
+            if self._jobs[document_id].finished.is_set():
+                del self._jobs[document_id]
+
+    # Mettre un PDF en file d'extraction et retourner son document (éventuellement déjà extrait).
+    # pdf_source est le contenu du PDF, ou un envoi recopié sur disque (uploads.StoredUpload) :
+    # son fichier temporaire est supprimé dès qu'il n'est plus utile.
+    def submit(self, pdf_source, filename=""):
+        upload = pdf_source if isinstance(pdf_source, StoredUpload) else None
+        document_id = upload.sha256 if upload is not None else hashlib.sha256(pdf_source).hexdigest()
+        queued = False
+        try:
+            with self._lock:
+                job = self._jobs.get(document_id)
+                if job is not None and job.status != FAILED:
+                    self._jobs.move_to_end(document_id)
+                    return job
+
+            cached = self._from_cache(document_id, filename)
+
+            with self._lock:
+                job = self._jobs.get(document_id)
+                if job is not None and job.status != FAILED:
+                    return job
+                if cached is not None:
+                    self._remember(cached)
+                    return cached
+                if self._pending >= self.queue_size:
+                    self.rejected += 1
+                    raise QueueFullError(f"File d'extraction pleine ({self.queue_size} documents en attente), réessayez plus tard.")
+                job = ExtractionJob(document_id, filename)
+                self._pending += 1
+                self._remember(job)
+            # Le worker garde le contexte de l'envoi (identifiant de requête dans les logs)
+            future = self._executor.submit(contextvars.copy_context().run, self._run, job, pdf_source)
+            future.add_done_callback(lambda future: future.cancelled() and self._abandon(job, pdf_source))
+            queued = True
+            return job
+        finally:
+            if upload is not None and not queued:
+                upload.discard()
+
+    def _run(self, job, pdf_source):
+        with self._lock:
+            job.status = RUNNING
+        started = time.perf_counter()
+        status = FAILED
+        result = {}
+        try:
+            extraction = self.extractor(pdf_source.path if isinstance(pdf_source, StoredUpload) else pdf_source)
+            result.update(ocr_seconds=extraction.ocr_seconds, page_count=extraction.page_count)
+            if extraction.error:
+                result["error"] = extraction.error
+            else:
+                pages = [{"page": page.number, "method": page.method} for page in extraction.pages]
+                cache = self._document_cache()
+                if cache is not None:
+                    cache.store_upload(job.id, extraction.text, pages)
+                result.update(text=extraction.text, pages=pages, truncated=extraction.truncated)
+                status = DONE
+        except Exception as e:
+            result["error"] = f"Erreur lors de l'extraction du texte : {e}"
+        finally:
+            if isinstance(pdf_source, StoredUpload):
+                pdf_source.discard()
+            result["extraction_seconds"] = time.perf_counter() - started
+            self._finish(job, status, result)
+
+    # Extraction annulée avant d'avoir commencé (arrêt de la file) : le document est en échec
+    # et son fichier temporaire supprimé
+    def _abandon(self, job, pdf_source):
+        if isinstance(pdf_source, StoredUpload):
+            pdf_source.discard()
+        self._finish(job, FAILED, {"error": "Extraction abandonnée : arrêt du service."})
+
+    # Publier le résultat d'une extraction sous le verrou : tous les champs d'abord, l'état en
+    # dernier, pour qu'un document terminé ait toujours sa date de fin et ses durées
+    def _finish(self, job, status, result):
+        with self._lock:
+            for name, value in result.items():
+                setattr(job, name, value)
+            job.finished_at = time.time()
+            job.status = status
+            self._pending -= 1
+        job.finished.set()
+        if self.on_finished is not None:
+            self.on_finished(job)
+
+    # Document connu (en mémoire ou dans le cache), ou None
+    def get(self, document_id):
+        with self._lock:
+            job = self._jobs.get(document_id)
+        if job is not None:
+            return job
+        job = self._from_cache(document_id)
+        if job is not None:
+            with self._lock:
+                self._remember(job)
+        return job
+
+    # Document extrait, prêt à être utilisé dans une question
+    def document(self, document_id):
+        job = self.get(document_id)
+        if job is None:
+            raise DocumentNotFoundError(f"Document inconnu : {document_id}")
+        if job.status == FAILED:
+            raise ExtractionFailedError(job.error)
+        if job.status != DONE:
+            raise DocumentNotReadyError(f"Extraction du document {document_id} en cours, réessayez plus tard.")
+        return job
+
+    # Extraire un PDF en attendant le résultat (PDF joint directement à une question), au plus
+    # timeout secondes : au-delà, DocumentNotReadyError (le document reste en file, le client
+    # peut reposer la question avec son identifiant)
+    def extract(self, pdf_source, filename="", timeout=EXTRACTION_WAIT_SECONDS):
+        job = self.submit(pdf_source, filename)
+        if not job.wait(timeout):
+            raise DocumentNotReadyError(f"Extraction du document {job.id} toujours en cours, réessayez plus tard.")
+        return self.document(job.id)
+
+    # Compteurs de la file
+    def stats(self):
+        with self._lock:
+            statuses = {}
+            for job in self._jobs.values():
+                statuses[job.status] = statuses.get(job.status, 0) + 1
+            return {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "pending": self._pending,
+                "rejected": self.rejected,
+                "documents": statuses,
+            }
+
+    # Arrêter les workers ; les extractions en attente sont abandonnées (voir _abandon)
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
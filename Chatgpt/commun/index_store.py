@@ -0,0 +1,150 @@
+import json
+import mmap
+import os
+import shutil
+from bisect import bisect_left
+from collections.abc import Sequence
+from pathlib import Path
+
+import numpy as np
+
+from .retrieval import Chunk, KnowledgeIndex
+
+# À incrémenter quand la disposition des fichiers change
+STORE_FORMAT = 1
+
+# Tableaux de l'index enregistrés au format .npy, projetés en mémoire au chargement
+ARRAYS = ("indptr", "doc_ids", "frequencies", "lengths", "idf", "chunk_sources", "chunk_positions")
+
+# Écrire des textes bout à bout dans name.bin, et leurs bornes dans name.npy
+def write_arena(directory, name, texts):
+    offsets = [0]
+    with open(directory / f"{name}.bin", "wb") as f:
+        for text in texts:
+            data = text.encode("utf-8")
+            f.write(data)
+            offsets.append(offsets[-1] + len(data))
+    np.save(directory / f"{name}.npy", np.asarray(offsets, dtype=np.int64))
+
+# Textes écrits par write_arena, décodés à la demande depuis une projection mémoire en lecture seule :
+# tous les workers partagent les mêmes pages, seules les chaînes lues sont recopiées
+class TextArena(Sequence):
+    def __init__(self, directory, name):
+        self.offsets = np.load(directory / f"{name}.npy", mmap_mode="r")
+        with open(directory / f"{name}.bin", "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+        return self._map[int(self.offsets[position]):int(self.offsets[position + 1])].decode("utf-8")
+
+# Passages de l'index, reconstruits à la demande depuis les fichiers projetés
+class MappedChunks(Sequence):
+    def __init__(self, sources, source_ids, positions, texts, keys):
+        self.sources = sources
+        self.source_ids = source_ids
+        self.positions = positions
+        self.texts = texts
+        self.keys = keys
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __getitem__(self, doc_id):
+        text = self.texts[doc_id]
+        return Chunk(self.sources[int(self.source_ids[doc_id])], int(self.positions[doc_id]), text, self.keys[doc_id])
+
+# Vocabulaire de l'index : les termes sont rangés dans l'ordre alphabétique, qui est aussi celui
+# de leurs numéros, si bien qu'une recherche dichotomique remplace le dictionnaire
+class MappedVocabulary:
+    def __init__(self, terms):
+        self.terms = terms
+
+    def __len__(self):
+        return len(self.terms)
+
+    def get(self, term, default=None):
+        position = bisect_left(self.terms, term)
+        if position < len(self.terms) and self.terms[position] == term:
+            return position
+        return default
+
+# Enregistrer un index dans directory/<version>/ et supprimer les versions précédentes.
+# L'écriture se fait dans un dossier temporaire renommé à la fin : un worker ne voit jamais
+# un index à moitié écrit. Retourne le dossier de l'index.
+def save_index(index, directory, errors=None):
+    directory = Path(directory)
+    target = directory / index.version
+    if not (target / "meta.json").exists():
+        directory.mkdir(parents=True, exist_ok=True)
+        temporary = directory / f".{index.version}.{os.getpid()}.tmp"
+        shutil.rmtree(temporary, ignore_errors=True)
+        temporary.mkdir()
+
+        chunks = list(index.chunks)
+        sources = sorted({chunk.source for chunk in chunks})
+        source_ids = {source: number for number, source in enumerate(sources)}
+        arrays = {
+            "indptr": index.indptr,
+            "doc_ids": index.doc_ids,
+            "frequencies": index.frequencies,
+            "lengths": index.lengths,
+            "idf": index.idf,
+            "chunk_sources": np.asarray([source_ids[chunk.source] for chunk in chunks], dtype=np.int32),
+            "chunk_positions": np.asarray([chunk.position for chunk in chunks], dtype=np.int32),
+        }
+        for name, array in arrays.items():
+            np.save(temporary / f"{name}.npy", np.ascontiguousarray(array))
+        write_arena(temporary, "texts", (chunk.text for chunk in chunks))
+        write_arena(temporary, "keys", (chunk.key for chunk in chunks))
+        write_arena(temporary, "terms", sorted(index.vocabulary, key=index.vocabulary.get))
+
+        meta = {
+            "format": STORE_FORMAT,
+            "version": index.version,
+            "k1": index.k1,
+            "b": index.b,
+            "sources": sources,
+            "keys": [[sorted(terms), doc_ids] for terms, doc_ids in index.keys.items()],
+            "errors": errors or {},
+        }
+        (temporary / "meta.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        try:
+            os.replace(temporary, target)
+        except OSError:
+            # Un autre processus vient d'écrire le même index
+            shutil.rmtree(temporary, ignore_errors=True)
+
+    # Les index précédents peuvent être supprimés : un worker qui les projette encore garde ses pages
+    for previous in directory.iterdir():
+        if previous.is_dir() and previous.name != index.version and not previous.name.startswith("."):
+            shutil.rmtree(previous, ignore_errors=True)
+    return target
+
+# Charger un index enregistré par save_index, sans relire ni analyser aucun document.
+# Retourne (index, erreurs d'analyse des documents lors de la construction).
+def load_index(store_path):
+    store_path = Path(store_path)
+    meta = json.loads((store_path / "meta.json").read_text(encoding="utf-8"))
+    if meta["format"] != STORE_FORMAT:
+        raise ValueError(f"Format d'index {meta['format']} non pris en charge (attendu : {STORE_FORMAT})")
+
+    arrays = {name: np.load(store_path / f"{name}.npy", mmap_mode="r") for name in ARRAYS}
+    chunks = MappedChunks(
+        meta["sources"], arrays["chunk_sources"], arrays["chunk_positions"],
+        TextArena(store_path, "texts"), TextArena(store_path, "keys"),
+    )
+    keys = {frozenset(terms): doc_ids for terms, doc_ids in meta["keys"]}
+    index = KnowledgeIndex.from_arrays(
+        chunks, MappedVocabulary(TextArena(store_path, "terms")), keys,
+        arrays["indptr"], arrays["doc_ids"], arrays["frequencies"], arrays["lengths"], arrays["idf"],
+        meta["version"], meta["k1"], meta["b"],
+    )
+    return index, meta["errors"]
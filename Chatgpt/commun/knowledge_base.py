@@ -0,0 +1,152 @@
+import threading
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+
+from .cleaning import CleaningReport, deduplicate_documents, normalize_document, report_tokens
+from .config import CHUNK_MAX_CHARS, KNOWLEDGE_WATCH_SECONDS
+from .documents import ingest_files, list_supported_files, prune_cache
+from .index_store import load_index
+from .metrics import get_logger
+from .retrieval import KnowledgeIndex, chunk_term_counts, split_document
+
+# Texte d'un document débarrassé de sa mise en page, texte indexé une fois retirés les paragraphes
+# déjà présents dans la base, passages et occurrences de leurs termes. Partagés entre versions
+# successives de la base tant que le document et ses doublons ne changent pas.
+@dataclass(frozen=True)
+class DocumentEntry:
+    text: str
+    tokens_before: int = 0
+    furniture_lines: int = 0
+    indexed_text: str = None
+    duplicate_paragraphs: int = 0
+    chunks: tuple = ()
+    term_counts: tuple = ()
+
+    # Ce que le nettoyage a retiré du document
+    def report(self):
+        return CleaningReport(self.tokens_before, report_tokens(self.indexed_text or ""),
+                              self.furniture_lines, self.duplicate_paragraphs)
+
+# Version figée de la base de connaissances. Une requête lit knowledge_base.snapshot une fois
+# et travaille sur cette version, même si une nouvelle est publiée entre-temps.
+@dataclass(frozen=True)
+class KnowledgeSnapshot:
+    number: int
+    index: KnowledgeIndex
+    entries: dict = field(default_factory=dict)
+    file_states: dict = field(default_factory=dict)
+    errors: dict = field(default_factory=dict)
+
+    @property
+    def version(self):
+        return self.index.version
+
+    # Rapport de nettoyage de chaque document
+    def reports(self):
+        return {name: entry.report() for name, entry in self.entries.items()}
+
+# État d'un fichier pour détecter ses modifications : (taille, date de modification)
+def file_state(file_path):
+    stat = file_path.stat()
+    return stat.st_size, stat.st_mtime_ns
+
+# Base de connaissances rechargeable à chaud depuis un dossier.
+# refresh() compare l'état des fichiers à celui de la version courante, n'analyse que les fichiers
+# ajoutés ou modifiés, réutilise tels quels les passages des autres, puis publie la nouvelle
+# version d'un seul coup (simple remplacement de référence, sans interruption des requêtes).
+# Les paragraphes en double sont recherchés dans toute la base à chaque rechargement : seuls
+# les documents dont le texte indexé change sont redécoupés.
+class KnowledgeBase:
+    def __init__(self, directory_path, max_chars=CHUNK_MAX_CHARS):
+        self.directory_path = Path(directory_path)
+        self.max_chars = max_chars
+        self.snapshot = KnowledgeSnapshot(0, KnowledgeIndex([]))
+        self._refresh_lock = threading.Lock()
+        self._stop_watching = None
+
+    @property
+    def index(self):
+        return self.snapshot.index
+
+    # Charger ou recharger la base ; retourne le résumé des changements, ou None si rien n'a changé
+    def refresh(self):
+        with self._refresh_lock:
+            current = self.snapshot
+            file_paths = list_supported_files(self.directory_path)
+            states = {path.name: file_state(path) for path in file_paths}
+
+            changed = [path for path in file_paths if current.file_states.get(path.name) != states[path.name]]
+            removed_files = [name for name in current.file_states if name not in states]
+            if not changed and not removed_files and current.number > 0:
+                return None
+
+            entries = {name: entry for name, entry in current.entries.items() if name in states}
+            errors = {name: error for name, error in current.errors.items() if name in states}
+            result = ingest_files(changed)
+            if removed_files:
+                prune_cache(self.directory_path, file_paths)
+            for name, text in result.documents:
+                cleaned, furniture_lines = normalize_document(text)
+                entries[name] = DocumentEntry(cleaned, report_tokens(text), furniture_lines)
+                errors.pop(name, None)
+            for name, error in result.errors:
+                entries.pop(name, None)
+                errors[name] = error
+
+            deduplicated, removed = deduplicate_documents([(name, entries[name].text) for name in sorted(entries)])
+            for name, indexed_text in deduplicated:
+                entry = replace(entries[name], duplicate_paragraphs=removed[name])
+                if entry.indexed_text != indexed_text:
+                    chunks = tuple(split_document(name, indexed_text, self.max_chars))
+                    entry = replace(entry, indexed_text=indexed_text, chunks=chunks,
+                                    term_counts=tuple(chunk_term_counts(chunks)))
+                entries[name] = entry
+
+            # Les passages restent dans l'ordre des noms de fichiers
+            chunks = []
+            term_counts = []
+            for name in sorted(entries):
+                chunks.extend(entries[name].chunks)
+                term_counts.extend(entries[name].term_counts)
+            index = KnowledgeIndex(chunks, term_counts=term_counts)
+
+            self.snapshot = KnowledgeSnapshot(current.number + 1, index, entries, states, errors)
+            return {
+                "number": self.snapshot.number,
+                "version": self.snapshot.version,
+                "changed": [path.name for path in changed],
+                "removed": removed_files,
+                "errors": errors,
+                "tokens_saved": {name: report.tokens_saved for name, report in self.snapshot.reports().items()},
+            }
+
+    # Charger un index enregistré par index_store.save_index (mode multi-workers) : aucun document
+    # n'est relu, les tableaux et les textes sont projetés en mémoire et partagés entre les processus
+    def load_store(self, store_path):
+        with self._refresh_lock:
+            index, errors = load_index(store_path)
+            self.snapshot = KnowledgeSnapshot(self.snapshot.number + 1, index, errors=errors)
+            return {"number": self.snapshot.number, "version": self.snapshot.version, "store": str(store_path), "errors": errors}
+
+    # Surveiller le dossier en tâche de fond, toutes les interval secondes
+    def start_watching(self, interval=KNOWLEDGE_WATCH_SECONDS):
+        if interval <= 0 or self._stop_watching is not None:
+            return
+        stop = threading.Event()
+        self._stop_watching = stop
+
+        def watch():
+            while not stop.wait(interval):
+                try:
+                    changes = self.refresh()
+                    if changes:
+                        get_logger().info("Base de connaissances rechargée : %s", changes)
+                except Exception as e:
+                    get_logger().exception("Erreur lors du rechargement de la base de connaissances : %s", e)
+
+        threading.Thread(target=watch, name="knowledge-base-watcher", daemon=True).start()
+
+    def stop_watching(self):
+        if self._stop_watching is not None:
+            self._stop_watching.set()
+            self._stop_watching = None
@@ -0,0 +1,30 @@
+import importlib
+import sys
+import time
+
+# Dépendances lourdes chargées seulement quand un traitement en a besoin : PyMuPDF et EasyOCR
+# (qui importe torch) pour les PDF joints, PyPDF2, python-docx et pandas pour la base de connaissances.
+# Un processus qui trouve ses documents dans le cache et ne reçoit pas de PDF ne les importe jamais.
+HEAVY_MODULES = ("fitz", "easyocr", "PyPDF2", "docx", "pandas")
+
+# Durée de l'import de chaque module chargé par load(), en secondes
+_import_seconds = {}
+
+# Importer un module au premier appel (les suivants le retrouvent dans sys.modules)
+# et retenir la durée de cet import
+def load(module_name):
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    _import_seconds.setdefault(module_name, time.perf_counter() - started)
+    return module
+
+# Rapport des imports : durée de chaque module chargé par load(),
+# et modules lourds pas encore importés par le processus
+def import_report():
+    return {
+        "seconds": {name: round(seconds, 3) for name, seconds in _import_seconds.items()},
+        "not_loaded": [name for name in HEAVY_MODULES if name not in sys.modules],
+    }
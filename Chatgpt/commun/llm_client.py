@@ -0,0 +1,403 @@
+import asyncio
+import math
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+import aiohttp
+import openai
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+from .config import (
+    LLM_API_BASE, LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_SECONDS, LLM_BREAKER_RESET_SECONDS, LLM_BREAKER_THRESHOLD,
+    LLM_BURST, LLM_MAX_CONCURRENCY, LLM_MAX_RETRIES, LLM_POOL_SIZE, LLM_REQUESTS_PER_SECOND, LLM_TIMEOUT_SECONDS,
+    OPENAI_MODEL,
+)
+from .tokens import count_text_tokens, count_tokens
+
+# Erreurs du modèle après lesquelles un nouvel essai a des chances de réussir
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.APIConnectionError,
+    openai.error.Timeout,
+    openai.error.TryAgain,
+)
+
+# Le disjoncteur est ouvert : le modèle n'est pas appelé pendant la coupure
+class CircuitOpenError(Exception):
+    pass
+
+# Une erreur justifie-t-elle un nouvel essai (limite de débit, erreur serveur, réseau) ?
+def is_retryable(error):
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    return isinstance(error, openai.error.APIError) and (error.http_status or 500) >= 500
+
+# Limiteur de débit à seau de jetons : rate jetons par seconde, au plus capacity en réserve.
+# Chaque appel réserve son jeton puis attend hors verrou le temps nécessaire.
+class TokenBucket:
+    def __init__(self, rate=LLM_REQUESTS_PER_SECOND, capacity=LLM_BURST):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    # Réserver amount jetons ; retourne le temps d'attente avant de pouvoir les utiliser
+    def _reserve(self, amount=1):
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self, amount=1):
+        wait = self._reserve(amount)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, amount=1):
+        wait = self._reserve(amount)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+# Disjoncteur : après failure_threshold échecs consécutifs, les appels sont refusés pendant
+# reset_seconds, puis un seul appel d'essai est autorisé ; son succès referme le circuit.
+class CircuitBreaker:
+    def __init__(self, failure_threshold=LLM_BREAKER_THRESHOLD, reset_seconds=LLM_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                self._trial_running = False
+            if self.state == "open":
+                return False
+            if self.state == "half_open":
+                if self._trial_running:
+                    return False
+                self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    # Secondes restantes avant la fin de la coupure (0 si le circuit n'est pas ouvert)
+    def retry_after(self):
+        with self._lock:
+            if self.state != "open":
+                return 0.0
+            return max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+
+# Limite d'appels simultanés commune aux appels synchrones (threads) et aux appels en flux
+# (boucle d'événements) : un seul compteur, que les deux sortes d'appels se partagent.
+# Côté asynchrone, la place est demandée sans bloquer la boucle, à intervalles de poll_seconds.
+class ConcurrencyLimit:
+    def __init__(self, limit=LLM_MAX_CONCURRENCY, poll_seconds=0.01):
+        self.limit = limit
+        self.poll_seconds = poll_seconds
+        self.active = 0
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+
+    def _enter(self):
+        with self._lock:
+            self.active += 1
+
+    def _exit(self):
+        with self._lock:
+            self.active -= 1
+        self._semaphore.release()
+
+    def __enter__(self):
+        self._semaphore.acquire()
+        self._enter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._exit()
+
+    async def __aenter__(self):
+        while not self._semaphore.acquire(blocking=False):
+            await asyncio.sleep(self.poll_seconds)
+        self._enter()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._exit()
+
+# Compteurs des appels au modèle : durée, tokens, nouvelles tentatives et refus
+class LLMMetrics:
+    def __init__(self, window=1000):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency, prompt_tokens=0, completion_tokens=0):
+        with self._lock:
+            self.calls += 1
+            self.latencies.append(latency)
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            calls, errors, retries, rejected = self.calls, self.errors, self.retries, self.rejected
+            prompt_tokens, completion_tokens = self.prompt_tokens, self.completion_tokens
+
+        def percentile(q):
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 4) if latencies else None
+
+        return {
+            "calls": calls,
+            "errors": errors,
+            "retries": retries,
+            "rejected": rejected,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "latency_p50": percentile(0.5),
+            "latency_p95": percentile(0.95),
+        }
+
+# Session HTTP partagée par tous les threads, avec un pool de pool_size connexions
+def pooled_session(pool_size=LLM_POOL_SIZE):
+    session = Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+# Session HTTP de l'appel synchrone en cours, choisie par le client qui appelle (LLMClient.chat),
+# comme openai.aiosession pour les appels asynchrones
+request_session = ContextVar("llm_request_session", default=None)
+
+# Session qu'openai 0.28 crée pour chaque thread (et ferme toutes les trois minutes). Elle ne
+# possède aucune connexion pendant un appel d'un LLMClient : chaque requête passe par la session
+# de l'appel en cours (request_session), dont le pool n'est fermé que par LLMClient.aclose().
+# Hors d'un LLMClient, elle se comporte comme la session par défaut d'openai, propre au thread.
+class RoutedSession:
+    def __init__(self):
+        self._own_session = None
+
+    def _session(self):
+        session = request_session.get()
+        if session is not None:
+            return session
+        if self._own_session is None:
+            self._own_session = Session()
+        return self._own_session
+
+    def __getattr__(self, name):
+        return getattr(self._session(), name)
+
+    def close(self):
+        if self._own_session is not None:
+            self._own_session.close()
+            self._own_session = None
+
+# openai 0.28 n'accepte pas de session par appel, seulement cette fabrique globale : elle est
+# installée une fois, à l'import, et chaque client désigne sa session le temps de ses appels
+openai.requestssession = RoutedSession
+
+# Client du modèle partagé par l'API et les applications Streamlit.
+# Chaque appel passe par le disjoncteur, le limiteur de débit et la limite d'appels simultanés,
+# réutilise les connexions HTTP du pool et est retenté sur 429/5xx avec un délai exponentiel
+# aléatoire (ou le délai Retry-After indiqué par le serveur).
+class LLMClient:
+    def __init__(self, api_base=LLM_API_BASE, model=OPENAI_MODEL, timeout=LLM_TIMEOUT_SECONDS,
+                 max_retries=LLM_MAX_RETRIES, backoff_seconds=LLM_BACKOFF_SECONDS,
+                 backoff_max_seconds=LLM_BACKOFF_MAX_SECONDS, max_concurrency=LLM_MAX_CONCURRENCY,
+                 pool_size=LLM_POOL_SIZE, rate_limiter=None, breaker=None):
+        self.api_base = api_base
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.max_concurrency = max_concurrency
+        self.pool_size = pool_size
+        self.rate_limiter = rate_limiter if rate_limiter is not None else TokenBucket()
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.metrics = LLMMetrics()
+        # Pool de connexions des appels synchrones de ce client (voir RoutedSession)
+        self.session = pooled_session(pool_size)
+        # Une seule limite pour les appels synchrones et les appels en flux
+        self.slots = ConcurrencyLimit(max_concurrency)
+        # La session aiohttp est créée dans la boucle d'événements qui l'utilise
+        self._aiohttp_session = None
+
+    # Délai avant la tentative suivante
+    def backoff(self, attempt, error=None):
+        delay = random.uniform(0, min(self.backoff_max_seconds, self.backoff_seconds * 2 ** attempt))
+        retry_after = getattr(error, "headers", {}).get("retry-after")
+        try:
+            return max(delay, min(float(retry_after), self.backoff_max_seconds))
+        except (TypeError, ValueError):
+            return delay
+
+    def _request(self, messages, api_key, temperature, max_tokens, stream=False):
+        return {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": stream,
+            "api_key": api_key,
+            "api_base": self.api_base,
+            "request_timeout": self.timeout,
+        }
+
+    # Délai conseillé au client avant de reposer sa question quand le modèle est indisponible
+    # (en-tête Retry-After) : fin de la coupure du disjoncteur, ou délai indiqué par le serveur
+    def retry_after(self, error=None):
+        delay = max(self.breaker.retry_after(), self.backoff_seconds)
+        retry_after = (getattr(error, "headers", None) or {}).get("retry-after")
+        try:
+            delay = max(delay, float(retry_after))
+        except (TypeError, ValueError):
+            pass
+        return max(1, math.ceil(delay))
+
+    def _admit(self):
+        if not self.breaker.allow():
+            self.metrics.count("rejected")
+            raise CircuitOpenError("Service du modèle momentanément indisponible, réessayez plus tard.")
+
+    # Traiter l'échec d'une tentative : retourne le délai avant la suivante, ou relève l'erreur
+    def _on_failure(self, error, attempt):
+        if not is_retryable(error):
+            # La requête est en cause, pas le service
+            self.breaker.record_success()
+            self.metrics.count("errors")
+            raise error
+        self.breaker.record_failure()
+        if attempt >= self.max_retries:
+            self.metrics.count("errors")
+            raise error
+        self.metrics.count("retries")
+        return self.backoff(attempt, error)
+
+    # Réponse complète du modèle
+    def chat(self, messages, api_key=None, temperature=0, max_tokens=500):
+        request = self._request(messages, api_key, temperature, max_tokens)
+        for attempt in range(self.max_retries + 1):
+            self._admit()
+            self.rate_limiter.acquire()
+            started = time.perf_counter()
+            try:
+                with self.slots:
+                    token = request_session.set(self.session)
+                    try:
+                        response = openai.ChatCompletion.create(**request)
+                    finally:
+                        request_session.reset(token)
+            except Exception as e:
+                time.sleep(self._on_failure(e, attempt))
+                continue
+            self.breaker.record_success()
+            usage = response.get("usage") or {}
+            self.metrics.record(
+                time.perf_counter() - started, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+            )
+            return response["choices"][0]["message"]["content"]
+
+    def _async_session(self):
+        if self._aiohttp_session is None or self._aiohttp_session.closed:
+            self._aiohttp_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size))
+        return self._aiohttp_session
+
+    # Réponse du modèle diffusée en flux : produit les morceaux au fur et à mesure.
+    # Seule l'ouverture du flux est retentée ; une coupure en cours de réponse est remontée.
+    async def stream_chat(self, messages, api_key=None, temperature=0, max_tokens=500):
+        request = self._request(messages, api_key, temperature, max_tokens, stream=True)
+        session = self._async_session()
+        for attempt in range(self.max_retries + 1):
+            self._admit()
+            await self.rate_limiter.acquire_async()
+            async with self.slots:
+                started = time.perf_counter()
+                # openai 0.28 prend la session aiohttp dans cette variable de contexte
+                token = openai.aiosession.set(session)
+                try:
+                    response = await openai.ChatCompletion.acreate(**request)
+                except Exception as e:
+                    response = None
+                    delay = self._on_failure(e, attempt)
+                finally:
+                    openai.aiosession.reset(token)
+                if response is not None:
+                    self.breaker.record_success()
+                    deltas = []
+                    async for chunk in response:
+                        delta = chunk["choices"][0]["delta"].get("content")
+                        if delta:
+                            deltas.append(delta)
+                            yield delta
+                    self.metrics.record(
+                        time.perf_counter() - started, count_tokens(messages), count_text_tokens("".join(deltas))
+                    )
+                    return
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        return {
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "in_flight": self.slots.active,
+            **self.metrics.stats(),
+        }
+
+    # Fermer les connexions du pool
+    async def aclose(self):
+        if self._aiohttp_session is not None and not self._aiohttp_session.closed:
+            await self._aiohttp_session.close()
+        self.session.close()
+
+_llm_client = None
+_llm_client_lock = threading.Lock()
+
+# Client partagé par tout le processus
+def get_llm_client():
+    global _llm_client
+    if _llm_client is None:
+        with _llm_client_lock:
+            if _llm_client is None:
+                _llm_client = LLMClient()
+    return _llm_client
@@ -0,0 +1,171 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Identifiant de la requête en cours, repris dans chaque ligne de log
+request_id_var = ContextVar("request_id", default="-")
+
+# Seuils des histogrammes de durée, en secondes
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+def new_request_id():
+    return uuid.uuid4().hex
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+# Compteur, éventuellement décliné par étiquettes : counter.inc(type="Timeout")
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+# Histogramme : nombre d'observations sous chaque seuil, somme et nombre d'observations
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[position] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    samples.append((f"{self.name}_bucket", key + (("le", str(bound)),), bucket_count))
+                samples.append((f"{self.name}_bucket", key + (("le", "+Inf"),), count))
+                samples.append((f"{self.name}_sum", key, total))
+                samples.append((f"{self.name}_count", key, count))
+        return samples
+
+# Valeur lue au moment de l'export, par exemple un compteur tenu par un cache.
+# function retourne un nombre, ou un dictionnaire {étiquettes (tuple de couples): nombre}.
+class Callback:
+    def __init__(self, name, help_text, function, kind="gauge"):
+        self.name = name
+        self.help_text = help_text
+        self.function = function
+        self.kind = kind
+
+    def samples(self):
+        value = self.function()
+        if value is None:
+            return []
+        if isinstance(value, dict):
+            return [(self.name, key, item) for key, item in value.items()]
+        return [(self.name, (), value)]
+
+# Ensemble des métriques d'un processus, exportées au format texte de Prometheus
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text):
+        return self._register(Counter(name, help_text))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, buckets))
+
+    def callback(self, name, help_text, function, kind="gauge"):
+        return self._register(Callback(name, help_text, function, kind))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+# Durées des étapes d'une requête (lecture de l'envoi, extraction, recherche, prompt, modèle...).
+# Chaque étape est ajoutée à l'histogramme des étapes et l'ensemble est journalisé à la fin.
+class RequestTrace:
+    def __init__(self, endpoint, histogram=None, logger=None):
+        self.endpoint = endpoint
+        self.histogram = histogram
+        self.logger = logger
+        self.stages = {}
+        self.started = time.perf_counter()
+
+    def record(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        if self.histogram is not None:
+            self.histogram.observe(seconds, endpoint=self.endpoint, stage=stage)
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    # Durées en millisecondes, total compris
+    def timings(self):
+        return {stage: round(seconds * 1000.0, 2) for stage, seconds in self.stages.items()}
+
+    # Enregistrer la durée totale et journaliser le détail des étapes
+    def finish(self):
+        self.record("total", time.perf_counter() - self.started)
+        timings = self.timings()
+        if self.logger is not None:
+            self.logger.info("%s étapes (ms) : %s", self.endpoint, json.dumps(timings))
+        return timings
+
+# Ajoute l'identifiant de la requête en cours à chaque ligne de log
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+# Logger de l'application, dont chaque ligne porte l'identifiant de la requête
+def get_logger(name="assistant", level=logging.INFO):
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.addFilter(RequestIdFilter())
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(request_id)s] %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(level)
+        logger.propagate = False
+    return logger
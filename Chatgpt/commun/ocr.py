@@ -0,0 +1,177 @@
+import threading
+import time
+from dataclasses import dataclass, field
+import numpy as np
+
+from .config import (
+    OCR_BATCH_SIZE,
+    OCR_GPU,
+    OCR_LANGUAGES,
+    SUPPLEMENTAL_TOKEN_BUDGET,
+    TEXT_LAYER_MIN_CHARS,
+    UPLOAD_MAX_PAGES,
+)
+from .lazy_imports import load
+from .tokens import count_text_tokens
+
+_reader = None
+_reader_lock = threading.Lock()
+# Le modèle n'est pas prévu pour des inférences concurrentes
+_inference_lock = threading.Lock()
+
+# Lecteur EasyOCR partagé par tout le processus, chargé au premier besoin.
+# Le chargement des modèles de détection et de reconnaissance prend plusieurs secondes :
+# il ne doit avoir lieu qu'une fois, et non à chaque PDF. EasyOCR (et torch) n'est importé qu'ici.
+def get_ocr_reader():
+    global _reader
+    if _reader is None:
+        with _reader_lock:
+            if _reader is None:
+                _reader = load("easyocr").Reader(OCR_LANGUAGES, gpu=OCR_GPU)
+    return _reader
+
+# Reconnaître le texte d'une liste d'images de pages (tableaux NumPy), dans l'ordre.
+# EasyOCR n'accepte dans un même lot que des images de même taille : les pages sont donc
+# regroupées par dimensions avant d'être passées ensemble au modèle.
+def ocr_images(images, batch_size=OCR_BATCH_SIZE):
+    reader = get_ocr_reader()
+    texts = [""] * len(images)
+
+    pages_by_size = {}
+    for index, image in enumerate(images):
+        pages_by_size.setdefault(image.shape, []).append(index)
+
+    with _inference_lock:
+        for indexes in pages_by_size.values():
+            for start in range(0, len(indexes), batch_size):
+                batch = indexes[start:start + batch_size]
+                results = reader.readtext_batched(
+                    [images[index] for index in batch],
+                    batch_size=batch_size,
+                    detail=0,
+                    paragraph=True,
+                )
+                for index, lines in zip(batch, results):
+                    texts[index] = " ".join(lines)
+    return texts
+
+# Ouvrir un PDF depuis un chemin ou directement depuis son contenu en mémoire
+def open_pdf(pdf_source):
+    fitz = load("fitz")
+    if isinstance(pdf_source, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=pdf_source, filetype="pdf")
+    return fitz.open(pdf_source)
+
+# Rendre une page en image (zoom x2 pour la précision de l'OCR)
+def render_page(page, zoom=2):
+    return page.get_pixmap(matrix=load("fitz").Matrix(zoom, zoom), alpha=False)
+
+# Vue NumPy (hauteur, largeur, canaux) sur les pixels d'une pixmap, sans copie ni encodage PNG.
+# La vue partage la mémoire de la pixmap : celle-ci doit rester référencée tant que la vue sert.
+def pixmap_to_array(pix):
+    return np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+
+# Fonction pour extraire du texte d'un PDF avec PyMuPDF et EasyOCR.
+# Les pages sont rendues et reconnues par lots de batch_size : la mémoire utilisée
+# dépend de la taille d'un lot et non du nombre de pages du document.
+def extract_text_from_pdf_with_fitz(pdf_source, batch_size=OCR_BATCH_SIZE):
+    try:
+        with open_pdf(pdf_source) as pdf:
+            text_output = []
+            for start in range(0, pdf.page_count, batch_size):
+                pixmaps = [render_page(pdf[page_num]) for page_num in range(start, min(start + batch_size, pdf.page_count))]
+                text_output.extend(ocr_images([pixmap_to_array(pix) for pix in pixmaps], batch_size))
+                del pixmaps
+            return "\n".join(text_output)
+    except Exception as e:
+        return f"Erreur lors de l'extraction du texte : {e}"
+
+# Texte d'une page, méthode utilisée pour l'obtenir ("text" : couche texte du PDF, "ocr")
+# et nombre de tokens (compté seulement quand l'extraction a un budget de tokens)
+@dataclass
+class PageText:
+    number: int
+    text: str
+    method: str
+    tokens: int = 0
+
+# Résultat de l'extraction d'un PDF page par page.
+# page_count est le nombre de pages du document ; il est supérieur au nombre de pages lues
+# quand l'extraction s'est arrêtée au budget de tokens (truncated).
+@dataclass
+class PdfExtraction:
+    pages: list = field(default_factory=list)
+    error: str = ""
+    ocr_seconds: float = 0.0
+    page_count: int = 0
+    tokens: int = 0
+
+    @property
+    def text(self):
+        if self.error:
+            return self.error
+        return "\n".join(page.text for page in self.pages if page.text)
+
+    @property
+    def truncated(self):
+        return len(self.pages) < self.page_count
+
+    # Nombre de pages par méthode, par exemple {"text": 12, "ocr": 2}
+    def methods(self):
+        counts = {}
+        for page in self.pages:
+            counts[page.method] = counts.get(page.method, 0) + 1
+        return counts
+
+# Extraire le texte d'un PDF en lisant d'abord la couche texte de chaque page.
+# Seules les pages dont la couche texte est vide ou trop pauvre (pages scannées) passent
+# par l'OCR, par lots de batch_size pages. Les pages sont lues une à une depuis le fichier :
+# seules les images du lot en cours sont en mémoire.
+# Un PDF de plus de max_pages pages est refusé. Dès que le texte lu atteint token_budget tokens,
+# les pages suivantes ne sont plus lues : leur texte serait de toute façon tronqué dans le prompt.
+# Les pages scannées étant reconnues par lots, au plus un lot est lu au-delà du budget.
+def extract_pages_from_pdf(pdf_source, min_chars=TEXT_LAYER_MIN_CHARS, batch_size=OCR_BATCH_SIZE,
+                           max_pages=UPLOAD_MAX_PAGES, token_budget=SUPPLEMENTAL_TOKEN_BUDGET):
+    extraction = PdfExtraction()
+    try:
+        with open_pdf(pdf_source) as pdf:
+            extraction.page_count = pdf.page_count
+            if max_pages and pdf.page_count > max_pages:
+                extraction.error = f"PDF trop long ({pdf.page_count} pages, maximum {max_pages})."
+                return extraction
+            pending = []
+
+            def add_page(page_text):
+                if token_budget:
+                    page_text.tokens = count_text_tokens(page_text.text)
+                    extraction.tokens += page_text.tokens
+
+            def flush():
+                started = time.perf_counter()
+                texts = ocr_images([pixmap_to_array(pix) for _, pix in pending], batch_size)
+                extraction.ocr_seconds += time.perf_counter() - started
+                for (page_text, _), text in zip(pending, texts):
+                    page_text.text = text
+                    add_page(page_text)
+                pending.clear()
+
+            for page_num in range(pdf.page_count):
+                if token_budget and extraction.tokens >= token_budget:
+                    break
+                page = pdf[page_num]
+                text = page.get_text().strip()
+                if len(text) >= min_chars:
+                    page_text = PageText(page_num + 1, text, "text")
+                    extraction.pages.append(page_text)
+                    add_page(page_text)
+                    continue
+                page_text = PageText(page_num + 1, "", "ocr")
+                extraction.pages.append(page_text)
+                pending.append((page_text, render_page(page)))
+                if len(pending) >= batch_size:
+                    flush()
+            if pending:
+                flush()
+    except Exception as e:
+        extraction.error = f"Erreur lors de l'extraction du texte : {e}"
+    return extraction
@@ -0,0 +1,262 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+from .config import (
+    PROMPT_HISTORY_RESERVED_TOKENS,
+    PROMPT_LAYOUT,
+    PROMPT_STATIC_KNOWLEDGE_MAX_TOKENS,
+    PROMPT_SUMMARY_MAX_TOKENS,
+    PROMPT_TOKEN_BUDGET,
+    SESSION_MAX_SESSIONS,
+    SESSION_TTL_SECONDS,
+    SUPPLEMENTAL_TOKEN_BUDGET,
+)
+from .cleaning import collapse_whitespace
+from .tokens import count_text_tokens, encode, truncate_to_tokens
+
+# Nombre de tokens conservés de chaque message dans le résumé par défaut
+SUMMARY_EXCERPT_TOKENS = 40
+
+# Version de la disposition "prefix" : à incrémenter quand l'ordre ou la forme des messages change
+PROMPT_LAYOUT_VERSION = 1
+
+ROLE_LABELS = {"user": "Utilisateur", "assistant": "Assistant"}
+
+# En-têtes des sections, comptés dans le budget de leur section
+KNOWLEDGE_HEADER = "Base de connaissances :\n"
+SUPPLEMENTAL_HEADER = "\n\nInformations supplémentaires issues du PDF :\n"
+SUMMARY_HEADER = "Résumé des échanges précédents :\n"
+QUESTION_HEADER = "\n\nQuestion :\n"
+
+# Messages prêts à envoyer au modèle, nombre de tokens par section et version de la partie fixe
+# du prompt (consigne et, le cas échéant, base de connaissances fixe)
+@dataclass
+class Prompt:
+    messages: list
+    breakdown: dict = field(default_factory=dict)
+    static_version: str = ""
+
+# Forme canonique d'un texte (voir cleaning.collapse_whitespace) : deux textes qui ne diffèrent
+# que par leurs blancs donnent ainsi exactement les mêmes tokens
+@lru_cache(maxsize=64)
+def canonical_text(text):
+    return collapse_whitespace(text)
+
+# Version de la partie fixe du prompt : change dès qu'un de ses octets change
+def static_version(messages):
+    digest = hashlib.blake2b(digest_size=6)
+    for message in messages:
+        digest.update(f"{message['role']}\0{message['content']}\0".encode("utf-8"))
+    return f"v{PROMPT_LAYOUT_VERSION}-{digest.hexdigest()}"
+
+# Résumé déterministe des échanges écartés : le début de chaque message, sans appel au modèle
+def truncate_summary(turns, max_tokens):
+    lines = [
+        f"- {ROLE_LABELS.get(message['role'], message['role'])} : "
+        f"{truncate_to_tokens(' '.join(message['content'].split()), SUMMARY_EXCERPT_TOKENS)}"
+        for message in turns
+    ]
+    return truncate_to_tokens("\n".join(lines), max_tokens)
+
+# Assembler le prompt dans un budget de tokens strict.
+# La consigne et la question sont toujours envoyées. Le contexte de la base puis le texte du PDF
+# complémentaire (au plus SUPPLEMENTAL_TOKEN_BUDGET tokens) sont tronqués si besoin, en laissant
+# une réserve pour l'historique. L'historique garde ensuite les échanges les plus récents qui
+# tiennent dans ce qui reste ; les plus anciens sont résumés par summarizer(turns, max_tokens),
+# ou tronqués de façon déterministe à défaut de modèle.
+# Disposition "prefix" (layout) : les textes sont mis sous forme canonique et les messages vont du
+# plus stable au plus variable. static_knowledge indique que knowledge_text est le même à chaque
+# appel (base complète) : il rejoint alors la partie fixe et n'entre pas dans token_budget ; il n'est
+# tronqué qu'au-delà de PROMPT_STATIC_KNOWLEDGE_MAX_TOKENS, et breakdown["knowledge_truncated"]
+# donne le nombre de tokens retirés. Sinon (passages choisis pour la question), il est envoyé avec la question.
+def build_prompt(system_prompt, knowledge_text, conversation_history, user_input, supplemental_text="",
+                 token_budget=PROMPT_TOKEN_BUDGET, summarizer=None, layout=PROMPT_LAYOUT, static_knowledge=False):
+    prefix_layout = layout == "prefix"
+    if prefix_layout:
+        system_prompt = canonical_text(system_prompt)
+        knowledge_text = canonical_text(knowledge_text)
+        supplemental_text = canonical_text(supplemental_text)
+        user_input = canonical_text(user_input)
+        conversation_history = [
+            {"role": message["role"], "content": canonical_text(message["content"])} for message in conversation_history
+        ]
+
+    breakdown = {"budget": token_budget}
+    breakdown["system"] = count_text_tokens(system_prompt)
+    breakdown["question"] = count_text_tokens(user_input)
+    if prefix_layout:
+        breakdown["question"] += count_text_tokens(QUESTION_HEADER)
+    remaining = token_budget - breakdown["system"] - breakdown["question"]
+
+    history_tokens = [count_text_tokens(message["content"]) for message in conversation_history]
+    reserve = min(PROMPT_HISTORY_RESERVED_TOKENS, sum(history_tokens))
+
+    header_tokens = count_text_tokens(KNOWLEDGE_HEADER)
+    knowledge_tokens = count_text_tokens(knowledge_text)
+    if static_knowledge:
+        # Base fixe : hors budget, la même quels que soient la question et l'historique
+        knowledge_text = truncate_to_tokens(knowledge_text, PROMPT_STATIC_KNOWLEDGE_MAX_TOKENS - header_tokens)
+    else:
+        knowledge_text = truncate_to_tokens(knowledge_text, remaining - reserve - header_tokens)
+    breakdown["knowledge"] = header_tokens + count_text_tokens(knowledge_text)
+    breakdown["knowledge_truncated"] = knowledge_tokens - (breakdown["knowledge"] - header_tokens)
+    if not static_knowledge:
+        remaining -= breakdown["knowledge"]
+
+    breakdown["supplemental"] = 0
+    if supplemental_text:
+        header_tokens = count_text_tokens(SUPPLEMENTAL_HEADER)
+        supplemental_budget = remaining - reserve - header_tokens
+        if SUPPLEMENTAL_TOKEN_BUDGET:
+            supplemental_budget = min(supplemental_budget, SUPPLEMENTAL_TOKEN_BUDGET)
+        supplemental_text = truncate_to_tokens(supplemental_text, supplemental_budget)
+        if supplemental_text:
+            breakdown["supplemental"] = header_tokens + count_text_tokens(supplemental_text)
+            remaining -= breakdown["supplemental"]
+
+    # Échanges récents, du plus récent au plus ancien, tant qu'il reste de la place
+    # (en gardant de quoi résumer le reste s'il y en a)
+    kept = len(conversation_history)
+    used = 0
+    while kept > 0:
+        summary_room = min(PROMPT_SUMMARY_MAX_TOKENS, remaining // 4) if kept > 1 else 0
+        if used + history_tokens[kept - 1] > remaining - summary_room:
+            break
+        used += history_tokens[kept - 1]
+        kept -= 1
+    recent_history = conversation_history[kept:]
+    dropped_history = conversation_history[:kept]
+    breakdown["history"] = used
+    breakdown["dropped_messages"] = len(dropped_history)
+    remaining -= used
+
+    summary = ""
+    breakdown["summary"] = 0
+    if dropped_history:
+        header_tokens = count_text_tokens(SUMMARY_HEADER)
+        summary_budget = min(PROMPT_SUMMARY_MAX_TOKENS, remaining) - header_tokens
+        if summary_budget > 0:
+            summary = (summarizer or truncate_summary)(dropped_history, summary_budget)
+            summary = truncate_to_tokens(summary, summary_budget)
+        if summary:
+            breakdown["summary"] = header_tokens + count_text_tokens(summary)
+
+    knowledge_message = {"role": "system", "content": f"{KNOWLEDGE_HEADER}{knowledge_text}"}
+    messages = [{"role": "system", "content": system_prompt}]
+    static_messages = list(messages)
+    if not prefix_layout or static_knowledge:
+        messages.append(knowledge_message)
+        if static_knowledge:
+            static_messages.append(knowledge_message)
+    if summary:
+        messages.append({"role": "system", "content": f"{SUMMARY_HEADER}{summary}"})
+    messages.extend(recent_history)
+
+    if prefix_layout:
+        # Partie variable en fin de prompt : passages choisis, PDF, puis la question
+        sections = []
+        if not static_knowledge:
+            sections.append(knowledge_message["content"])
+        if supplemental_text:
+            sections.append(f"{SUPPLEMENTAL_HEADER.lstrip()}{supplemental_text}")
+        sections.append(f"{QUESTION_HEADER.lstrip()}{user_input}")
+        messages.append({"role": "user", "content": "\n\n".join(sections)})
+    else:
+        if supplemental_text:
+            user_input = f"{user_input}{SUPPLEMENTAL_HEADER}{supplemental_text}"
+        messages.append({"role": "user", "content": user_input})
+
+    breakdown["total"] = sum(
+        breakdown[section] for section in ("system", "question", "knowledge", "supplemental", "history", "summary")
+    )
+    return Prompt(messages, breakdown, static_version(static_messages))
+
+# Granularité du début commun à l'intérieur d'un message : le cache de prompt du fournisseur
+# réutilise le début d'un prompt par blocs de 128 tokens
+PREFIX_BLOCK_TOKENS = 128
+
+# Empreinte d'un message gardée par PrefixTracker à la place de son contenu : rôle, empreinte du
+# contenu, nombre de tokens et empreintes cumulées du début du contenu, tous les PREFIX_BLOCK_TOKENS
+@dataclass(frozen=True)
+class MessageFingerprint:
+    role: str
+    digest: bytes
+    tokens: int
+    blocks: tuple = ()
+
+def content_digest(content):
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).digest()
+
+# Empreinte d'un message ; known (empreinte du même message lors de l'appel précédent) est reprise
+# telle quelle si le contenu n'a pas changé, sans réencoder le texte
+def message_fingerprint(message, known=None, block_tokens=PREFIX_BLOCK_TOKENS):
+    digest = content_digest(message["content"])
+    if known is not None and known.role == message["role"] and known.digest == digest:
+        return known
+    tokens = encode(message["content"])
+    running = hashlib.blake2b(digest_size=8)
+    blocks = []
+    for start in range(0, len(tokens) - block_tokens + 1, block_tokens):
+        running.update(",".join(map(str, tokens[start:start + block_tokens])).encode("utf-8") + b";")
+        blocks.append(running.digest())
+    return MessageFingerprint(message["role"], digest, len(tokens), tuple(blocks))
+
+# Nombre de tokens en tête de messages identiques à ceux de previous (empreintes) : messages entiers
+# identiques, puis blocs communs au début du premier message qui diffère (même rôle)
+def shared_prefix_tokens(previous, current, block_tokens=PREFIX_BLOCK_TOKENS):
+    shared = 0
+    for before, after in zip(previous, current):
+        if before.role == after.role and before.digest == after.digest:
+            shared += after.tokens
+            continue
+        if before.role == after.role:
+            common = 0
+            for left, right in zip(before.blocks, after.blocks):
+                if left != right:
+                    break
+                common += 1
+            shared += common * block_tokens
+        break
+    return shared
+
+# Début de prompt partagé avec l'appel précédent d'une même conversation (par clé, par exemple
+# l'identifiant de session). Le fournisseur ne facture et ne recalcule pas un préfixe qu'il a déjà
+# vu récemment : ce nombre indique la part du prompt qui peut en profiter.
+# Seules les empreintes des messages sont gardées, pour au plus max_keys conversations et
+# ttl_seconds après leur dernier appel.
+class PrefixTracker:
+    def __init__(self, max_keys=SESSION_MAX_SESSIONS, ttl_seconds=SESSION_TTL_SECONDS):
+        self.max_keys = max_keys
+        self.ttl_seconds = ttl_seconds
+        self._previous = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Oublier les conversations sans appel depuis ttl_seconds (les plus anciennes sont en tête)
+    def _expire(self, now):
+        while self._previous:
+            key, (observed_at, _) = next(iter(self._previous.items()))
+            if now - observed_at < self.ttl_seconds:
+                break
+            del self._previous[key]
+
+    # Enregistrer les messages d'un appel et retourner le nombre de tokens partagés avec le précédent
+    def observe(self, key, messages):
+        with self._lock:
+            self._expire(time.time())
+            entry = self._previous.get(key)
+        previous = entry[1] if entry is not None else ()
+        # Seuls les messages nouveaux ou modifiés sont encodés, hors verrou
+        fingerprints = tuple(
+            message_fingerprint(message, previous[position] if position < len(previous) else None)
+            for position, message in enumerate(messages)
+        )
+        with self._lock:
+            self._previous[key] = (time.time(), fingerprints)
+            self._previous.move_to_end(key)
+            while len(self._previous) > self.max_keys:
+                self._previous.popitem(last=False)
+        return shared_prefix_tokens(previous, fingerprints) if entry is not None else 0
@@ -0,0 +1,248 @@
+import hashlib
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+
+import numpy as np
+from .config import CHUNK_MAX_CHARS, RETRIEVAL_TOKEN_BUDGET, RETRIEVAL_TOP_K
+from .spreadsheets import FIELD_SEPARATOR
+from .tokens import count_text_tokens
+
+# Mots trop fréquents en français pour aider à départager les passages
+STOPWORDS = {
+    "a", "au", "aux", "avec", "ce", "ces", "dans", "de", "des", "du", "elle", "en", "est", "et",
+    "il", "je", "la", "le", "les", "leur", "lui", "ma", "mais", "me", "mes", "mon", "ne", "nous",
+    "on", "ou", "par", "pas", "pour", "qu", "que", "qui", "sa", "se", "ses", "son", "sur", "ta",
+    "te", "tes", "ton", "tu", "un", "une", "vos", "votre", "vous", "y",
+}
+
+WORD_PATTERN = re.compile(r"\w+")
+
+# Passage d'un document de la base de connaissances.
+# key : pour une ligne de tableau, la valeur de sa colonne clé (acte, plan de traitement)
+@dataclass(frozen=True)
+class Chunk:
+    source: str
+    position: int
+    text: str
+    key: str = ""
+
+# Texte en minuscules et sans accents
+def normalize_text(text):
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+# Ramener un mot au singulier de façon grossière (implants -> implant, travaux -> travau)
+def singular(word):
+    if len(word) > 3 and word[-1] in "sx":
+        return word[:-1]
+    return word
+
+# Découper un texte en termes normalisés (minuscules, sans accents, sans mots vides, au singulier)
+def tokenize(text):
+    return [singular(word) for word in WORD_PATTERN.findall(normalize_text(text)) if word not in STOPWORDS]
+
+# Termes qui identifient la clé d'une ligne de tableau (sans les précisions entre parenthèses)
+def key_terms(key):
+    return frozenset(tokenize(key.split("(")[0]))
+
+# Découper le texte d'un document en passages d'au plus max_chars caractères
+def split_into_chunks(source, text, max_chars=CHUNK_MAX_CHARS):
+    pieces = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        # Une ligne trop longue est coupée sur les espaces
+        while len(line) > max_chars:
+            cut = line.rfind(" ", 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            pieces.append(line[:cut])
+            line = line[cut:].strip()
+        if line:
+            pieces.append(line)
+
+    chunks = []
+    current = []
+    current_length = 0
+    for piece in pieces:
+        if current and current_length + len(piece) + 1 > max_chars:
+            chunks.append(Chunk(source, len(chunks), "\n".join(current)))
+            current = []
+            current_length = 0
+        current.append(piece)
+        current_length += len(piece) + 1
+    if current:
+        chunks.append(Chunk(source, len(chunks), "\n".join(current)))
+    return chunks
+
+# Découper un tableau sérialisé (voir spreadsheets.serialize_row) : une ligne de tableau par passage,
+# pour qu'une question sur un acte n'amène que les lignes qui le concernent
+def split_table_rows(source, text, max_chars=CHUNK_MAX_CHARS):
+    chunks = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        key = line.split(FIELD_SEPARATOR, 1)[0] if FIELD_SEPARATOR in line else ""
+        for piece in split_into_chunks(source, line, max_chars):
+            chunks.append(Chunk(source, len(chunks), piece.text, key))
+    return chunks
+
+# Découper un document selon son type
+def split_document(source, text, max_chars=CHUNK_MAX_CHARS):
+    if source.endswith(".xlsx"):
+        return split_table_rows(source, text, max_chars)
+    return split_into_chunks(source, text, max_chars)
+
+# Occurrences des termes de chaque passage
+def chunk_term_counts(chunks):
+    return [Counter(tokenize(chunk.text)) for chunk in chunks]
+
+# Empreinte du contenu indexé : change dès qu'un passage de la base change
+def corpus_version(chunks):
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(f"{chunk.source}\0{chunk.position}\0".encode("utf-8"))
+        digest.update(chunk.text.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+# Index BM25 local des passages de la base de connaissances.
+# Les occurrences sont rangées terme par terme (matrice creuse au format CSC) :
+# les passages contenant le terme t sont doc_ids[indptr[t]:indptr[t + 1]].
+class KnowledgeIndex:
+    # term_counts : occurrences des termes de chaque passage, si elles sont déjà connues
+    # (le rechargement à chaud les réutilise pour les documents inchangés)
+    def __init__(self, chunks, k1=1.5, b=0.75, term_counts=None):
+        self.chunks = list(chunks)
+        self.k1 = k1
+        self.b = b
+        self.version = corpus_version(self.chunks)
+        if term_counts is None:
+            term_counts = chunk_term_counts(self.chunks)
+
+        postings = {}
+        lengths = []
+        for doc_id, terms in enumerate(term_counts):
+            lengths.append(sum(terms.values()))
+            for term, frequency in terms.items():
+                postings.setdefault(term, []).append((doc_id, frequency))
+
+        self.vocabulary = {term: term_id for term_id, term in enumerate(sorted(postings))}
+        indptr = [0]
+        doc_ids = []
+        frequencies = []
+        for term in sorted(postings):
+            for doc_id, frequency in postings[term]:
+                doc_ids.append(doc_id)
+                frequencies.append(frequency)
+            indptr.append(len(doc_ids))
+
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        self.frequencies = np.asarray(frequencies, dtype=np.float32)
+        self.lengths = np.asarray(lengths, dtype=np.float32)
+        self.average_length = float(self.lengths.mean()) if len(self.chunks) else 0.0
+
+        # Index des lignes de tableau par clé : termes de la clé -> passages
+        self.keys = {}
+        for doc_id, chunk in enumerate(self.chunks):
+            if chunk.key:
+                self.keys.setdefault(key_terms(chunk.key), []).append(doc_id)
+        self.keys.pop(frozenset(), None)
+
+        document_frequencies = np.diff(self.indptr).astype(np.float32)
+        count = len(self.chunks)
+        self.idf = np.log(1.0 + (count - document_frequencies + 0.5) / (document_frequencies + 0.5))
+
+    # Index dont les tableaux sont déjà calculés (voir index_store.load_index) : chunks et vocabulary
+    # peuvent être des vues sur des fichiers projetés en mémoire plutôt qu'une liste et un dictionnaire
+    @classmethod
+    def from_arrays(cls, chunks, vocabulary, keys, indptr, doc_ids, frequencies, lengths, idf, version,
+                    k1=1.5, b=0.75):
+        index = cls.__new__(cls)
+        index.chunks = chunks
+        index.k1 = k1
+        index.b = b
+        index.version = version
+        index.vocabulary = vocabulary
+        index.keys = keys
+        index.indptr = indptr
+        index.doc_ids = doc_ids
+        index.frequencies = frequencies
+        index.lengths = lengths
+        index.average_length = float(lengths.mean()) if len(chunks) else 0.0
+        index.idf = idf
+        return index
+
+    # Construire l'index à partir d'une liste de couples (nom, texte)
+    @classmethod
+    def from_documents(cls, documents, max_chars=CHUNK_MAX_CHARS):
+        chunks = []
+        for source, text in documents:
+            chunks.extend(split_document(source, text, max_chars))
+        return cls(chunks)
+
+    # Scores BM25 de tous les passages pour une question
+    def score(self, query):
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        if not self.chunks:
+            return scores
+        norm = self.k1 * (1.0 - self.b + self.b * self.lengths / max(self.average_length, 1.0))
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.frequencies[start:end]
+            scores[docs] += self.idf[term_id] * tf * (self.k1 + 1.0) / (tf + norm[docs])
+        return scores
+
+    # Les top_k passages les plus pertinents, avec leur score
+    def search(self, query, top_k=RETRIEVAL_TOP_K):
+        scores = self.score(query)
+        if not len(scores):
+            return []
+        top_k = min(top_k, len(scores))
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        ranked = sorted(candidates, key=lambda doc_id: (-scores[doc_id], doc_id))
+        return [(float(scores[doc_id]), self.chunks[doc_id]) for doc_id in ranked if scores[doc_id] > 0]
+
+    # Lignes de tableau dont la clé est entièrement citée dans la question.
+    # Si plusieurs clés correspondent, seules les plus précises (le plus de termes) sont retenues.
+    def lookup(self, query):
+        terms = set(tokenize(query))
+        matches = [key for key in self.keys if key <= terms]
+        if not matches:
+            return []
+        longest = max(len(key) for key in matches)
+        return [self.chunks[doc_id] for key in matches if len(key) == longest for doc_id in self.keys[key]]
+
+    # Sélectionner les passages pertinents dans la limite du budget de tokens :
+    # d'abord les lignes de tableau trouvées par leur clé, puis les meilleurs résultats BM25
+    def select_chunks(self, query, top_k=RETRIEVAL_TOP_K, token_budget=RETRIEVAL_TOKEN_BUDGET):
+        selected = []
+        used_tokens = 0
+        candidates = self.lookup(query) + [chunk for _, chunk in self.search(query, top_k)]
+        for chunk in candidates:
+            if chunk in selected:
+                continue
+            chunk_tokens = count_text_tokens(chunk.text)
+            if used_tokens + chunk_tokens > token_budget:
+                continue
+            selected.append(chunk)
+            used_tokens += chunk_tokens
+        # Remettre les passages dans l'ordre des documents pour garder la lecture cohérente
+        return sorted(selected, key=lambda chunk: (chunk.source, chunk.position))
+
+    # Texte de contexte à envoyer au modèle pour une question
+    def build_context(self, query, top_k=RETRIEVAL_TOP_K, token_budget=RETRIEVAL_TOKEN_BUDGET):
+        return format_chunks(self.select_chunks(query, top_k, token_budget))
+
+# Mettre en forme les passages retenus en indiquant leur document d'origine
+def format_chunks(chunks):
+    return "\n\n".join(f"[{chunk.source}]\n{chunk.text}" for chunk in chunks)
@@ -0,0 +1,206 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+from .config import (
+    SESSION_BACKEND,
+    SESSION_DB_PATH,
+    SESSION_HISTORY_TOKEN_BUDGET,
+    SESSION_MAX_SESSIONS,
+    SESSION_TTL_SECONDS,
+)
+from .tokens import count_text_tokens, truncate_to_tokens
+
+# Stockage en mémoire du processus : LRU borné en nombre de sessions, avec expiration
+class MemorySessionBackend:
+    def __init__(self, max_sessions=SESSION_MAX_SESSIONS, ttl_seconds=SESSION_TTL_SECONDS):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            return self._get(session_id)
+
+    def _get(self, session_id):
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return []
+        updated_at, history = entry
+        if time.time() - updated_at > self.ttl_seconds:
+            del self._sessions[session_id]
+            return []
+        self._sessions.move_to_end(session_id)
+        return list(history)
+
+    def save(self, session_id, history):
+        with self._lock:
+            self._save(session_id, history)
+
+    def _save(self, session_id, history):
+        self._sessions[session_id] = (time.time(), list(history))
+        self._sessions.move_to_end(session_id)
+        self._evict()
+
+    # Remplacer l'historique d'une session par function(historique) sans qu'une autre requête
+    # ne puisse modifier la session entre la lecture et l'écriture
+    def update(self, session_id, function):
+        with self._lock:
+            self._save(session_id, function(self._get(session_id)))
+
+    def _evict(self):
+        # Les sessions les moins récemment utilisées sont en tête
+        now = time.time()
+        while self._sessions:
+            session_id, (updated_at, _) = next(iter(self._sessions.items()))
+            if len(self._sessions) > self.max_sessions or now - updated_at > self.ttl_seconds:
+                del self._sessions[session_id]
+            else:
+                break
+
+    def __len__(self):
+        return len(self._sessions)
+
+# Stockage SQLite : partagé par plusieurs workers uvicorn sur la même machine
+class SQLiteSessionBackend:
+    def __init__(self, path=SESSION_DB_PATH, max_sessions=SESSION_MAX_SESSIONS, ttl_seconds=SESSION_TTL_SECONDS):
+        self.path = Path(path)
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, history TEXT, updated_at REAL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    # Transaction qui prend tout de suite le verrou d'écriture de la base : deux workers
+    # ne peuvent pas lire la même session puis l'écrire chacun de leur côté
+    @contextmanager
+    def _write_transaction(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+    def get(self, session_id):
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT history, updated_at FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return []
+            if time.time() - row[1] > self.ttl_seconds:
+                connection.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+                return []
+            connection.execute("UPDATE sessions SET updated_at = ? WHERE id = ?", (time.time(), session_id))
+            return json.loads(row[0])
+
+    def save(self, session_id, history):
+        with self._connect() as connection:
+            self._save(connection, session_id, history)
+
+    def _save(self, connection, session_id, history):
+        now = time.time()
+        connection.execute(
+            "INSERT OR REPLACE INTO sessions (id, history, updated_at) VALUES (?, ?, ?)",
+            (session_id, json.dumps(history, ensure_ascii=False), now),
+        )
+        # Expiration puis éviction des sessions les plus anciennes au-delà du maximum
+        connection.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl_seconds,))
+        connection.execute(
+            "DELETE FROM sessions WHERE id IN ("
+            "SELECT id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_sessions,),
+        )
+
+    # Remplacer l'historique d'une session par function(historique), lecture et écriture
+    # dans une même transaction
+    def update(self, session_id, function):
+        with self._write_transaction() as connection:
+            row = connection.execute(
+                "SELECT history, updated_at FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            history = json.loads(row[0]) if row and time.time() - row[1] <= self.ttl_seconds else []
+            self._save(connection, session_id, function(history))
+
+    def __len__(self):
+        with self._connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+# Historique des conversations par identifiant de session.
+# history_token_budget borne seulement la mémoire d'une session, bien au-delà de ce qu'un prompt
+# peut contenir : c'est build_prompt qui choisit les échanges envoyés au modèle et résume les
+# plus anciens. Seuls les échanges au-delà de cette borne sont oubliés.
+class SessionStore:
+    def __init__(self, backend, history_token_budget=SESSION_HISTORY_TOKEN_BUDGET):
+        self.backend = backend
+        self.history_token_budget = history_token_budget
+
+    def get_history(self, session_id):
+        return self.backend.get(session_id)
+
+    # Ajouter un échange question/réponse à la session. La lecture et l'écriture de l'historique
+    # sont faites d'un seul tenant : deux requêtes simultanées sur la même session gardent
+    # chacune leur échange.
+    def append_turn(self, session_id, user_message, assistant_message):
+        turn = [{"role": "user", "content": user_message}, {"role": "assistant", "content": assistant_message}]
+        self.backend.update(session_id, lambda history: trim_history(history + turn, self.history_token_budget))
+
+# Garder les derniers échanges dont le total de tokens tient dans le budget.
+# Les échanges (question + réponse) sont retirés entiers, en commençant par les plus anciens ;
+# le dernier est toujours gardé, tronqué s'il dépasse à lui seul le budget.
+def trim_history(history, token_budget):
+    kept = []
+    used_tokens = 0
+    end = len(history)
+    while end > 0:
+        start = max(end - 2, 0)
+        turn = history[start:end]
+        turn_tokens = sum(count_text_tokens(message["content"]) for message in turn)
+        if used_tokens + turn_tokens > token_budget:
+            if not kept:
+                kept = truncate_turn(turn, token_budget)
+            break
+        kept[:0] = turn
+        used_tokens += turn_tokens
+        end = start
+    return kept
+
+# Tronquer les messages d'un échange pour qu'il tienne dans token_budget : chaque message reçoit
+# une part égale de ce qui reste, la part inutilisée d'un message court revient aux suivants
+def truncate_turn(turn, token_budget):
+    truncated = []
+    remaining = token_budget
+    for position, message in enumerate(turn):
+        content = truncate_to_tokens(message["content"], remaining // (len(turn) - position))
+        remaining -= count_text_tokens(content)
+        truncated.append({"role": message["role"], "content": content})
+    return truncated
+
+# Magasin de sessions configuré par ASSISTANT_SESSION_BACKEND
+def create_session_store():
+    if SESSION_BACKEND == "sqlite":
+        return SessionStore(SQLiteSessionBackend())
+    return SessionStore(MemorySessionBackend())
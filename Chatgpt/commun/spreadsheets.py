@@ -0,0 +1,110 @@
+import datetime
+import math
+from dataclasses import dataclass, field
+from importlib.util import find_spec
+
+from .lazy_imports import load
+
+# Séparateur des champs d'une ligne de tableau sérialisée ; le premier champ est la clé de la ligne
+FIELD_SEPARATOR = " | "
+
+# Moteur de lecture Excel : calamine (python-calamine, dans requirements.txt), bien plus rapide
+# qu'openpyxl ; openpyxl, le moteur par défaut de pandas, s'il n'est pas installé
+EXCEL_ENGINE = "calamine" if find_spec("python_calamine") is not None else None
+
+# Ligne d'un tableau : feuille, clé (valeur de la première colonne, reportée sur les lignes
+# de continuation) et valeurs typées par en-tête de colonne
+@dataclass
+class SheetRow:
+    sheet: str
+    key: str
+    fields: dict = field(default_factory=dict)
+
+# Texte d'une feuille hors tableau (titres, mentions de version)
+@dataclass
+class SheetNote:
+    sheet: str
+    text: str
+
+# Valeur de cellule vide (NaN, None, chaîne vide)
+def is_empty(value):
+    if value is None:
+        return True
+    if isinstance(value, float) and math.isnan(value):
+        return True
+    return isinstance(value, str) and not value.strip()
+
+# Valeur de cellule mise en forme compacte : espaces regroupés, dates sans heure à minuit
+def format_value(value):
+    if isinstance(value, datetime.datetime):
+        if (value.hour, value.minute, value.second) == (0, 0, 0):
+            return value.date().isoformat()
+        return value.isoformat(sep=" ")
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return " ".join(str(value).split())
+
+# Ligne d'en-tête d'une feuille : la première dont au moins la moitié des cellules sont remplies
+def find_header_row(rows):
+    for number, row in enumerate(rows):
+        filled = sum(not is_empty(value) for value in row)
+        if row and filled >= max(2, len(row) / 2):
+            return number
+    return None
+
+# En-têtes de colonnes, rendus uniques (une colonne sans titre ou un titre répété reçoit un suffixe)
+def unique_headers(row):
+    headers = []
+    seen = {}
+    for column, value in enumerate(row):
+        header = format_value(value) if not is_empty(value) else f"Colonne {column + 1}"
+        seen[header] = seen.get(header, 0) + 1
+        headers.append(header if seen[header] == 1 else f"{header} ({seen[header]})")
+    return headers
+
+# Lire toutes les feuilles d'un classeur en lignes typées
+def read_rows_from_excel(file_path):
+    sheets = load("pandas").read_excel(file_path, sheet_name=None, header=None, dtype=object, engine=EXCEL_ENGINE)
+    items = []
+    for sheet_name, df in sheets.items():
+        rows = df.values.tolist()
+        header_row = find_header_row(rows)
+        if header_row is None:
+            header_row = len(rows)
+
+        for row in rows[:header_row]:
+            values = [format_value(value) for value in row if not is_empty(value)]
+            if values:
+                items.append(SheetNote(sheet_name, " ".join(values)))
+        if header_row == len(rows):
+            continue
+
+        headers = unique_headers(rows[header_row])
+        key = ""
+        for row in rows[header_row + 1:]:
+            if all(is_empty(value) for value in row):
+                continue
+            if not is_empty(row[0]):
+                key = format_value(row[0])
+            # Une ligne dont seule la clé est remplie (acte sans détail) est gardée : la recherche
+            # par clé doit pouvoir la trouver
+            fields = {headers[column]: format_value(value)
+                      for column, value in enumerate(row) if column > 0 and not is_empty(value)}
+            items.append(SheetRow(sheet_name, key, fields))
+    return items
+
+# Une ligne de tableau sur une seule ligne de texte : "clé | Feuille : ... | En-tête : valeur | ..."
+def serialize_row(row):
+    parts = [row.key, f"Feuille : {row.sheet}"]
+    parts.extend(f"{header} : {value}" for header, value in row.fields.items())
+    return FIELD_SEPARATOR.join(parts)
+
+# Lire le contenu d'un fichier Excel : toutes les feuilles, une ligne de texte par ligne de tableau
+def read_text_from_excel(file_path):
+    lines = []
+    for item in read_rows_from_excel(file_path):
+        if isinstance(item, SheetRow):
+            lines.append(serialize_row(item))
+        else:
+            lines.append(f"{item.sheet} : {item.text}")
+    return "\n".join(lines)
@@ -0,0 +1,86 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+import tiktoken
+
+from .config import OPENAI_MODEL, TOKEN_COUNT_CACHE_SIZE
+
+# Nombres de tokens déjà calculés, par (modèle, empreinte du texte), du plus ancien au plus récent.
+# Les parties fixes du prompt (consigne, passages de la base, anciens messages de l'historique)
+# ne sont ainsi encodées qu'une fois : seuls les textes nouveaux passent par le tokenizer.
+_token_counts = OrderedDict()
+_token_counts_lock = threading.Lock()
+_token_counts_stats = {"hits": 0, "misses": 0}
+
+# Temps passé à compter les tokens pendant la mesure en cours (voir measure_token_counting)
+_counting_time = ContextVar("token_counting_time", default=None)
+
+# Encodeur tiktoken du modèle, construit une seule fois par processus
+@lru_cache(maxsize=None)
+def get_encoding(model=OPENAI_MODEL):
+    return tiktoken.encoding_for_model(model)
+
+# Encoder un texte ; les marqueurs spéciaux éventuellement présents sont traités comme du texte
+def encode(text, model=OPENAI_MODEL):
+    return get_encoding(model).encode(text, disallowed_special=())
+
+# Mesurer le temps passé à compter les tokens dans un bloc : with measure_token_counting() as elapsed,
+# puis elapsed[0] contient la durée cumulée en secondes
+@contextmanager
+def measure_token_counting():
+    elapsed = [0.0]
+    token = _counting_time.set(elapsed)
+    try:
+        yield elapsed
+    finally:
+        _counting_time.reset(token)
+
+# Compter les tokens d'un texte
+def count_text_tokens(text, model=OPENAI_MODEL):
+    elapsed = _counting_time.get()
+    if elapsed is None:
+        return _count_text_tokens(text, model)
+    started = time.perf_counter()
+    try:
+        return _count_text_tokens(text, model)
+    finally:
+        elapsed[0] += time.perf_counter() - started
+
+def _count_text_tokens(text, model):
+    # L'empreinte coûte bien moins cher que l'encodage, même pour un long texte
+    key = (model, hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest())
+    with _token_counts_lock:
+        count = _token_counts.get(key)
+        if count is not None:
+            _token_counts.move_to_end(key)
+            _token_counts_stats["hits"] += 1
+            return count
+
+    count = len(encode(text, model))
+    with _token_counts_lock:
+        _token_counts_stats["misses"] += 1
+        _token_counts[key] = count
+        if len(_token_counts) > TOKEN_COUNT_CACHE_SIZE:
+            _token_counts.popitem(last=False)
+    return count
+
+# Fonction pour compter les tokens
+def count_tokens(messages, model=OPENAI_MODEL):
+    return sum(count_text_tokens(message["content"], model) for message in messages)
+
+# Tronquer un texte pour qu'il tienne en max_tokens tokens
+def truncate_to_tokens(text, max_tokens, model=OPENAI_MODEL):
+    if max_tokens <= 0:
+        return ""
+    if count_text_tokens(text, model) <= max_tokens:
+        return text
+    return get_encoding(model).decode(encode(text, model)[:max_tokens])
+
+# Compteurs du cache des nombres de tokens
+def token_count_stats():
+    with _token_counts_lock:
+        return dict(_token_counts_stats, size=len(_token_counts))
@@ -0,0 +1,48 @@
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+
+from .config import UPLOAD_CHUNK_BYTES, UPLOAD_MAX_BYTES
+
+# Envoi refusé car trop volumineux
+class UploadTooLargeError(Exception):
+    pass
+
+# PDF envoyé, recopié dans un fichier temporaire : l'extraction ouvre ce fichier
+# et ne charge en mémoire que les pages qu'elle lit
+@dataclass
+class StoredUpload:
+    path: str
+    sha256: str
+    size: int
+
+    # Supprimer le fichier temporaire (sans erreur s'il l'a déjà été)
+    def discard(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+# Recopier un fichier envoyé (objet fichier) dans un fichier temporaire, morceau par morceau,
+# en calculant son empreinte au passage. Au plus chunk_size octets sont en mémoire à la fois ;
+# au-delà de max_bytes, la copie est abandonnée et UploadTooLargeError est levée.
+def save_upload(source, max_bytes=UPLOAD_MAX_BYTES, chunk_size=UPLOAD_CHUNK_BYTES, suffix=".pdf"):
+    digest = hashlib.sha256()
+    size = 0
+    descriptor, path = tempfile.mkstemp(prefix="upload-", suffix=suffix)
+    try:
+        with os.fdopen(descriptor, "wb") as target:
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(f"Fichier trop volumineux (maximum {max_bytes / (1024 * 1024):g} Mo).")
+                digest.update(chunk)
+                target.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return StoredUpload(path, digest.hexdigest(), size)
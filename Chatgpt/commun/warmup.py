@@ -0,0 +1,70 @@
+import threading
+import time
+
+from .config import WARMUP_STEPS
+from .lazy_imports import import_report, load
+from .metrics import get_logger
+from .ocr import get_ocr_reader
+from .tokens import count_text_tokens
+
+# Étapes de préchauffage : chacune charge ce que le premier traitement concerné chargerait sinon
+WARMUP_FUNCTIONS = {
+    "documents": lambda: [load(name) for name in ("PyPDF2", "docx", "pandas")],
+    "pdf": lambda: load("fitz"),
+    "ocr": get_ocr_reader,
+    "tokens": lambda: count_text_tokens("préchauffage"),
+}
+
+logger = get_logger()
+
+# État du préchauffage du processus : durée de chaque étape, erreurs, fin
+_state = {"started": False, "done": False, "seconds": {}, "errors": {}}
+_lock = threading.Lock()
+
+# Exécuter les étapes de préchauffage dans l'ordre. Une étape qui échoue (dépendance absente,
+# modèle introuvable) est notée et n'empêche pas les suivantes : le traitement concerné
+# retentera le chargement et signalera l'erreur à son tour.
+def warm_up(steps=WARMUP_STEPS):
+    _state["started"] = True
+    for step in steps:
+        started = time.perf_counter()
+        try:
+            if step not in WARMUP_FUNCTIONS:
+                raise ValueError(f"étape inconnue (possibles : {', '.join(WARMUP_FUNCTIONS)})")
+            WARMUP_FUNCTIONS[step]()
+            _state["seconds"][step] = round(time.perf_counter() - started, 3)
+            logger.info("Préchauffage %s : %.2f s", step, _state["seconds"][step])
+        except Exception as e:
+            _state["errors"][step] = str(e)
+            logger.warning("Préchauffage %s impossible : %s", step, e)
+    _state["done"] = True
+    return warmup_report()
+
+# Lancer le préchauffage dans un thread d'arrière-plan, une seule fois par processus.
+# Retourne le thread, ou None s'il n'y a rien à faire ou s'il est déjà lancé.
+def start_warm_up(steps=WARMUP_STEPS):
+    with _lock:
+        if not steps or _state["started"]:
+            return None
+        _state["started"] = True
+    thread = threading.Thread(target=warm_up, args=(steps,), name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+# Rapport du préchauffage et des imports des dépendances lourdes (voir lazy_imports.import_report)
+def warmup_report():
+    return {
+        "started": _state["started"],
+        "done": _state["done"],
+        "seconds": dict(_state["seconds"]),
+        "errors": dict(_state["errors"]),
+        "imports": import_report(),
+    }
+
+# Mesure à froid : python -m commun.warmup [étapes...] (toutes par défaut) affiche la durée
+# de chaque étape et de chaque import dans un processus neuf
+if __name__ == "__main__":
+    import json
+    import sys
+
+    print(json.dumps(warm_up(sys.argv[1:] or list(WARMUP_FUNCTIONS)), indent=2, ensure_ascii=False))
@@ -1,14 +1,13 @@
 import os
 import streamlit as st
-from docx import Document
-import pandas as pd
-import PyPDF2
 import openai
-import fitz  # PyMuPDF
-import easyocr
 from pathlib import Path
 import tempfile
 
+# Les bibliothèques de lecture des documents (python-docx, PyPDF2, pandas) et d'OCR (PyMuPDF,
+# EasyOCR et torch) sont importées dans les fonctions qui s'en servent, au premier usage :
+# le démarrage de l'application ne paie pas leur chargement.
+
 # Fonction pour charger une base de connaissances depuis différents fichiers
 def load_knowledge_base_from_directory(directory_path):
     content = []
@@ -31,6 +30,7 @@ def load_knowledge_base_from_directory(directory_path):
 # Charger le contenu d'un fichier Word
 def load_text_from_word(file_path):
     try:
+        from docx import Document
         doc = Document(file_path)
         return "\n".join([paragraph.text.strip() for paragraph in doc.paragraphs if paragraph.text.strip()])
     except Exception as e:
@@ -39,6 +39,7 @@ def load_text_from_word(file_path):
 # Charger le contenu d'un fichier PDF
 def load_text_from_pdf(file_path):
     try:
+        import PyPDF2
         pdf_reader = PyPDF2.PdfReader(file_path)
         return "\n".join([page.extract_text() for page in pdf_reader.pages if page.extract_text()])
     except Exception as e:
@@ -47,6 +48,7 @@ def load_text_from_pdf(file_path):
 # Charger le contenu d'un fichier Excel
 def load_text_from_excel(file_path):
     try:
+        import pandas as pd
         df = pd.read_excel(file_path)
         return df.to_string(index=False)
     except Exception as e:
@@ -63,6 +65,8 @@ def load_text_from_html(file_path):
 # Fonction pour convertir un PDF en texte avec PyMuPDF et EasyOCR
 def extract_text_from_pdf_with_fitz(pdf_file):
     try:
+        import fitz  # PyMuPDF
+        import easyocr
         with tempfile.TemporaryDirectory() as image_output_dir:  # Crée un dossier temporaire
             pdf = fitz.open(pdf_file)
             image_files = []
@@ -89,7 +93,7 @@ def extract_text_from_pdf_with_fitz(pdf_file):
 
 # Fonction pour interroger OpenAI avec une base de connaissances, l'historique, et du texte complémentaire
 def query_openai_with_context(knowledge_base_text, conversation_history, user_input, supplemental_text=""):
-    openai.api_key = 'sk-svcacct-o02oKC-uWWx0ipescM5BsbE_xsGDz8RXLSLdw_Kl2gtLXKQARdqgzjXgiY-wtD2T3BlbkFJzsk8nOU18KNLXNq92pWp_DYJIiQOJjgL5yON_GbwaoTg6UvCJmLV4b1afEMGwAA'
+    openai.api_key = os.environ.get("OPENAI_API_KEY", 'Clé_api')
     try:
         messages = [
             {"role": "system", "content": "Vous êtes un assistant virtuel pour une mutuelle utilisant une base de connaissances issue de plusieurs documents. Si vous ne trouvez pas la réponse adéquate, formulez poliment une réponse. Vous devez parler comme si vous parliez à une personne humaine. Egalement l'idéale serait de demander à la personne si elle n'est pas encore adhérente chez nous et si non alors lui proposer un contrat en fonction de ses besoins. Pour ce faire, il faudra que vous détectiez les besoins de la personne et que vous lui proposiez la formule qui lui convient le mieux."},
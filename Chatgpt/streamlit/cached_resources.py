@@ -0,0 +1,70 @@
+import hashlib
+import streamlit as st
+
+from commun.catalogue import DocumentCatalogue
+from commun.documents import ingest_directory, list_supported_files
+from commun.config import UPLOAD_MAX_BYTES
+from commun.knowledge_base import file_state
+from commun.ocr import extract_pages_from_pdf
+from commun.retrieval import KnowledgeIndex
+from commun.warmup import start_warm_up
+
+# Ressources coûteuses partagées entre les reruns et entre les sessions des utilisateurs.
+# Streamlit réexécute tout le script à chaque interaction : sans ces caches, chaque clic relirait
+# le dossier de contexte et referait l'OCR du PDF joint.
+
+# Préchauffage (ASSISTANT_WARMUP) lancé en arrière-plan une seule fois par processus :
+# les reruns suivants retrouvent le thread en cache
+@st.cache_resource(show_spinner=False)
+def start_warmup():
+    return start_warm_up()
+
+# Empreinte du dossier de contexte (noms, tailles, dates de modification des fichiers) :
+# les ressources en cache sont reconstruites dès qu'un fichier est ajouté, modifié ou supprimé
+def directory_fingerprint(directory_path):
+    return tuple((path.name,) + file_state(path) for path in list_supported_files(directory_path))
+
+# Documents du dossier de contexte (résultat de ingest_directory)
+@st.cache_resource(show_spinner="Chargement de la base de connaissances...", max_entries=2)
+def load_documents(directory_path, fingerprint):
+    return ingest_directory(directory_path)
+
+# Texte complet de la base de connaissances, tous documents réunis
+@st.cache_resource(max_entries=2)
+def load_knowledge_base_text(directory_path, fingerprint):
+    return "\n".join(text for _, text in load_documents(directory_path, fingerprint).documents)
+
+# Index de recherche construit sur les documents du dossier de contexte
+@st.cache_resource(show_spinner="Indexation de la base de connaissances...", max_entries=2)
+def load_knowledge_index(directory_path, fingerprint):
+    return KnowledgeIndex.from_documents(load_documents(directory_path, fingerprint).documents)
+
+# Catalogue des documents à télécharger (devis...), construit une fois par processus et rechargé
+# en arrière-plan quand un fichier du dossier change : une demande de devis ne lit pas le disque
+@st.cache_resource(show_spinner=False)
+def load_catalogue(directory_path):
+    catalogue = DocumentCatalogue(directory_path)
+    catalogue.refresh()
+    catalogue.start_watching()
+    return catalogue
+
+# Empreinte SHA-256 du contenu d'un fichier téléversé, calculée une fois par fichier et par session
+def upload_digest(uploaded_file):
+    digests = st.session_state.setdefault("upload_digests", {})
+    file_id = getattr(uploaded_file, "file_id", None) or uploaded_file.name
+    if file_id not in digests:
+        digests[file_id] = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+    return digests[file_id]
+
+# Texte d'un PDF téléversé et nombre de pages par méthode, par empreinte du contenu :
+# le même fichier n'est analysé qu'une fois, quelle que soit la session qui l'envoie.
+# Le modèle d'OCR est chargé une seule fois par processus (commun.ocr.get_ocr_reader).
+@st.cache_data(show_spinner="Lecture du PDF...", max_entries=64)
+def extract_uploaded_pdf(content_hash, _pdf_bytes):
+    if len(_pdf_bytes) > UPLOAD_MAX_BYTES:
+        raise RuntimeError(f"Fichier trop volumineux (maximum {UPLOAD_MAX_BYTES / (1024 * 1024):g} Mo).")
+    extraction = extract_pages_from_pdf(_pdf_bytes)
+    if extraction.error:
+        # Les erreurs ne sont pas mises en cache : le fichier sera relu au prochain essai
+        raise RuntimeError(extraction.error)
+    return extraction.text, extraction.methods()
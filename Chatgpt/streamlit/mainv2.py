@@ -1,56 +1,41 @@
 import os
+import sys
 import streamlit as st
-from docx import Document
-import pandas as pd
-import PyPDF2
-import openai
-import fitz  # PyMuPDF
-import easyocr
 from pathlib import Path
-import tempfile
 
-# Fonction pour charger une base de connaissances depuis différents fichiers
+# Rendre le paquet commun importable depuis ce dossier
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from commun.llm_client import get_llm_client
+from commun.metrics import get_logger
+from commun.prompt import KNOWLEDGE_HEADER, PrefixTracker, build_prompt
+from commun.tokens import count_text_tokens
+from cached_resources import (
+    directory_fingerprint, extract_uploaded_pdf, load_documents, load_knowledge_base_text, start_warmup, upload_digest,
+)
+
+# Fonction pour charger une base de connaissances depuis différents fichiers.
+# Le résultat est gardé en mémoire entre les reruns et les sessions, tant que le dossier ne change pas.
 def load_knowledge_base_from_directory(directory_path):
-    content = []
-    directory = Path(directory_path)
     try:
-        for file_path in directory.iterdir():  # Parcours des fichiers dans le dossier
-            if file_path.suffix == ".docx":
-                content.append(load_text_from_word(file_path))
-            elif file_path.suffix == ".pdf":
-                content.append(load_text_from_pdf(file_path))
-            elif file_path.suffix == ".xlsx":
-                content.append(load_text_from_excel(file_path))
-            # elif file_path.suffix == ".html":
-            #     content.append(load_text_from_html(file_path))
-        return "\n".join(content)
+        fingerprint = directory_fingerprint(directory_path)
+        for name, error in load_documents(directory_path, fingerprint).errors:
+            st.warning(f"{name} ignoré — {error}")
+        return load_knowledge_base_text(directory_path, fingerprint)
     except Exception as e:
         st.error(f"Erreur lors du chargement des fichiers dans le dossier : {e}")
         return ""
 
-# Charger le contenu d'un fichier Word
-def load_text_from_word(file_path):
-    try:
-        doc = Document(file_path)
-        return "\n".join([paragraph.text.strip() for paragraph in doc.paragraphs if paragraph.text.strip()])
-    except Exception as e:
-        return f"Erreur lors de la lecture du fichier Word : {e}"
-
-# Charger le contenu d'un fichier PDF
-def load_text_from_pdf(file_path):
-    try:
-        pdf_reader = PyPDF2.PdfReader(file_path)
-        return "\n".join([page.extract_text() for page in pdf_reader.pages if page.extract_text()])
-    except Exception as e:
-        return f"Erreur lors de la lecture du fichier PDF : {e}"
-
-# Charger le contenu d'un fichier Excel
-def load_text_from_excel(file_path):
-    try:
-        df = pd.read_excel(file_path)
-        return df.to_string(index=False)
-    except Exception as e:
-        return f"Erreur lors de la lecture du fichier Excel : {e}"
+# Documents de la base dont la fin n'a pas été envoyée au modèle : ceux qui dépassent les
+# kept_tokens premiers tokens de la base (documents dans l'ordre de load_knowledge_base_text)
+def truncated_documents(documents, kept_tokens):
+    names = []
+    used = 0
+    for name, text in documents:
+        used += count_text_tokens(text)
+        if used > kept_tokens:
+            names.append(name)
+    return names
 
 # Charger le contenu d'un fichier HTML
 def load_text_from_html(file_path):
@@ -60,58 +45,33 @@ def load_text_from_html(file_path):
     except Exception as e:
         return f"Erreur lors de la lecture du fichier HTML : {e}"
 
-# Fonction pour convertir un PDF en texte avec PyMuPDF et EasyOCR
-def extract_text_from_pdf_with_fitz(pdf_file):
-    try:
-        with tempfile.TemporaryDirectory() as image_output_dir:  # Crée un dossier temporaire
-            pdf = fitz.open(pdf_file)
-            image_files = []
-
-            for page_num in range(pdf.page_count):
-                page = pdf[page_num]
-                pix = page.get_pixmap(matrix=fitz.Matrix(2, 2), alpha=False)
-                image_path = Path(image_output_dir) / f"page_{page_num + 1}.png"
-                pix.save(image_path)
-                image_files.append(image_path)
-
-            pdf.close()
-
-            # Utiliser EasyOCR pour extraire le texte
-            reader = easyocr.Reader(["fr"])
-            text_output = []
-            for image_path in image_files:
-                text = reader.readtext(str(image_path), detail=0, paragraph=True)
-                text_output.append(" ".join(text))
-
-            return "\n".join(text_output)
-    except Exception as e:
-        return f"Erreur lors de l'extraction du texte : {e}"
+# Consigne donnée au modèle
+SYSTEM_PROMPT = "Vous êtes un assistant virtuel pour une mutuelle utilisant une base de connaissances issue de plusieurs documents. Si vous ne trouvez pas la réponse adéquate, formulez poliment une réponse. Vous devez parler comme si vous parliez à une personne humaine. Egalement l'idéale serait de demander à la personne si elle n'est pas encore adhérente chez nous et si non alors lui proposer un contrat en fonction de ses besoins. Pour ce faire, il faudra que vous détectiez les besoins de la personne et que vous lui proposiez la formule qui lui convient le mieux."
+
+# Clé API OpenAI (variable d'environnement OPENAI_API_KEY, sinon la valeur ci-dessous)
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", 'Clé_api')
 
 # Fonction pour interroger OpenAI avec une base de connaissances, l'historique, et du texte complémentaire
 def query_openai_with_context(knowledge_base_text, conversation_history, user_input, supplemental_text=""):
-    openai.api_key = 'Clé_api'
     try:
-        messages = [
-            {"role": "system", "content": "Vous êtes un assistant virtuel pour une mutuelle utilisant une base de connaissances issue de plusieurs documents. Si vous ne trouvez pas la réponse adéquate, formulez poliment une réponse. Vous devez parler comme si vous parliez à une personne humaine. Egalement l'idéale serait de demander à la personne si elle n'est pas encore adhérente chez nous et si non alors lui proposer un contrat en fonction de ses besoins. Pour ce faire, il faudra que vous détectiez les besoins de la personne et que vous lui proposiez la formule qui lui convient le mieux."},
-            {"role": "system", "content": f"Base de connaissances :\n{knowledge_base_text}"}
-        ]
-        messages.extend(conversation_history)
-
-        if supplemental_text:
-            user_input = f"{user_input}\n\nInformations supplémentaires issues du PDF :\n{supplemental_text}"
-
-        messages.append({"role": "user", "content": user_input})
-
-        response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            temperature=0,
-            max_tokens=500
-        )
-        return response['choices'][0]['message']['content']
+        # Prompt assemblé dans le budget de tokens : les échanges les plus anciens sont résumés
+        # La base complète est la même à chaque appel : elle fait partie du début fixe du prompt
+        prompt = build_prompt(SYSTEM_PROMPT, knowledge_base_text, conversation_history, user_input, supplemental_text,
+                              static_knowledge=True)
+        if prompt.breakdown["knowledge_truncated"]:
+            get_logger().warning("Base de connaissances tronquée : %s tokens non envoyés au modèle",
+                                 prompt.breakdown["knowledge_truncated"])
+        tracker = st.session_state.setdefault("prefix_tracker", PrefixTracker(max_keys=1))
+        prompt.breakdown["shared_prefix"] = tracker.observe("conversation", prompt.messages)
+        st.session_state.last_prompt_tokens = prompt.breakdown
+
+        return get_llm_client().chat(prompt.messages, api_key=OPENAI_API_KEY, temperature=0, max_tokens=500)
     except Exception as e:
         return f"Erreur lors de la requête OpenAI : {e}"
 
+# Préchauffage des dépendances lourdes en arrière-plan (ASSISTANT_WARMUP)
+start_warmup()
+
 # Interface utilisateur Streamlit
 st.title("Nostrum AI")
 
@@ -152,6 +112,17 @@ for message in st.session_state.conversation_history:
             unsafe_allow_html=True,
         )
 
+# Répartition des tokens du dernier prompt envoyé, et documents coupés si la base dépasse
+# la limite de la base fixe (ASSISTANT_PROMPT_STATIC_KNOWLEDGE_MAX_TOKENS)
+if "last_prompt_tokens" in st.session_state:
+    breakdown = st.session_state.last_prompt_tokens
+    st.caption(f"Tokens du dernier prompt : {breakdown}")
+    if breakdown.get("knowledge_truncated"):
+        documents = load_documents(directory_path, directory_fingerprint(directory_path)).documents
+        kept_tokens = breakdown["knowledge"] - count_text_tokens(KNOWLEDGE_HEADER)
+        st.warning(f"Base de connaissances trop longue : {breakdown['knowledge_truncated']} tokens non envoyés au modèle "
+                   f"(documents coupés : {', '.join(truncated_documents(documents, kept_tokens))}).")
+
 # Section pour poser une question (champ en bas de la page)
 st.write("---")
 user_input = st.text_area(
@@ -166,9 +137,13 @@ uploaded_pdf = st.file_uploader("Téléchargez un fichier PDF pour complémenter
 
 supplemental_text = ""
 if uploaded_pdf:
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_pdf:
-        temp_pdf.write(uploaded_pdf.getbuffer())
-        supplemental_text = extract_text_from_pdf_with_fitz(temp_pdf.name)
+    # Couche texte en priorité, OCR uniquement pour les pages scannées ;
+    # le résultat est gardé en cache par empreinte du fichier
+    try:
+        supplemental_text, methods = extract_uploaded_pdf(upload_digest(uploaded_pdf), uploaded_pdf.getvalue())
+        st.caption(f"Pages lues : {methods}")
+    except Exception as e:
+        st.warning(str(e))
 
 if st.button("Envoyer"):
     if not knowledge_base:
@@ -177,7 +152,6 @@ if st.button("Envoyer"):
         st.warning("Veuillez entrer une question avant d'envoyer.")
     else:
         response = query_openai_with_context(knowledge_base, st.session_state.conversation_history, user_input, supplemental_text)
-        # response = query_openai_with_context(knowledge_base, st.session_state.conversation_history, user_input)
 
         if response:
             st.session_state.conversation_history.append({"role": "user", "content": user_input})
@@ -1,74 +1,33 @@
 import os
+import sys
 import streamlit as st
-from docx import Document
-import pandas as pd
-import PyPDF2
-import openai
-import fitz  # PyMuPDF
-import easyocr
 from pathlib import Path
-import tempfile
 
-# Fonction pour charger une base de connaissances depuis différents fichiers
-def load_knowledge_base_from_directory(directory_path):
-    content = []
-    directory = Path(directory_path)
-    try:
-        for file_path in directory.iterdir():  # Parcours des fichiers dans le dossier
-            if file_path.suffix == ".docx":
-                content.append(load_text_from_word(file_path))
-            elif file_path.suffix == ".pdf":
-                content.append(load_text_from_pdf(file_path))
-            elif file_path.suffix == ".xlsx":
-                content.append(load_text_from_excel(file_path))
-        return "\n".join(content)
-    except Exception as e:
-        st.error(f"Erreur lors du chargement des fichiers dans le dossier : {e}")
-        return ""
-
-# Fonction pour rechercher un fichier de devis dans un dossier spécifique
-def find_devis_file(directory_path):
-    """
-    Recherche un fichier contenant "devis" dans son nom dans le dossier spécifié.
-    Retourne le chemin du premier fichier trouvé.
-    """
-    directory = Path(directory_path)
-    try:
-        for file_path in directory.iterdir():
-            if "devis" in file_path.name.lower() and file_path.suffix in [".pdf", ".docx"]:
-                return file_path  # Retourne le fichier devis trouvé
-    except Exception as e:
-        st.error(f"Erreur lors de la recherche du devis : {e}")
-    return None  # Aucun devis trouvé
-
-# Fonction pour charger du texte depuis différents types de fichiers
-def load_text_from_word(file_path):
-    try:
-        doc = Document(file_path)
-        return "\n".join([paragraph.text.strip() for paragraph in doc.paragraphs if paragraph.text.strip()])
-    except Exception as e:
-        return f"Erreur lors de la lecture du fichier Word : {e}"
+# Rendre le paquet commun importable depuis ce dossier
+sys.path.append(str(Path(__file__).resolve().parent.parent))
 
-def load_text_from_pdf(file_path):
-    try:
-        pdf_reader = PyPDF2.PdfReader(file_path)
-        return "\n".join([page.extract_text() for page in pdf_reader.pages if page.extract_text()])
-    except Exception as e:
-        return f"Erreur lors de la lecture du fichier PDF : {e}"
+from commun.config import CATALOGUE_DIRECTORY
+from commun.llm_client import get_llm_client
+from commun.prompt import PrefixTracker, build_prompt
+from cached_resources import (
+    directory_fingerprint, extract_uploaded_pdf, load_catalogue, load_documents, load_knowledge_index, start_warmup,
+    upload_digest,
+)
 
-def load_text_from_excel(file_path):
+# Fonction pour charger la base de connaissances et son index de recherche.
+# L'index est gardé en mémoire entre les reruns et les sessions, tant que le dossier ne change pas.
+def load_knowledge_index_from_directory(directory_path):
     try:
-        df = pd.read_excel(file_path)
-        return df.to_string(index=False)
+        fingerprint = directory_fingerprint(directory_path)
+        for name, error in load_documents(directory_path, fingerprint).errors:
+            st.warning(f"{name} ignoré — {error}")
+        return load_knowledge_index(directory_path, fingerprint)
     except Exception as e:
-        return f"Erreur lors de la lecture du fichier Excel : {e}"
+        st.error(f"Erreur lors du chargement des fichiers dans le dossier : {e}")
+        return None
 
-# Fonction pour interroger OpenAI
-def query_openai_with_context(knowledge_base_text, conversation_history, user_input, supplemental_text=""):
-    openai.api_key = 'sk-svcacct-7ukQJPT9_hwKV-zquafuAdPoD2PPTTsbbjkTlOEWW5VNto-hwhAfpHaSLxa1WT3BlbkFJdnxqtkbpu5ow6NW5M2eCaF9vc48_fvTKUtORxAER5QeHL6XrRTX7qgTBVVKAA'  # Remplace par ta clé API
-    try:
-        messages = [
-            {"role": "system", "content": """Vous êtes un assistant virtuel conçu pour une mutuelle qui 
+# Consigne donnée au modèle
+SYSTEM_PROMPT = """Vous êtes un assistant virtuel conçu pour une mutuelle qui 
             a pour nom Nostrum Care, utilisant une base de connaissances issue de plusieurs documents. Votre rôle principal est de 
             répondre de manière claire et utile aux questions des utilisateurs, en vous basant sur les 
             informations disponibles. Si vous ne trouvez pas la réponse adéquate, formulez une réponse 
@@ -96,27 +55,27 @@ def query_openai_with_context(knowledge_base_text, conversation_history, user_in
             Si ont te demande un devis envoie lui le document présent dans le dossier qui s'appel fichier 
              
             De plus lorsque tu devra partager le numéro de téléphone c'est celui-ci : 01 62 45 01 05 (appel gratuit)
-            et s'il faut faire un devis sur le site c'est ce lien qu'il faut partager : https://app.nostrumcare.fr/nostrum-vita"""},
-            {"role": "system", "content": f"Base de connaissances :\n{knowledge_base_text}"}
-        ]
+            et s'il faut faire un devis sur le site c'est ce lien qu'il faut partager : https://app.nostrumcare.fr/nostrum-vita"""
 
-        messages.extend(conversation_history)
+# Clé API OpenAI (variable d'environnement OPENAI_API_KEY, sinon la valeur ci-dessous)
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", 'Clé_api')
 
-        if supplemental_text:
-            user_input = f"{user_input}\n\nInformations supplémentaires issues du PDF :\n{supplemental_text}"
-
-        messages.append({"role": "user", "content": user_input})
+# Fonction pour interroger OpenAI
+def query_openai_with_context(knowledge_base_text, conversation_history, user_input, supplemental_text=""):
+    try:
+        # Prompt assemblé dans le budget de tokens : les échanges les plus anciens sont résumés
+        prompt = build_prompt(SYSTEM_PROMPT, knowledge_base_text, conversation_history, user_input, supplemental_text)
+        tracker = st.session_state.setdefault("prefix_tracker", PrefixTracker(max_keys=1))
+        prompt.breakdown["shared_prefix"] = tracker.observe("conversation", prompt.messages)
+        st.session_state.last_prompt_tokens = prompt.breakdown
 
-        response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            temperature=0,
-            max_tokens=500
-        )
-        return response['choices'][0]['message']['content']
+        return get_llm_client().chat(prompt.messages, api_key=OPENAI_API_KEY, temperature=0, max_tokens=500)
     except Exception as e:
         return f"Erreur lors de la requête OpenAI : {e}"
 
+# Préchauffage des dépendances lourdes en arrière-plan (ASSISTANT_WARMUP)
+start_warmup()
+
 # Interface utilisateur Streamlit
 st.title("Nostrum AI")
 
@@ -124,8 +83,8 @@ st.title("Nostrum AI")
 directory_path = Path("./Chatgpt/streamlit/contexte")
 
 # Charger la base de connaissances
-knowledge_base = load_knowledge_base_from_directory(directory_path)
-if knowledge_base:
+knowledge_index = load_knowledge_index_from_directory(directory_path)
+if knowledge_index is not None and knowledge_index.chunks:
     st.success("Base de connaissances chargée avec succès.")
 else:
     st.error("Erreur lors du chargement des documents dans le dossier.")
@@ -148,6 +107,10 @@ for message in st.session_state.conversation_history:
         unsafe_allow_html=True,
     )
 
+# Répartition des tokens du dernier prompt envoyé
+if "last_prompt_tokens" in st.session_state:
+    st.caption(f"Tokens du dernier prompt : {st.session_state.last_prompt_tokens}")
+
 # Section de saisie utilisateur
 st.write("---")
 user_input = st.text_area(
@@ -162,36 +125,42 @@ uploaded_pdf = st.file_uploader("Téléchargez un fichier PDF pour complémenter
 
 supplemental_text = ""
 if uploaded_pdf:
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_pdf:
-        temp_pdf.write(uploaded_pdf.getbuffer())
-        supplemental_text = load_text_from_pdf(temp_pdf.name)
+    # Le fichier téléversé est lu directement en mémoire : couche texte en priorité,
+    # OCR uniquement pour les pages scannées ; le résultat est gardé en cache par empreinte du fichier
+    try:
+        supplemental_text, methods = extract_uploaded_pdf(upload_digest(uploaded_pdf), uploaded_pdf.getvalue())
+        st.caption(f"Pages lues : {methods}")
+    except Exception as e:
+        st.warning(str(e))
 
 # Vérification de la demande de devis et envoi du fichier s'il existe
 if st.button("Envoyer"):
-    if not knowledge_base:
+    if knowledge_index is None or not knowledge_index.chunks:
         st.warning("La base de connaissances n'a pas été chargée correctement.")
     elif not user_input.strip():
         st.warning("Veuillez entrer une question avant d'envoyer.")
     else:
         # Vérifier si l'utilisateur demande un devis
         if "devis" in user_input.lower():
-            devis_file = find_devis_file("./Chatgpt/streamlit/fichier/")  # Recherche dans le dossier "fichier"
-            
+            # Devis recherché dans le catalogue du dossier "fichier", gardé en mémoire
+            devis_file = load_catalogue(CATALOGUE_DIRECTORY).find("devis")
+
             if devis_file:
-                with open(devis_file, "rb") as file:
-                    st.download_button(
-                        label="📄 Télécharger votre devis",
-                        data=file,
-                        file_name=devis_file.name,
-                        mime="application/pdf" if devis_file.suffix == ".pdf" else "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                    )
+                st.download_button(
+                    label="📄 Télécharger votre devis",
+                    data=devis_file.content,
+                    file_name=devis_file.name,
+                    mime=devis_file.mime,
+                )
                 st.success("Un devis a été trouvé et est disponible en téléchargement !")
             else:
                 st.warning("Aucun devis trouvé dans le dossier. Veuillez contacter le service client.")
 
         else:
             # L'utilisateur ne demande pas de devis, donc on interroge OpenAI
-            response = query_openai_with_context(knowledge_base, st.session_state.conversation_history, user_input, supplemental_text)
+            # avec les seuls passages de la base utiles à la question
+            knowledge_context = knowledge_index.build_context(user_input)
+            response = query_openai_with_context(knowledge_context, st.session_state.conversation_history, user_input, supplemental_text)
 
             if response:
                 st.session_state.conversation_history.append({"role": "user", "content": user_input})
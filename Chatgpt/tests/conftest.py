@@ -0,0 +1,159 @@
+import json
+import os
+import re
+import sys
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+# Réglages lus à l'import des modules : pas de cache sur disque, pas de surveillance des dossiers
+os.environ["ASSISTANT_DOCUMENT_CACHE"] = ""
+os.environ["ASSISTANT_KNOWLEDGE_WATCH_SECONDS"] = "0"
+os.environ["ASSISTANT_CATALOGUE_WATCH_SECONDS"] = "0"
+os.environ["ASSISTANT_SESSION_BACKEND"] = "memory"
+os.environ.setdefault("OPENAI_API_KEY", "cle-de-test")
+
+# Rendre le paquet commun et l'API importables depuis les tests
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+sys.path.append(str(ROOT / "api_AI"))
+
+from commun import tokens
+from commun.llm_client import CircuitBreaker, LLMClient, TokenBucket
+
+# Encodeur de test qui remplace celui de tiktoken (dont l'encodage se télécharge au premier usage) :
+# un token par mot ou signe, blancs qui précèdent compris, si bien que decode(encode(texte)) == texte
+class WordEncoding:
+    PIECES = re.compile(r"\s*\w+|\s*[^\w\s]|\s+")
+
+    def __init__(self):
+        self.vocabulary = {}
+        self.pieces = []
+        self._lock = threading.Lock()
+
+    def encode(self, text, disallowed_special=()):
+        ids = []
+        with self._lock:
+            for piece in self.PIECES.findall(text):
+                if piece not in self.vocabulary:
+                    self.vocabulary[piece] = len(self.pieces)
+                    self.pieces.append(piece)
+                ids.append(self.vocabulary[piece])
+        return ids
+
+    def decode(self, ids):
+        return "".join(self.pieces[token] for token in ids)
+
+# Les tests n'ont pas besoin du réseau : les tokens sont comptés avec WordEncoding
+@pytest.fixture(autouse=True, scope="session")
+def word_encoding():
+    encoding = WordEncoding()
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(tokens, "get_encoding", lambda model=None: encoding)
+        yield encoding
+
+# Réponse scriptée du serveur simulé : code HTTP, morceaux de la réponse et en-têtes
+class StubReply:
+    def __init__(self, status=200, chunks=("Bonjour", " !"), headers=None):
+        self.status = status
+        self.chunks = list(chunks)
+        self.headers = headers or {}
+
+# Serveur local qui imite /v1/chat/completions d'OpenAI (réponse complète ou flux SSE).
+# Les réponses sont prises dans l'ordre dans replies ; une fois la liste vide, chaque appel
+# reçoit StubReply(). requests garde le corps JSON de chaque appel reçu.
+class CompletionStub:
+    def __init__(self):
+        self.replies = deque()
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stub.requests.append(body)
+                reply = stub.replies.popleft() if stub.replies else StubReply()
+                if reply.status != 200:
+                    payload = json.dumps({"error": {"message": f"Erreur simulée {reply.status}", "type": "server_error"}})
+                    self._send(reply.status, "application/json", payload.encode("utf-8"), reply.headers)
+                    return
+                if body.get("stream"):
+                    events = [
+                        f"data: {json.dumps({'choices': [{'index': 0, 'delta': {'content': chunk}}]})}\n\n"
+                        for chunk in reply.chunks
+                    ]
+                    events.append("data: [DONE]\n\n")
+                    self._send(200, "text/event-stream", "".join(events).encode("utf-8"), reply.headers)
+                    return
+                payload = {
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(reply.chunks)}}],
+                    "usage": {"prompt_tokens": 10, "completion_tokens": len(reply.chunks)},
+                }
+                self._send(200, "application/json", json.dumps(payload).encode("utf-8"), reply.headers)
+
+            def _send(self, status, content_type, data, headers):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def completion_stub():
+    stub = CompletionStub()
+    yield stub
+    stub.close()
+
+# Client du modèle branché sur le serveur simulé : sans limite de débit ni attente entre les essais
+@pytest.fixture
+def stub_client(completion_stub):
+    return LLMClient(
+        api_base=completion_stub.url, timeout=5, max_retries=2, backoff_seconds=0, backoff_max_seconds=0,
+        rate_limiter=TokenBucket(rate=0), breaker=CircuitBreaker(failure_threshold=3, reset_seconds=60),
+    )
+
+# API dont la base de connaissances est un petit document Word et dont le client du modèle
+# est branché sur le serveur simulé
+@pytest.fixture
+def api(tmp_path, stub_client):
+    from docx import Document
+    from fastapi.testclient import TestClient
+
+    import api_assistant
+    from commun.answer_cache import AnswerCache
+    from commun.knowledge_base import KnowledgeBase
+    from commun.sessions import create_session_store
+
+    document = Document()
+    document.add_paragraph("Les soins dentaires sont remboursés à 100 % du tarif de convention.")
+    document.add_paragraph("Le devis dentaire doit être envoyé avant le début des soins.")
+    document.save(tmp_path / "garanties.docx")
+
+    previous = (api_assistant.knowledge_base, api_assistant.llm_client, api_assistant.answer_cache,
+                api_assistant.session_store)
+    api_assistant.knowledge_base = KnowledgeBase(tmp_path)
+    api_assistant.llm_client = stub_client
+    api_assistant.answer_cache = AnswerCache()
+    api_assistant.session_store = create_session_store()
+    with TestClient(api_assistant.app) as client:
+        # Base chargée au démarrage, sans accès au réseau
+        assert api_assistant.knowledge_base.index.chunks
+        yield client
+    (api_assistant.knowledge_base, api_assistant.llm_client, api_assistant.answer_cache,
+     api_assistant.session_store) = previous
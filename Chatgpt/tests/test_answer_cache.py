@@ -0,0 +1,51 @@
+import pytest
+
+from commun.answer_cache import AnswerCache
+
+GOLD_QUESTION = ("Quel est le remboursement de la formule gold pour les soins dentaires "
+                 "d'un enfant de moins de 12 ans ?")
+GOLD_ANSWER = "La formule gold rembourse 300 % du tarif de convention."
+
+# Questions qui ne diffèrent de GOLD_QUESTION que par un mot décisif : leur réponse n'est pas la même
+NEAR_MISSES = [
+    "Quel est le remboursement de la formule bronze pour les soins dentaires d'un enfant de moins de 12 ans ?",
+    "Quel est le remboursement de la formule gold pour les soins dentaires d'un enfant de moins de 16 ans ?",
+    "Quel est le remboursement de la formule gold pour les soins optiques d'un enfant de moins de 12 ans ?",
+    "Quel est le remboursement de la formule gold pour les soins dentaires d'un adulte de moins de 12 ans ?",
+    "Quel n'est pas le remboursement de la formule gold pour les soins dentaires d'un enfant de moins de 12 ans ?",
+]
+
+def cache_with_gold(similarity_threshold):
+    cache = AnswerCache(similarity_threshold=similarity_threshold)
+    cache.put(GOLD_QUESTION, "v1", GOLD_ANSWER)
+    return cache
+
+def test_similar_tier_is_off_by_default():
+    cache = AnswerCache()
+    cache.put(GOLD_QUESTION, "v1", GOLD_ANSWER)
+
+    assert cache.similarity_threshold == 0
+    assert cache.get("Pour les soins dentaires d'un enfant de moins de 12 ans, quel est le remboursement "
+                     "de la formule gold ?", "v1") is None
+    assert cache.get("  quel est le REMBOURSEMENT de la formule gold pour les soins dentaires d’un enfant "
+                     "de moins de 12 ans", "v1") == (GOLD_ANSWER, "exact")
+
+@pytest.mark.parametrize("question", NEAR_MISSES)
+def test_similar_tier_misses_when_a_decisive_word_differs(question):
+    cache = cache_with_gold(0.5)
+
+    assert cache.get(question, "v1") is None
+    assert cache.stats()["similar_hits"] == 0
+
+def test_similar_tier_matches_the_same_words_in_another_order():
+    cache = cache_with_gold(0.9)
+
+    question = ("Pour les soins dentaires d'un enfant de moins de 12 ans, quel est le remboursement "
+                "de la formule gold ?")
+    assert cache.get(question, "v1") == (GOLD_ANSWER, "similar")
+
+def test_cache_is_emptied_when_the_knowledge_base_changes():
+    cache = cache_with_gold(0.9)
+
+    assert cache.get(GOLD_QUESTION, "v2") is None
+    assert cache.stats()["invalidations"] == 1
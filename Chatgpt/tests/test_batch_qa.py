@@ -0,0 +1,24 @@
+import json
+import sys
+
+from conftest import ROOT
+
+sys.path.append(str(ROOT / "benchmarks"))
+
+from batch_qa import prepare_resume
+
+def test_resume_keeps_answers_and_drops_failures_and_partial_line(tmp_path):
+    output = tmp_path / "reponses.jsonl"
+    output.write_text(
+        json.dumps({"id": "1", "answer": "Oui.", "error": None}) + "\n"
+        + json.dumps({"id": "2", "answer": None, "error": "Erreur lors de la requête OpenAI : 503"}) + "\n"
+        + json.dumps({"id": "3", "answer": "Non.", "error": None}) + "\n"
+        + '{"id": "4", "answer": "Interr',
+        encoding="utf-8",
+    )
+
+    done = prepare_resume(output)
+
+    assert done == {"1", "3"}
+    assert [json.loads(line)["id"] for line in output.read_text(encoding="utf-8").splitlines()] == ["1", "3"]
+    assert output.read_text(encoding="utf-8").endswith("\n")
@@ -0,0 +1,29 @@
+import pytest
+from docx import Document
+
+from commun import cleaning
+from commun.knowledge_base import KnowledgeBase
+
+# Tokenizer indisponible (encodage tiktoken non téléchargé, par exemple)
+@pytest.fixture
+def broken_tokenizer(monkeypatch):
+    def count_text_tokens(text):
+        raise OSError("encodage o200k_base introuvable")
+
+    monkeypatch.setattr(cleaning, "count_text_tokens", count_text_tokens)
+    monkeypatch.setattr(cleaning, "_tokenizer_unavailable", False)
+
+def test_refresh_does_not_need_the_tokenizer(tmp_path, broken_tokenizer):
+    document = Document()
+    document.add_paragraph("Les soins dentaires sont remboursés à 100 % du tarif de convention.")
+    document.save(tmp_path / "garanties.docx")
+
+    knowledge_base = KnowledgeBase(tmp_path)
+    changes = knowledge_base.refresh()
+
+    assert changes["errors"] == {}
+    assert len(knowledge_base.index.chunks) == 1
+    report = knowledge_base.snapshot.reports()["garanties.docx"]
+    # Tailles estimées d'après le nombre de caractères
+    assert report.tokens_before > 0
+    assert report.tokens_saved == 0
@@ -0,0 +1,105 @@
+import asyncio
+import threading
+
+import api_assistant
+from conftest import StubReply
+
+from commun.llm_client import ConcurrencyLimit, LLMClient, TokenBucket
+
+QUESTION = {"id": "session-1", "message": "Comment sont remboursés les soins dentaires ?"}
+
+def test_chat_retries_on_rate_limit(stub_client, completion_stub):
+    completion_stub.replies.append(StubReply(status=429))
+    completion_stub.replies.append(StubReply(chunks=["Remboursés à 100 %."]))
+
+    response = stub_client.chat([{"role": "user", "content": "Bonjour"}])
+
+    assert response == "Remboursés à 100 %."
+    assert len(completion_stub.requests) == 2
+    assert stub_client.stats()["retries"] == 1
+    assert stub_client.breaker.state == "closed"
+
+def test_chat_retries_on_server_error(stub_client, completion_stub):
+    completion_stub.replies.extend([StubReply(status=500), StubReply(status=503), StubReply(chunks=["Oui."])])
+
+    assert stub_client.chat([{"role": "user", "content": "Bonjour"}]) == "Oui."
+    assert len(completion_stub.requests) == 3
+    assert stub_client.stats()["retries"] == 2
+
+def test_query_returns_503_when_retries_run_out(api, completion_stub):
+    completion_stub.replies.extend(StubReply(status=500) for _ in range(3))
+
+    response = api.post("/query", data=QUESTION)
+
+    assert response.status_code == 503
+    assert int(response.headers["retry-after"]) >= 1
+    assert response.json()["detail"].startswith("Erreur lors de la requête OpenAI")
+    # Essai initial puis deux nouvelles tentatives (max_retries=2)
+    assert len(completion_stub.requests) == 3
+
+    # L'erreur n'a été ni mise en cache ni gardée dans la session
+    api_assistant.llm_client.breaker.record_success()
+    completion_stub.replies.append(StubReply(chunks=["Remboursés à 100 %."]))
+    response = api.post("/query", data=QUESTION)
+    assert response.status_code == 200
+    assert response.json()["cache"] == "miss"
+    assert api_assistant.session_store.get_history("session-1") == [
+        {"role": "user", "content": QUESTION["message"]},
+        {"role": "assistant", "content": "Remboursés à 100 %."},
+    ]
+
+def test_query_returns_503_while_the_breaker_is_open(api, completion_stub):
+    breaker = api_assistant.llm_client.breaker
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+    response = api.post("/query", data=QUESTION)
+
+    assert response.status_code == 503
+    # Fin de la coupure du disjoncteur (reset_seconds=60)
+    assert 55 <= int(response.headers["retry-after"]) <= 60
+    assert completion_stub.requests == []
+    assert api_assistant.llm_client.stats()["rejected"] == 1
+
+def test_sync_and_async_calls_share_one_limit():
+    limit = ConcurrencyLimit(1, poll_seconds=0.001)
+    held = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with limit:
+            held.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    held.wait(5)
+
+    async def enter():
+        async with limit:
+            return limit.active
+
+    async def scenario():
+        task = asyncio.ensure_future(enter())
+        await asyncio.sleep(0.05)
+        # L'appel en flux attend que l'appel synchrone libère sa place
+        assert not task.done()
+        release.set()
+        return await task
+
+    assert asyncio.run(scenario()) == 1
+    thread.join()
+    assert limit.active == 0
+
+def test_each_client_sends_its_calls_through_its_own_session(stub_client, completion_stub, monkeypatch):
+    calls = []
+    request = stub_client.session.request
+    monkeypatch.setattr(stub_client.session, "request", lambda *args, **kwargs: calls.append(args) or request(*args, **kwargs))
+
+    # Un client construit après coup ne prend pas la place du premier
+    other = LLMClient(api_base=completion_stub.url, rate_limiter=TokenBucket(rate=0))
+    stub_client.chat([{"role": "user", "content": "Bonjour"}])
+
+    assert len(calls) == 1
+    assert len(completion_stub.requests) == 1
+    other.session.close()
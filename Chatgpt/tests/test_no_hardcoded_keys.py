@@ -0,0 +1,17 @@
+import re
+from pathlib import Path
+
+# Clé d'API OpenAI écrite en clair (sk-..., sk-proj-..., sk-svcacct-...)
+API_KEY = re.compile(r"sk-[A-Za-z0-9_-]{20,}")
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Les clés se lisent dans OPENAI_API_KEY : aucune ne doit figurer dans le code ou la configuration
+def test_no_api_key_in_sources():
+    leaks = [
+        str(path.relative_to(ROOT))
+        for path in ROOT.rglob("*")
+        if path.suffix in (".py", ".txt", ".toml", ".cfg", ".env", ".json") and path.is_file()
+        and API_KEY.search(path.read_text(encoding="utf-8", errors="ignore"))
+    ]
+    assert leaks == []
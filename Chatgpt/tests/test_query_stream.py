@@ -0,0 +1,61 @@
+import json
+
+from conftest import StubReply
+
+# Découper le corps d'une réponse SSE en événements (nom, données) ; "message" par défaut
+def parse_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        name = "message"
+        data = None
+        for line in block.split("\n"):
+            if line.startswith("event: "):
+                name = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+        events.append((name, data))
+    return events
+
+def test_stream_sends_chunks_then_end(api, completion_stub):
+    completion_stub.replies.append(StubReply(chunks=["Les soins", " dentaires", " sont remboursés."]))
+
+    response = api.post("/query/stream", data={"id": "session-1", "message": "Comment sont remboursés les soins dentaires ?"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_events(response.text)
+    assert events[:-1] == [
+        ("message", {"delta": "Les soins"}),
+        ("message", {"delta": " dentaires"}),
+        ("message", {"delta": " sont remboursés."}),
+    ]
+    name, end = events[-1]
+    assert name == "end"
+    assert end["id"] == "session-1"
+    assert end["cache"] == "miss"
+    assert end["tokens"]["total"] > 0
+    assert completion_stub.requests[0]["stream"] is True
+
+def test_stream_saves_the_answer_in_the_session(api, completion_stub):
+    completion_stub.replies.append(StubReply(chunks=["Avant", " les soins."]))
+    api.post("/query/stream", data={"id": "session-2", "message": "Quand envoyer le devis ?"})
+
+    completion_stub.replies.append(StubReply(chunks=["Oui."]))
+    events = parse_events(api.post("/query/stream", data={"id": "session-2", "message": "Par courrier ?"}).text)
+
+    assert events[-1][0] == "end"
+    assert events[-1][1]["cache"] == "bypass"
+    sent = completion_stub.requests[-1]["messages"]
+    assert {"role": "assistant", "content": "Avant les soins."} in sent
+
+def test_stream_sends_error_event_when_upstream_fails(api, completion_stub):
+    completion_stub.replies.extend(StubReply(status=500) for _ in range(3))
+
+    response = api.post("/query/stream", data={"id": "session-3", "message": "Quel est le délai de remboursement ?"})
+
+    assert response.status_code == 200
+    events = parse_events(response.text)
+    assert [name for name, _ in events] == ["error"]
+    assert events[0][1]["error"].startswith("Erreur lors de la requête OpenAI")
+    # Essai initial puis deux nouvelles tentatives (max_retries=2)
+    assert len(completion_stub.requests) == 3
@@ -0,0 +1,30 @@
+import pandas as pd
+
+from commun.retrieval import KnowledgeIndex, split_document
+from commun.spreadsheets import SheetRow, read_rows_from_excel, read_text_from_excel
+
+def write_workbook(path):
+    table = pd.DataFrame({
+        "Acte": ["HBLD036 Couronne", "HBLD040 Inlay", None, "HBMD001 Bilan"],
+        "Formule": ["Gold", "Bronze", "Gold", None],
+        "Montant": [300, 120, 150, None],
+    })
+    table.to_excel(path, index=False)
+
+def test_rows_with_only_a_key_are_kept(tmp_path):
+    path = tmp_path / "actes.xlsx"
+    write_workbook(path)
+
+    rows = [item for item in read_rows_from_excel(path) if isinstance(item, SheetRow)]
+
+    assert [row.key for row in rows] == ["HBLD036 Couronne", "HBLD040 Inlay", "HBLD040 Inlay", "HBMD001 Bilan"]
+    assert rows[2].fields == {"Formule": "Gold", "Montant": "150"}
+    assert rows[3].fields == {}
+
+def test_key_only_row_is_found_by_keyed_lookup(tmp_path):
+    path = tmp_path / "actes.xlsx"
+    write_workbook(path)
+
+    index = KnowledgeIndex(list(split_document("actes.xlsx", read_text_from_excel(path), 1200)))
+
+    assert any(chunk.key == "HBMD001 Bilan" for chunk in index.lookup("HBMD001 Bilan"))